@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time spent decoding archived datasets one by one with BLNETParser
+compared with decoding them at once with the NumPy batch decoder
+
+Run from the repository root: python -m benchmarks.bench_batch
+"""
+
+import argparse
+import random
+import time
+
+from pyblnet.blnet_batch import decode_datasets
+from pyblnet.blnet_parser import BLNETParser
+from tests.test_structure.blnet_direct_mock_server import random_dataset
+
+
+def bench(decode, argument):
+    start = time.perf_counter()
+    decode(argument)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    rnd = random.Random(1611)
+    records = [random_dataset(rnd) for _ in range(args.records)]
+    buffer = b"".join(records)
+    # build the lookup tables before measuring
+    decode_datasets(records[0])
+
+    results = {
+        "parser": bench(lambda data: [BLNETParser(r) for r in data], records),
+        "batch": bench(decode_datasets, buffer),
+    }
+    for name, duration in results.items():
+        print(
+            "{:6}  {:8.3f} s  {:8.3f} us per record".format(
+                name, duration, duration / args.records * 1e6
+            )
+        )
+    print("speedup {:.1f}x".format(results["parser"] / results["batch"]))
+
+
+if __name__ == "__main__":
+    main()
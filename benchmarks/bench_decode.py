@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Memory allocated and time spent per record when verifying and splitting
+READ_DATA responses, compared with the former decode path that copied every
+frame and unpacked the response into a tuple for the checksum
+
+Run from the repository root: python -m benchmarks.bench_decode
+"""
+
+import argparse
+import struct
+import time
+import tracemalloc
+
+from pyblnet.blnet_conn import BLNETProtocol, CAN_MODE, DATASET_SIZE
+from pyblnet.blnet_parser import BLNETParser
+from tests.test_structure.blnet_direct_mock_server import dataset
+
+
+class LegacyProtocol(BLNETProtocol):
+    """
+    Decode path before responses were handled as memoryviews
+    """
+
+    def _checksum(self, data):
+        binary = struct.unpack("<{}B".format(len(data)), data)
+        return sum(binary[:-1]) % 256 == binary[-1]
+
+    def _split_datasets(self, data):
+        data = bytes(data)
+        frames = {}
+        for frame in range(0, self._can_frames):
+            frames[frame] = BLNETParser(
+                data[3 + DATASET_SIZE * frame : 3 + DATASET_SIZE * (frame + 1)]
+            )
+        return {k: v.to_dict() for k, v in frames.items()}
+
+
+def response(frames):
+    data = b"\x00" * 3 + dataset() * frames
+    return memoryview(bytearray(data + bytes([sum(data) % 256])))
+
+
+def protocol(cls, frames):
+    instance = cls()
+    instance._mode = CAN_MODE
+    instance._can_frames = frames
+    return instance
+
+
+def decode(instance, data):
+    assert instance._checksum(data)
+    return instance._split_datasets(data)
+
+
+def bench(instance, data, records):
+    # peak memory of decoding a single record
+    tracemalloc.start()
+    decode(instance, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(records):
+        decode(instance, data)
+    return peak, (time.perf_counter() - start) / records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--frames", type=int, default=8)
+    args = parser.parse_args()
+
+    data = response(args.frames)
+    for name, cls in (("legacy", LegacyProtocol), ("memoryview", BLNETProtocol)):
+        peak, duration = bench(protocol(cls, args.frames), data, args.records)
+        print(
+            "{:10}  {:6} bytes peak per record  {:7.1f} us per record".format(
+                name, peak, duration * 1e6
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
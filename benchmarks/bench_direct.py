@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Latency of BLNETDirect.get_latest with and without a persistent connection,
+measured against the simulated bootloader of the tests
+
+Run from the repository root: python -m benchmarks.bench_direct
+"""
+
+import argparse
+import time
+
+from pyblnet import BLNETDirect
+from tests.test_structure.server_control import Server
+from tests.test_structure.blnet_direct_mock_server import (
+    BLNETDirectServer,
+    BLNETDirectRequestHandler,
+)
+
+ADDRESS = "localhost"
+
+
+def bench_get_latest(port, persistent, rounds):
+    with BLNETDirect(ADDRESS, port, timeout=10, persistent=persistent) as blnet:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            blnet.get_latest()
+        return (time.perf_counter() - start) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--frames", type=int, default=2)
+    parser.add_argument(
+        "--connect-delay",
+        type=float,
+        default=0.01,
+        help="seconds the simulated BL-Net needs to serve a new connection",
+    )
+    args = parser.parse_args()
+
+    server = BLNETDirectServer(
+        (ADDRESS, 0), BLNETDirectRequestHandler, frames=args.frames
+    )
+    server.connect_delay = args.connect_delay
+    control = Server(server)
+    control.start_server()
+    try:
+        results = {}
+        for persistent in (False, True):
+            server.connections = 0
+            latency = bench_get_latest(control.get_port(), persistent, args.rounds)
+            results[persistent] = latency
+            print(
+                "persistent={!s:5}  {:8.2f} ms per get_latest  {} connections".format(
+                    persistent, latency * 1000, server.connections
+                )
+            )
+        print(
+            "saved {:.2f} ms per get_latest".format(
+                (results[False] - results[True]) * 1000
+            )
+        )
+    finally:
+        control.stop_server()
+
+
+if __name__ == "__main__":
+    main()
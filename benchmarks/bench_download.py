@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput of downloading the bootloader memory with BLNETDirect
+for different batch sizes, measured against the simulated bootloader of the tests
+
+Run from the repository root: python -m benchmarks.bench_download
+"""
+
+import argparse
+import time
+
+from pyblnet import BLNETDirect
+from tests.test_structure.server_control import Server
+from tests.test_structure.blnet_direct_mock_server import (
+    BLNETDirectServer,
+    BLNETDirectRequestHandler,
+    dataset,
+)
+
+ADDRESS = "localhost"
+
+
+def bench_download(port, batch_size):
+    blnet = BLNETDirect(
+        ADDRESS, port, timeout=10, persistent=True, batch_size=batch_size
+    )
+    with blnet:
+        start = time.perf_counter()
+        count = len(blnet._get_data())
+        return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=1000)
+    parser.add_argument("--frames", type=int, default=2)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 128, 255]
+    )
+    parser.add_argument(
+        "--response-delay",
+        type=float,
+        default=0.002,
+        help="seconds the simulated BL-Net needs to answer a command",
+    )
+    args = parser.parse_args()
+
+    server = BLNETDirectServer(
+        (ADDRESS, 0), BLNETDirectRequestHandler, frames=args.frames
+    )
+    for _ in range(args.records):
+        server.add_record(*[dataset()] * args.frames)
+    server.response_delay = args.response_delay
+    control = Server(server)
+    control.start_server()
+    try:
+        for batch_size in args.batch_sizes:
+            records_per_second = bench_download(control.get_port(), batch_size)
+            print(
+                "batch_size={:4}  {:10.1f} records/s".format(
+                    batch_size, records_per_second
+                )
+            )
+    finally:
+        control.stop_server()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time spent per record by BLNETParser with its lookup tables, compared with
+converting every analog channel, digital bit and speed on its own as before,
+and by LazyBLNETParser, in a scan that reads a single analog channel
+
+Run from the repository root: python -m benchmarks.bench_parser
+"""
+
+import argparse
+import random
+import struct
+import time
+from datetime import datetime
+
+from pyblnet.blnet_parser import BLNETParser, LazyBLNETParser
+from tests.test_structure.blnet_direct_mock_server import random_dataset
+
+
+class LegacyParser(BLNETParser):
+    """
+    Parser before the lookup tables, converting every value on its own
+    """
+
+    def __init__(self, data):
+        if len(data) == 61:
+            seconds, minutes, hours, days, months, years = struct.unpack_from(
+                "<BBBBBB", data, 55
+            )
+            self.date = datetime(2000 + years, months, days, hours, minutes, seconds)
+
+        power = [0, 0]
+        kWh = [0, 0]
+        MWh = [0, 0]
+        (
+            digital,
+            speed,
+            active,
+            power[0],
+            kWh[0],
+            MWh[0],
+            power[1],
+            kWh[1],
+            MWh[1],
+        ) = struct.unpack_from("<H4sBLHHLHH", data, 32)
+
+        analog = struct.unpack_from("<16H", data)
+
+        self.analog = {}
+        for channel in range(0, 16):
+            self.analog[channel + 1] = round(self._convert_analog(analog[channel]), 3)
+
+        self.digital = {}
+        for channel in range(0, 16):
+            self.digital[channel + 1] = self._convert_digital(digital, channel)
+
+        self.speed = {}
+        for idx, value in enumerate(speed):
+            self.speed[idx + 1] = self._convert_speed(value)
+
+        self.energy = {}
+        for channel in range(0, 2):
+            energy = self._convert_energy(MWh[channel], kWh[channel], active, channel)
+            self.energy[channel + 1] = energy
+
+        self.power = {}
+        for idx, value in enumerate(power):
+            self.power[idx + 1] = self._convert_power(value, active, idx)
+
+
+def bench(parser, records):
+    start = time.perf_counter()
+    for record in records:
+        parser(record).analog[1]
+    return (time.perf_counter() - start) / len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20000)
+    args = parser.parse_args()
+
+    rnd = random.Random(1611)
+    records = [random_dataset(rnd) for _ in range(args.records)]
+    # build the lookup tables before measuring
+    BLNETParser(records[0])
+
+    results = {
+        "legacy": bench(LegacyParser, records),
+        "tables": bench(BLNETParser, records),
+        "lazy": bench(LazyBLNETParser, records),
+    }
+    for name, duration in results.items():
+        print(
+            "{:6}  {:7.2f} us per record  {:5.1f}x".format(
+                name, duration * 1e6, results["legacy"] / duration
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
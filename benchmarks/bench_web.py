@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time per poll of the analog values page and memory held by the parsed values,
+parsing names and units every time, with the channel metadata cache, when
+only extracting the values with the cache (parse_analog_states) and when
+updating the dicts of the channels in place with them (as BLNET.fetch does)
+
+Run from the repository root: python -m benchmarks.bench_web
+"""
+
+import argparse
+import pickle
+import time
+import tracemalloc
+from pathlib import Path
+
+from pyblnet.blnet_web import (
+    PARSER_FAST,
+    PARSER_HTMLDOM,
+    parse_analog_states,
+    parse_analog_values,
+    _update_analog_sensor,
+    _update_sensors,
+)
+
+WEB_RAW_DIR = Path(__file__).parent.parent.joinpath("tests", "web_raw")
+
+
+def bench(parse, text, parser, polls):
+    start = time.perf_counter()
+    for _ in range(polls):
+        parse(text, parser)
+    return (time.perf_counter() - start) / polls
+
+
+def held(parse, text, parser):
+    """
+    Memory blocks and bytes held by the values of one poll
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = parse(text, parser)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del result
+    stats = after.compare_to(before, "filename")
+    return (
+        sum(stat.count_diff for stat in stats),
+        sum(stat.size_diff for stat in stats),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--polls", type=int, default=2000)
+    parser.add_argument(
+        "--parser", choices=(PARSER_FAST, PARSER_HTMLDOM), default=PARSER_FAST
+    )
+    args = parser.parse_args()
+
+    with WEB_RAW_DIR.joinpath("analog_values").open("rb") as file:
+        text = pickle.load(file).text
+    channels = {}
+    parse_analog_values(text, args.parser, channels)
+    sensors = {}
+
+    def update(text, parser):
+        states = parse_analog_states(text, parser, channels)
+        return _update_sensors(sensors, states, channels, _update_analog_sensor)
+
+    update(text, args.parser)
+
+    results = {
+        "full": lambda text, parser: parse_analog_values(text, parser),
+        "cached": lambda text, parser: parse_analog_values(text, parser, channels),
+        "states": lambda text, parser: parse_analog_states(text, parser, channels),
+        "update": update,
+    }
+    durations = {
+        name: bench(parse, text, args.parser, args.polls)
+        for name, parse in results.items()
+    }
+    for name, parse in results.items():
+        print(
+            "{:6}  {:7.2f} us per poll  {:5.1f}x  {:4} blocks  {:6} bytes".format(
+                name,
+                durations[name] * 1e6,
+                durations["full"] / durations[name],
+                *held(parse, text, args.parser)
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
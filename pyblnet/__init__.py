@@ -5,7 +5,9 @@ import warnings
 
 try:
     from .blnet_web import BLNETWeb, blnet_test
+    from .blnet_web_async import AsyncBLNETWeb
     from .blnet_conn import BLNETDirect
+    from .blnet_conn_async import AsyncBLNETDirect
     from .blnet import BLNET
 except ImportError as e:
     warnings.warn(ImportWarning(e))
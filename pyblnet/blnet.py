@@ -10,7 +10,7 @@ as possible.
 
 @author: Niels
 """
-from .blnet_web import BLNETWeb
+from .blnet_web import BLNETWeb, PARSER_HTMLDOM
 from .blnet_conn import BLNETDirect
 
 from urllib.parse import urlparse
@@ -31,6 +31,10 @@ class BLNET(object):
     max_retries  maximum number of connection retries before aborting
     use_web      boolean about whether to make use of the HTTP interface
     use_ta       boolean about whether to make use of the (buggy) PC-BLNET interface
+    web_parser   backend for parsing the web interface pages (see BLNETWeb),
+                 only PARSER_FAST stops reading a page after its values
+    lazy_probe   only test for a BLNET under the address on the first web request
+    ta_frames    dict CAN node -> frame of the PC-BLNET interface holding its values
     """
 
     def __init__(
@@ -43,12 +47,19 @@ class BLNET(object):
         max_retries=5,
         use_web=True,
         use_ta=False,
+        web_parser=PARSER_HTMLDOM,
+        lazy_probe=False,
+        ta_frames=None,
     ):
         """
         If a connection (Web or TA/Direct) should not be used,
         set the corresponding use_* to False
         Params:
         @param ta_port: Port for direct TCP Connection
+        @param ta_frames: dict CAN node -> frame of the PC-BLNET interface,
+            the PC-BLNET interface does not report which node a frame belongs to.
+            Without it, the first frame is only merged into the data of a
+            single fetched node (as by fetch).
         """
         assert isinstance(address, str)
         assert web_port is None or isinstance(web_port, int)
@@ -57,11 +68,16 @@ class BLNET(object):
         self.address = address
         self.timeout = timeout
         self.max_retries = max_retries
+        self.ta_frames = ta_frames
         self.blnet_web = None
         self.blnet_direct = None
         if use_web:
             self.blnet_web = BLNETWeb(
-                "{}:{}".format(address, web_port), password, timeout
+                "{}:{}".format(address, web_port),
+                password,
+                timeout,
+                parser=web_parser,
+                lazy_probe=lazy_probe,
             )
         if use_ta:
             # The address might not have a resulting hostname
@@ -74,35 +90,75 @@ class BLNET(object):
         """
         Fetch all available data about selected node
         (defaults to active node on the device)
+        The dicts of the analog and digital sensors are updated in place by
+        the next fetch of the node (see BLNETWeb.read_analog_sensors)
         """
+        return self.fetch_nodes([node])[node]
+
+    def fetch_nodes(self, nodes):
+        """
+        Fetch all available data about several nodes
+        The web interface is read within a single session, data of the
+        PC-BLNET interface is only merged for nodes with a known frame
+        (see ta_frames)
+        Return: dict node -> data as returned by fetch
+        """
+        nodes = list(nodes)
         data = {
-            "analog": {},
-            "digital": {},
-            "speed": {},
-            "energy": {},
-            "power": {},
+            node: {
+                "analog": {},
+                "digital": {},
+                "speed": {},
+                "energy": {},
+                "power": {},
+            }
+            for node in nodes
         }
         if self.blnet_web:
-            with self.blnet_web as blnet_session:
-                if node is not None:
-                    blnet_session.set_node(node)
-                data["analog"] = self._convert_web(blnet_session.read_analog_values())
-                data["digital"] = self._convert_web(blnet_session.read_digital_values())
-        if self.blnet_direct:
-            direct = self.blnet_direct.get_latest(self.max_retries)[0]
-            # Override values for analog and digital as values are
-            # expected to be more precise here
-            for domain in ["analog", "digital"]:
-                for id, value in direct[domain].items():
-                    if data[domain].get(id) is not None:
-                        data[domain][id]["value"] = value
-            for domain in ["speed", "energy", "power"]:
-                for id, value in direct[domain].items():
-                    if value is None:
-                        continue
-                    data[domain][id] = {"value": value}
+            web = self.blnet_web.fetch_nodes(nodes, sensors=True)
+            for node, values in web.items():
+                data[node]["analog"] = values["analog"] or {}
+                data[node]["digital"] = values["digital"] or {}
+        frames = self._direct_frames(data)
+        if self.blnet_direct and frames:
+            direct = self.blnet_direct.get_latest(self.max_retries)
+            for node, frame in frames.items():
+                # frames the BLNET did not answer are marked with a string
+                if frame not in direct or isinstance(direct[frame], str):
+                    continue
+                self._merge_direct(data[node], direct[frame])
         return data
 
+    def _direct_frames(self, nodes):
+        """
+        Frames of the PC-BLNET interface holding the values of the given nodes
+        Return: dict node -> frame
+        """
+        if self.ta_frames is not None:
+            return {
+                node: self.ta_frames[node] for node in nodes if node in self.ta_frames
+            }
+        if len(nodes) == 1:
+            return {node: 0 for node in nodes}
+        return {}
+
+    @staticmethod
+    def _merge_direct(data, direct):
+        """
+        Merges data read via the PC-BLNET interface into data read via web
+        """
+        # Override values for analog and digital as values are
+        # expected to be more precise here
+        for domain in ["analog", "digital"]:
+            for id, value in direct[domain].items():
+                if data[domain].get(id) is not None:
+                    data[domain][id]["value"] = value
+        for domain in ["speed", "energy", "power"]:
+            for id, value in direct[domain].items():
+                if value is None:
+                    continue
+                data[domain][id] = {"value": value}
+
     def turn_on(self, digital_id, can_node=None):
         """
         Turn switch with given id on given node on
@@ -124,6 +180,26 @@ class BLNET(object):
         """
         return self._turn(digital_id, "AUTO", can_node)
 
+    def set_digital_values(self, values, can_node=None):
+        """
+        Set several switches on given node within one session
+        values: dict of switch id -> "EIN"/"AUS"/"AUTO" (or equivalent)
+        Return: dict of switch id -> set successfully
+                (see BLNETWeb.set_digital_values)
+        """
+        if self.blnet_web:
+            with self.blnet_web as blnet_session:
+                if not blnet_session.logged_in():
+                    raise ConnectionError("Could not log in")
+                if can_node is not None:
+                    if not blnet_session.set_node(can_node):
+                        raise ConnectionError(
+                            "Could not set can node to {}".format(can_node)
+                        )
+                return blnet_session.set_digital_values(values)
+        else:
+            raise EnvironmentError("Can't set values with blnet web disabled")
+
     def _turn(self, digital_id, value, can_node=None):
         if self.blnet_web:
             with self.blnet_web as blnet_session:
@@ -197,16 +273,3 @@ class BLNET(object):
         return self.get_value(
             type="power", ret="value", name=name, id=id, cached=cached
         )
-
-    @staticmethod
-    def _convert_web(values):
-        """
-        Converts data returned by blnet_web to nice data
-        """
-        data = {}
-        try:
-            for sensor in values:
-                data[int(sensor["id"])] = sensor
-        except TypeError:
-            pass
-        return data
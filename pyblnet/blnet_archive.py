@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 18.10.2026
+
+Append-only archive of the raw datasets downloaded from the bootloader
+(see BLNETDirect with output=OUTPUT_RAW)
+
+The file starts with a header recording the bootloader mode and the number of
+frames per dataset, followed by the datasets of DATASET_SIZE bytes per frame.
+It is read through mmap, opening it takes the same time for any size and
+the datasets are only decoded when accessed.
+
+@author: Nielstron
+"""
+
+import mmap
+import os
+import struct
+
+from .blnet_conn import (
+    CAN_MODE,
+    DL_MODE,
+    DL2_MODE,
+    DATASET_SIZE,
+    MAX_CAN_FRAMES,
+    OUTPUT_DICT,
+    _OUTPUT_PARSERS,
+)
+
+ARCHIVE_MAGIC = b"BLNETARC"
+ARCHIVE_VERSION = 1
+# magic, version, mode, frames per dataset, reserved
+ARCHIVE_HEADER = struct.Struct("<8sBcB5x")
+
+
+class BLNETArchive(object):
+    """
+    Append-only file of raw, checksum verified datasets of a BLNET, oldest first
+    An archive only holds datasets of one mode and number of frames. A dataset
+    that was not completely appended (e.g. on a crash) is overwritten by the
+    next append.
+    """
+
+    def __init__(self, path, mode=None, frames=None, output=OUTPUT_DICT):
+        """
+        Open the archive, create it if it does not exist
+        @param path: path of the archive file
+        @param mode: bootloader mode (e.g. CAN_MODE), required for creating
+        @param frames: int, frames per dataset, required for creating
+        @param output: type datasets are returned as (see BLNETDirect),
+            decoded on access
+        @throws ValueError the file is no archive or has a different layout
+        """
+        assert output in _OUTPUT_PARSERS
+        self.path = path
+        self.output = output
+        if not os.path.exists(path):
+            assert mode in (CAN_MODE, DL_MODE, DL2_MODE)
+            assert isinstance(frames, int) and 1 <= frames <= MAX_CAN_FRAMES
+            with open(path, "xb") as file:
+                file.write(
+                    ARCHIVE_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, mode, frames)
+                )
+        self._file = open(path, "r+b")
+        try:
+            header = self._file.read(ARCHIVE_HEADER.size)
+            if len(header) < ARCHIVE_HEADER.size:
+                raise ValueError("{} is no BLNET archive".format(path))
+            magic, version, self.mode, self.frames = ARCHIVE_HEADER.unpack(header)
+            if magic != ARCHIVE_MAGIC or version != ARCHIVE_VERSION:
+                raise ValueError("{} is no BLNET archive".format(path))
+            if mode is not None and mode != self.mode:
+                raise ValueError("Archive holds datasets of another mode")
+            if frames is not None and frames != self.frames:
+                raise ValueError("Archive holds datasets of another frame count")
+        except ValueError:
+            self._file.close()
+            raise
+        self.record_size = self.frames * DATASET_SIZE
+        self._map = None
+
+    @classmethod
+    def for_blnet(cls, path, blnet, output=OUTPUT_DICT):
+        """
+        Open or create the archive for the datasets of a BLNET
+        @param blnet: BLNETDirect whose layout is known (e.g. after a download)
+        @throws ValueError layout of the BLNET unknown or different
+        """
+        frames = blnet._dataset_frames()
+        if frames is None:
+            raise ValueError("Memory layout of the BLNET is not known yet")
+        return cls(path, blnet._mode, frames, output)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the archive file
+        """
+        self._map = None
+        self._file.close()
+
+    def __len__(self):
+        size = os.fstat(self._file.fileno()).st_size
+        return (size - ARCHIVE_HEADER.size) // self.record_size
+
+    def append(self, dataset):
+        """
+        Append one dataset (see extend)
+        """
+        self.extend([dataset])
+
+    def extend(self, datasets, newest_first=True):
+        """
+        Append datasets as returned by BLNETDirect with output=OUTPUT_RAW,
+        empty datasets (False) are skipped
+        The archive holds the datasets oldest first, the datasets of a
+        download (newest first) are therefore appended in reverse.
+        @param datasets: iterable of Arrays of frame -> raw dataset
+        @param newest_first: boolean, whether the datasets are ordered newest first
+        @throws ValueError a dataset does not fit the layout of the archive
+        """
+        datasets = list(datasets)
+        if newest_first:
+            datasets.reverse()
+        records = []
+        for dataset in datasets:
+            if not dataset:
+                continue
+            if sorted(dataset) != list(range(self.frames)):
+                raise ValueError("Dataset does not have {} frames".format(self.frames))
+            for frame in range(self.frames):
+                if len(dataset[frame]) != DATASET_SIZE:
+                    raise ValueError(
+                        "Frame is no raw dataset of {} bytes".format(DATASET_SIZE)
+                    )
+                records.append(dataset[frame])
+        # overwrite a partially written dataset
+        self._file.seek(ARCHIVE_HEADER.size + len(self) * self.record_size)
+        self._file.write(b"".join(records))
+        self._file.truncate()
+        self._file.flush()
+
+    def raw(self, index):
+        """
+        @param index: int, position of the dataset, oldest first
+        @return bytes of the raw frames of the dataset
+        """
+        start = self._start(index)
+        return self._mapping()[start : start + self.record_size]
+
+    def __getitem__(self, index):
+        """
+        @param index: int, position of the dataset, oldest first
+        @return Array of frame -> value mappings (see output)
+        """
+        parse = _OUTPUT_PARSERS[self.output]
+        start = self._start(index)
+        frames = {}
+        with memoryview(self._mapping()) as view:
+            for frame in range(self.frames):
+                offset = start + frame * DATASET_SIZE
+                frames[frame] = parse(view[offset : offset + DATASET_SIZE])
+        return frames
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def decode(self, frame=0):
+        """
+        Decode the given frame of all datasets at once (requires numpy)
+        @param frame: int, index of the frame
+        @return numpy structured array (see blnet_batch.decode_datasets)
+        """
+        from .blnet_batch import decode_datasets
+
+        end = ARCHIVE_HEADER.size + len(self) * self.record_size
+        with memoryview(self._mapping()) as view:
+            return decode_datasets(
+                view[ARCHIVE_HEADER.size : end], DATASET_SIZE, self.frames, frame
+            )
+
+    def _start(self, index):
+        """
+        @return int offset of the dataset at the given index in the file
+        @throws IndexError no dataset at the index
+        """
+        count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("Archive index out of range")
+        return ARCHIVE_HEADER.size + index * self.record_size
+
+    def _mapping(self):
+        """
+        Memory map of the archive file, remapped after it grew
+        Views on a former map keep it open until they are released.
+        """
+        size = os.fstat(self._file.fileno()).st_size
+        if self._map is None or len(self._map) != size:
+            self._map = mmap.mmap(self._file.fileno(), size, access=mmap.ACCESS_READ)
+        return self._map
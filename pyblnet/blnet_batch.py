@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 18.10.2026
+
+Decode many bootloader datasets at once with NumPy,
+i.e. a vectorized BLNETParser for archived log records
+
+Requires numpy (pip install pyblnet[batch])
+
+@author: Nielstron
+"""
+
+import numpy as np
+
+from .blnet_parser import (
+    BLNETParser,
+    SPEED_ACTIVE,
+    SPEED_MASK,
+)
+
+# Size of a dataset without and with the time of recording
+VALUES_SIZE = 55
+DATASET_SIZE = 61
+
+# Layout of a raw dataset (see BLNETParser)
+_RAW_FIELDS = {
+    "names": [
+        "analog",
+        "digital",
+        "speed",
+        "active",
+        "power",
+        "kwh",
+        "mwh",
+        "power2",
+        "kwh2",
+        "mwh2",
+    ],
+    "formats": ["<16u2", "<u2", "4u1", "u1", "<u4", "<u2", "<u2", "<u4", "<u2", "<u2"],
+    "offsets": [0, 32, 34, 38, 39, 43, 45, 47, 51, 53],
+}
+_DATE_FIELD = ("date", "6u1", VALUES_SIZE)
+
+# Decoded datasets, channel n of BLNETParser is found at index n - 1,
+# values BLNETParser reports as None are NaN
+DATASET_DTYPE = np.dtype(
+    [
+        ("analog", "<f8", (16,)),
+        ("digital", "u1", (16,)),
+        ("speed", "<f8", (4,)),
+        ("energy", "<f8", (2,)),
+        ("power", "<f8", (2,)),
+        ("date", "<M8[s]"),
+    ]
+)
+
+# Relative distance to .5 below which numpy rounding may differ from round()
+_TIE_TOLERANCE = 1e-12
+
+_analog_table = None
+
+# Speed of all 256 raw speed values, NaN if inactive
+_SPEED_TABLE = np.where(
+    np.arange(256) & SPEED_ACTIVE, np.nan, np.arange(256) & SPEED_MASK
+)
+
+
+def raw_dtype(record_size=DATASET_SIZE, frames=1, frame=0):
+    """
+    Structured dtype of undecoded datasets
+    @param record_size: int, 55 (without time) or 61 bytes
+    @param frames: int, number of datasets (frames) stored one after another
+        per row, only the one of the given frame is described
+    @param frame: int, index of the frame in the row
+    @return numpy dtype
+    """
+    assert record_size in (VALUES_SIZE, DATASET_SIZE)
+    assert 0 <= frame < frames
+    fields = {key: list(value) for key, value in _RAW_FIELDS.items()}
+    if record_size == DATASET_SIZE:
+        for key, value in zip(("names", "formats", "offsets"), _DATE_FIELD):
+            fields[key].append(value)
+    fields["offsets"] = [offset + frame * record_size for offset in fields["offsets"]]
+    fields["itemsize"] = frames * record_size
+    return np.dtype(fields)
+
+
+def decode_datasets(buffer, record_size=DATASET_SIZE, frames=1, frame=0):
+    """
+    Decode a contiguous buffer of datasets,
+    the result matches BLNETParser applied to every single dataset
+    Invalid times of recording are decoded as NaT, datasets of 55 bytes
+    have no time of recording.
+    @param buffer: bytes-like object of N rows of frames * record_size bytes
+    @param record_size: int, 55 (without time) or 61 bytes
+    @param frames: int, number of datasets per row (e.g. CAN frames)
+    @param frame: int, index of the decoded dataset in every row
+    @throws ValueError buffer is no multiple of the row size
+    @return numpy structured array of N datasets with dtype DATASET_DTYPE
+    """
+    if memoryview(buffer).nbytes % (frames * record_size):
+        raise ValueError(
+            "Buffer is no multiple of the row size {}".format(frames * record_size)
+        )
+    raw = np.frombuffer(buffer, dtype=raw_dtype(record_size, frames, frame))
+    result = np.empty(len(raw), dtype=DATASET_DTYPE)
+
+    result["analog"] = np.take(_get_analog_table(), raw["analog"])
+
+    # little endian bytes of the digital values, lowest channel first
+    digital = np.ascontiguousarray(raw["digital"]).view(np.uint8).reshape(-1, 2)
+    result["digital"] = np.unpackbits(digital, axis=1, bitorder="little")
+
+    result["speed"] = np.take(_SPEED_TABLE, raw["speed"])
+
+    # BLNETParser checks the heat meters by `active & position`,
+    # so the first one is never reported as active
+    active = raw["active"]
+    result["energy"] = np.nan
+    result["power"] = np.nan
+    for position, suffix in ((0, ""), (1, "2")):
+        enabled = np.flatnonzero(active & position)
+        kwh = raw["kwh" + suffix][enabled].astype(np.int16) * 0.1
+        mwh = raw["mwh" + suffix][enabled].astype(np.int64)
+        result["energy"][enabled, position] = _round(mwh * 1000 + kwh)
+        power = raw["power" + suffix][enabled].astype(np.int32) * (1 / 2560)
+        result["power"][enabled, position] = _round(power)
+
+    if record_size == DATASET_SIZE:
+        result["date"] = _convert_dates(raw["date"])
+    else:
+        result["date"] = np.datetime64("NaT")
+    return result
+
+
+def _get_analog_table():
+    """
+    Rounded values of all 65536 raw analog values (see BLNETParser),
+    built on first use
+    """
+    global _analog_table
+    if _analog_table is None:
+        analog_table, _, _ = BLNETParser._get_tables()
+        _analog_table = np.array(analog_table, dtype=np.float64)
+    return _analog_table
+
+
+def _round(values, digits=3):
+    """
+    Round like round() does for floats
+    numpy scales by 10 ** digits before rounding, which rounds some values
+    close to .5 differently, those are rounded with round() instead.
+    """
+    result = np.round(values, digits)
+    scaled = np.abs(values) * 10**digits
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) <= _TIE_TOLERANCE * scaled
+    for index in np.flatnonzero(ties):
+        result[index] = round(float(values[index]), digits)
+    return result
+
+
+def _convert_dates(date):
+    """
+    Convert seconds, minutes, hours, days, months and years since 2000
+    to datetime64, invalid dates become NaT
+    """
+    date = date.astype(np.int64)
+    seconds, minutes, hours, days, months, years = date.T
+    month = ((years + 30) * 12 + months - 1).astype("<M8[M]")
+    day = month.astype("<M8[D]") + (days - 1).astype("<m8[D]")
+    result = day.astype("<M8[s]") + (hours * 3600 + minutes * 60 + seconds).astype(
+        "<m8[s]"
+    )
+    valid = (
+        (months >= 1)
+        & (months <= 12)
+        & (days >= 1)
+        & (day.astype("<M8[M]") == month)
+        & (hours < 24)
+        & (minutes < 60)
+        & (seconds < 60)
+    )
+    result[~valid] = np.datetime64("NaT")
+    return result
@@ -9,12 +9,16 @@ https://github.com/berwinter/uvr1611/blob/master/lib/backend/blnet-connection.in
 @author: Niels
 """
 from builtins import str, int
-from socket import socket, getaddrinfo, SOCK_STREAM, IPPROTO_TCP, setdefaulttimeout
+from socket import socket, getaddrinfo, SOCK_STREAM, IPPROTO_TCP
+from socket import timeout as SocketTimeout
+import json
+import os
 import struct
-from time import sleep
+import threading
+from time import sleep, monotonic
 from datetime import datetime
 
-from .blnet_parser import BLNETParser
+from .blnet_parser import BLNETParser, BLNETRecord, LazyBLNETParser
 
 # Constants for the UVR Communication
 CAN_MODE = b"\xDC"
@@ -30,9 +34,459 @@ WAIT_TIME = 0xBA
 MAX_RETRYS = 10
 DATASET_SIZE = 61
 LATEST_SIZE = 56
+NO_ADDRESS = b"\xFF\xFF\xFF"
+# Values of an unused dataset
+EMPTY_VALUES = bytes(DATASET_SIZE - 6)
+# Response sizes
+HEADER_PREFIX_SIZE = 6  # part of the header that determines its length
+HEADER_SIZE = 13  # header without CAN frame list
+MAX_CAN_FRAMES = 8
+WAIT_TIME_SIZE = 3
+MAX_BATCH_SIZE = 0xFF
+# Timeout for the first batch, a BL-Net not supporting batches only sends one dataset
+BATCH_PROBE_TIMEOUT = 2
+# Types the parsed datasets are returned as
+OUTPUT_DICT = "dict"
+OUTPUT_RECORD = "record"
+OUTPUT_LAZY = "lazy"
+OUTPUT_RAW = "raw"
 
 
-class BLNETDirect(object):
+class IncompleteResponse(ConnectionError):
+    """
+    The response of the bootloader did not arrive completely in time
+    """
+
+
+def _parse_dict(data):
+    return BLNETParser(data).to_dict()
+
+
+_OUTPUT_PARSERS = {
+    OUTPUT_DICT: _parse_dict,
+    OUTPUT_RECORD: BLNETRecord,
+    OUTPUT_LAZY: LazyBLNETParser,
+    OUTPUT_RAW: bytes,
+}
+
+
+def load_cursor(path):
+    """
+    Load the cursor of a previous download (see BLNETDirect.sync)
+    @param path: path of the cursor file
+    @return dict with address and date of the newest dataset or None
+    """
+    try:
+        with open(path) as file:
+            cursor = json.load(file)
+    except FileNotFoundError:
+        return None
+    return {
+        "address": cursor["address"],
+        "date": datetime.fromisoformat(cursor["date"]),
+    }
+
+
+def save_cursor(path, cursor):
+    """
+    Save the cursor of a download (see BLNETDirect.sync)
+    The file is replaced atomically such that it is never left half written.
+    @param path: path of the cursor file
+    @param cursor: dict with address and date of the newest dataset
+    """
+    _write_json(
+        path, {"address": cursor["address"], "date": cursor["date"].isoformat()}
+    )
+
+
+def _write_json(path, data):
+    """
+    Replace the file atomically such that it is never left half written
+    """
+    temporary = "{}.tmp".format(path)
+    with open(temporary, "w") as file:
+        json.dump(data, file)
+    os.replace(temporary, path)
+
+
+class LayoutCache(object):
+    """
+    Cache of the bootloader mode and memory layout (as read from the header)
+    of BLNETs, keyed by "address:port"
+    One cache can be shared by several BLNETDirect instances. If a path is
+    given, the cache is loaded from and saved to that JSON file, such that it
+    survives restarts. Entries are invalidated by the BLNETDirect instances
+    on checksum failures and unexpected response lengths.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._layouts = {}
+        self._lock = threading.Lock()
+        if path is not None:
+            try:
+                with open(path) as file:
+                    self._layouts = json.load(file)
+            except FileNotFoundError:
+                pass
+
+    def get(self, key):
+        """
+        @return dict layout of the BLNET or None if unknown
+        """
+        return self._layouts.get(key)
+
+    def set(self, key, layout):
+        with self._lock:
+            if self._layouts.get(key) != layout:
+                self._layouts[key] = layout
+                self._save()
+
+    def invalidate(self, key=None):
+        """
+        Drop the layout of the given BLNET, of all BLNETs if key is None
+        """
+        with self._lock:
+            if key is None:
+                self._layouts = {}
+            elif self._layouts.pop(key, None) is None:
+                return
+            self._save()
+
+    def _save(self):
+        if self.path is not None:
+            _write_json(self.path, self._layouts)
+
+
+class LatestSchedule(object):
+    """
+    Schedule of the GET_LATEST requests for the CAN frames
+    A frame for which the BLNET answered WAIT_TIME is only requested again
+    once the wait is over, meanwhile the other frames are requested. The time
+    for all frames is thus bounded by the longest wait rather than their sum.
+    Attributes:
+        frames   frame -> value mappings received so far ("timeout" for frames
+                 that did not answer within max_retries requests)
+        info     per frame: requested waits ("sleep"), failed requests before
+                 success ("got"), datetime of receiving the values ("received")
+    """
+
+    def __init__(self, can_frames, max_retries=MAX_RETRYS):
+        self.max_retries = max_retries
+        # pending frame -> monotonic time at which it is ready
+        self._ready = {frame: 0 for frame in range(0, can_frames)}
+        self._tries = {frame: 0 for frame in range(0, can_frames)}
+        self.frames = {}
+        self.info = {
+            "sleep": {frame: [] for frame in range(0, can_frames)},
+            "got": {},
+            "received": {},
+        }
+
+    def done(self):
+        return not self._ready
+
+    def next_frame(self):
+        """
+        @return the pending frame that is ready first and the seconds until then
+        """
+        frame = min(self._ready, key=lambda frame: (self._ready[frame], frame))
+        return frame, max(0, self._ready[frame] - monotonic())
+
+    def wait(self, frame, seconds):
+        """
+        The BLNET asked to request the frame again in given seconds
+        """
+        self.info["sleep"][frame].append(seconds)
+        self._ready[frame] = monotonic() + seconds
+
+    def received(self, frame, frames):
+        """
+        Values for the frame were received
+        @param frames: frame -> value mappings as split from the response
+        """
+        self.info["got"][frame] = self._tries[frame]
+        received = datetime.now()
+        for key in frames:
+            self.info["received"][key] = received
+        self.frames.update(frames)
+        del self._ready[frame]
+
+    def give_up(self):
+        """
+        Mark all pending frames as timeout
+        """
+        for frame in self._ready:
+            self.frames[frame] = "timeout"
+        self._ready = {}
+
+    def tried(self, frame):
+        """
+        A request for the frame was answered, gives up after max_retries
+        """
+        if frame not in self._ready:
+            return
+        self._tries[frame] += 1
+        if self._tries[frame] >= self.max_retries:
+            self.frames[frame] = "timeout"
+            del self._ready[frame]
+
+
+class BLNETProtocol(object):
+    """
+    Connection independent part of the PC-BLNET bootloader protocol:
+    Layout of the bootloader memory, commands and parsing of the responses
+    Subclasses provide the communication (see BLNETDirect)
+    """
+
+    _mode = None
+    _count = None
+    _address = None
+    _can_frames = None
+    # type of the returned datasets
+    output = OUTPUT_DICT
+
+    def _supported_mode(self):
+        """
+        Check if Bootloader Mode is supported
+        @throws ConnectionError Mode not supported
+        """
+        if self._mode in [CAN_MODE, DL2_MODE, DL_MODE]:
+            return True
+        raise ConnectionError("BL-Net mode is not supported")
+
+    def _layout(self):
+        """
+        @return dict mode and memory layout as read from the header
+        """
+        return {
+            "mode": self._mode.hex(),
+            "can_frames": self._can_frames,
+            "address_inc": self._address_inc,
+            "address_end": self._address_end,
+            "actual_size": self._actual_size,
+            "fetch_size": self._fetch_size,
+        }
+
+    def _apply_layout(self, layout):
+        """
+        Use the mode and memory layout (see _layout) instead of reading them
+        """
+        self._mode = bytes.fromhex(layout["mode"])
+        self._can_frames = layout["can_frames"]
+        self._address_inc = layout["address_inc"]
+        self._address_end = layout["address_end"]
+        self._actual_size = layout["actual_size"]
+        self._fetch_size = layout["fetch_size"]
+
+    def _invalidate_layout(self):
+        """
+        A response did not fit the mode and layout, they may have changed
+        """
+
+    def _read_header(self, data):
+        """
+        Read the memory layout and the number of stored datasets from the header
+        @param data: header as received for GET_HEADER
+        """
+        if not self._checksum(data):
+            self._invalidate_layout()
+            return
+        if self._mode == CAN_MODE:
+            frame_count = data[5]
+            (
+                type,
+                version,
+                timestamp,
+                frame_count,
+                _,
+                start_address,
+                end_address,
+                checksum,
+            ) = struct.unpack("<BB3sB{}s3s3sB".format(frame_count), data)
+            self._address_inc = 64 * frame_count
+            self._can_frames = frame_count
+            self._actual_size = 57
+            self._fetch_size = 4 + 61 * frame_count
+        elif self._mode == DL_MODE:
+            (_, device, start_address, end_address, checksum) = struct.unpack(
+                "<5sB3s3sB", data
+            )
+            self._address_inc = 64
+            self._can_frames = 1
+            self._actual_size = 57
+            self._fetch_size = 65
+        elif self._mode == DL2_MODE:
+            (_, device, start_address, end_address, checksum) = struct.unpack(
+                "<5s2s3s3sB", data
+            )
+            self._address_inc = 128
+            self._can_frames = 1
+            self._actual_size = 113
+            self._fetch_size = 126
+
+        self._address_end = (0x07FFFF // self._address_inc) * self._address_inc
+
+        # check address validity
+        if start_address != NO_ADDRESS and end_address != NO_ADDRESS:
+            start_address = int.from_bytes(start_address, byteorder="little")
+            end_address = int.from_bytes(end_address, byteorder="little")
+            self._address = end_address
+            # calculate count, the addresses wrap after _address_end
+            self._count = self._datasets_since(start_address) + 1
+        else:
+            # no datasets stored
+            self._count = 0
+
+    def _header_size(self, prefix):
+        """
+        Length of the header in the current mode
+        @param prefix: first HEADER_PREFIX_SIZE bytes of the header
+        @return int
+        """
+        if self._mode == CAN_MODE:
+            # followed by one byte per CAN frame
+            return HEADER_SIZE + prefix[5]
+        elif self._mode == DL2_MODE:
+            return HEADER_SIZE + 1
+        return HEADER_SIZE
+
+    def _latest_size(self, prefix):
+        """
+        Length of the response to a GET_LATEST command
+        @param prefix: first byte of the response
+        @return int
+        """
+        if prefix[0] == WAIT_TIME:
+            return WAIT_TIME_SIZE
+        return self._actual_size
+
+    def _checksum(self, data):
+        """
+        Verify the checksum (last byte is the sum of the others modulo 256)
+        @param data: byte string or memoryview to check
+        @return boolean
+        """
+        return sum(data[:-1]) % 256 == data[-1]
+
+    def _read_data_command(self, address=None, count=1):
+        """
+        Build the command to read datasets from the bootloader memory
+        @param address: int address of the (first) dataset, the current one by default
+        @param count: int number of consecutive datasets to read
+        @return byte string
+        """
+        if address is None:
+            address = self._address
+        # build address for bootloader
+        addresses = [
+            address & 0xFF,
+            (address & 0x7F00) >> 7,
+            (address & 0xFF8000) >> 15,
+        ]
+
+        # build command
+        return struct.pack(
+            "<6B",
+            READ_DATA,
+            addresses[0],
+            addresses[1],
+            addresses[2],
+            count,
+            (READ_DATA + count + sum(addresses)) % 256,
+        )
+
+    def _advance(self):
+        """
+        Move on to the next (older) dataset after a successful read
+        """
+        # increment address
+        self._address -= self._address_inc
+        if self._address < 0:
+            self._address = self._address_end
+        self._count -= 1
+
+    def _datasets_since(self, address):
+        """
+        Number of datasets stored after the one at the given address
+        The memory is used as ring buffer, wrapping after _address_end.
+        @param address: int address of a dataset
+        @return int
+        """
+        ring_size = self._address_end + self._address_inc
+        return ((self._address - address) % ring_size) // self._address_inc
+
+    def _dataset_frames(self):
+        """
+        @return int number of frames of a dataset or None if the layout is unknown
+        """
+        if self._mode == CAN_MODE:
+            return self._can_frames
+        elif self._mode == DL_MODE:
+            return 1
+        elif self._mode == DL2_MODE:
+            return 2
+        return None
+
+    def _dataset_date(self, dataset):
+        """
+        @param dataset: Array of frame -> value mappings or False if empty
+        @return datetime the dataset was recorded or None
+        """
+        if not dataset:
+            return None
+        if self.output == OUTPUT_RAW:
+            return LazyBLNETParser(dataset[0]).date
+        return dataset[0].get("date")
+
+    def _split_datasets(self, data):
+        """
+        split binary string in datasets and parse dataset values
+        @param data: byte string
+        @return Array of frame -> value mappings
+        """
+        # the datasets are views on the received buffer, not copies
+        data = memoryview(data)
+        start = 3 if self._mode == CAN_MODE else 0
+        if data[start : start + DATASET_SIZE - 6] == EMPTY_VALUES:
+            return False
+
+        parse = _OUTPUT_PARSERS[self.output]
+        frames = {}
+        if self._mode == CAN_MODE:
+            for frame in range(0, self._can_frames):
+                frames[frame] = parse(
+                    data[3 + DATASET_SIZE * frame : 3 + DATASET_SIZE * (frame + 1)]
+                )
+        elif self._mode == DL_MODE:
+            frames[0] = parse(data[:DATASET_SIZE])
+        elif self._mode == DL2_MODE:
+            frames[0] = parse(data[:DATASET_SIZE])
+            frames[1] = parse(data[3 + DATASET_SIZE : 3 + DATASET_SIZE + DATASET_SIZE])
+        return frames
+
+    def _split_latest(self, data, frame):
+        """
+        Split binary string by fetch latest
+        @param data: bytestring
+        @param frame: int
+        @return Array of frame -> value mappings
+        """
+        data = memoryview(data)
+        parse = _OUTPUT_PARSERS[self.output]
+        frames = {}
+        if self._mode == CAN_MODE:
+            frames[frame] = parse(data[1 : LATEST_SIZE + 1])
+        elif self._mode == DL_MODE:
+            frames[0] = parse(data[1 : LATEST_SIZE + 1])
+        elif self._mode == DL2_MODE:
+            frames[0] = parse(data[1 : LATEST_SIZE + 1])
+            frames[1] = parse(data[LATEST_SIZE + 1 : 2 * LATEST_SIZE + 1])
+
+        return frames
+
+
+class BLNETDirect(BLNETProtocol):
     """
     A class for establishing a direct connection to the BLNET (rather than
     scraping the web interface)
@@ -41,106 +495,212 @@ class BLNETDirect(object):
     www.haus-terra.at/heizung/download/Schnittstelle/Schnittstelle_PC_Bootloader.pdf
     """
 
-    def __init__(self, address, port: int = 40000, reset: bool = False, timeout: float = 60):
+    def __init__(
+        self,
+        address,
+        port: int = 40000,
+        reset: bool = False,
+        timeout: float = 60,
+        persistent: bool = False,
+        batch_size: int = 1,
+        total_timeout: float = None,
+        layout_cache: LayoutCache = None,
+        output: str = OUTPUT_DICT,
+    ):
         """
         Constructor
         :param address: string, Address of the BL-Net device
         :param port: integer, Port of the bl-net device for connection
         :param reset: boolean, delete data on BL-Net after data receive
-        :param timeout: float, timeout in seconds for the connection
+        :param timeout: float, timeout in seconds for connecting and for every
+            command (only applies to the sockets of this instance)
+        :param persistent: boolean, keep the connection open between operations
+            (close it with close()), it is checked before reuse and
+            reestablished transparently if the BL-Net dropped it
+        :param batch_size: integer, maximum number of datasets requested with
+            one command when downloading the memory, single datasets are
+            requested if the BL-Net does not answer batches
+        :param total_timeout: float, default time in seconds in which a whole
+            get_latest or download has to finish, including retries and waits
+            requested by the BL-Net (None for no limit)
+        :param layout_cache: LayoutCache, cache of the mode and memory layout,
+            with a known layout no connection is made in the constructor and
+            get_latest does not read the header
+        :param output: string, type of the returned datasets, OUTPUT_DICT for
+            dicts, OUTPUT_RECORD for the more compact BLNETRecord,
+            OUTPUT_LAZY for LazyBLNETParser decoding values on access or
+            OUTPUT_RAW for the verified raw datasets (see BLNETArchive)
         """
         assert isinstance(address, str)
         assert isinstance(port, int)
         assert isinstance(reset, bool)
+        assert isinstance(persistent, bool)
+        assert isinstance(batch_size, int) and 1 <= batch_size <= MAX_BATCH_SIZE
+        assert output in _OUTPUT_PARSERS
         self.address = address
         self.port = port
         self.reset = reset
+        self.timeout = timeout
+        self.persistent = persistent
+        self.batch_size = batch_size
+        self.total_timeout = total_timeout
+        self.layout_cache = layout_cache
+        self.output = output
+        # a response did not fit the mode, it is checked again
+        self._mode_stale = False
+        # monotonic time by which the current operation has to finish
+        self._deadline = None
+        # whether the BL-Net answers batches, None until known
+        self._batches = None
         self._mode = None
         self._socket = None
+        # connection has not yet been used for a complete query
+        self._fresh = False
+        # connection was kept open after an operation, checked before reuse
+        self._idle = False
         self._count = None
-        self._check_mode()
-        if timeout:
-            setdefaulttimeout(timeout)
+        self.progress = {"done": 0, "remaining": 0}
+        self.cursor = None
+        if not self._cached_layout():
+            self._check_mode()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection to the bootloader (if still open)
+        """
+        if self._socket is not None:
+            self._disconnect()
 
     def get_count(self):
         """
         Get the number of datasets in the bootloader memory
         @return number of datasets in bootloader memory
         """
-        if not self._count:
+        if self._count is None:
+            if self._mode_stale:
+                self._check_mode()
             self._connect()
-            data = self._query(GET_HEADER, 21)
+            data = self._query(
+                GET_HEADER,
+                HEADER_SIZE + MAX_CAN_FRAMES,
+                HEADER_PREFIX_SIZE,
+                self._header_size,
+            )
 
-            if self._checksum(data):
-                if self._mode == CAN_MODE:
-                    frame_count = struct.unpack("<{}B".format(len(data)), data)[5]
-                    (
-                        type,
-                        version,
-                        timestamp,
-                        frame_count,
-                        _,
-                        start_address,
-                        end_address,
-                        checksum,
-                    ) = struct.unpack("<BB3sB{}s3s3sB".format(frame_count), data)
-                    self._address_inc = 64 * frame_count
-                    self._can_frames = frame_count
-                    self._actual_size = 57
-                    self._fetch_size = 4 + 61 * frame_count
-                elif self._mode == DL_MODE:
-                    (_, device, start_address, end_address, checksum) = struct.unpack(
-                        "<5sB3s3sB"
-                    )
-                    self._address_inc = 64
-                    self._can_frames = 1
-                    self._actual_size = 57
-                    self._fetch_size = 65
-                elif self._mode == DL2_MODE:
-                    (_, device, start_address, end_address, checksum) = struct.unpack(
-                        "<5s2s3s3sB"
-                    )
-                    self._address_inc = 128
-                    self._can_frames = 1
-                    self._actual_size = 113
-                    self._fetch_size = 126
-
-                self._address_end = (0x07FFFF // self._address_inc) * self._address_inc
-
-                # check address validity
-                if start_address != b"0xFFFFFF" and end_address != b"0xFFFFFF":
-                    start_address = int.from_bytes(start_address, byteorder="little")
-                    end_address = int.from_bytes(end_address, byteorder="little")
-                    # fix addresses
-                    if end_address > start_address:
-                        # calculate count
-                        self._count = (
-                            (end_address - start_address) / self._address_inc
-                        ) + 1
-                    else:
-                        self._count = (
-                            self._address_end + start_address - end_address
-                        ) / self._address_inc
-                    self._address = end_address
-        if self._count:
-            self._count = int(self._count)
-            return self._count
-        else:
+            self._read_header(data)
+            if self.layout_cache is not None and not self._mode_stale:
+                self.layout_cache.set(self._cache_key(), self._layout())
+        if self._count is None:
             raise ConnectionError("Could not retreive count")
+        return self._count
 
-    def _get_data(self, max_count=None):
-        data = []
+    def iter_datasets(self, max_count=None, since=None, total_timeout=None):
+        """
+        Download the datasets stored in the bootloader memory, newest first
+        Every dataset is yielded as soon as its checksum is verified,
+        the progress of the download is available in the attribute progress
+        as {"done": datasets yielded, "remaining": datasets still to fetch}.
+        After a complete download the attribute cursor holds the position
+        of the newest dataset (see sync).
+        @param max_count: int maximum number of datasets to download
+        @param since: cursor of a previous download, only newer datasets are
+            downloaded
+        @param total_timeout: float seconds in which the download has to finish
+            (see constructor)
+        @throws ConnectionError could not get data from BLNet
+        @return generator of Arrays of frame -> value mappings
+        """
+        self._start_operation(total_timeout)
         try:
-            count = self._start_read()
-            if isinstance(max_count, int):
-                count = min(max_count, count)
-            for _ in range(0, count):
-                data.append(self._fetch_data())
-            self._end_read(True)
-            return data
+            yield from self._iter_datasets(max_count, since)
         finally:
-            self._end_read(False)
-            return data
+            self._deadline = None
+
+    def _iter_datasets(self, max_count, since):
+        count = self._start_read()
+        if count and since is not None:
+            count = self._count_since(since, count)
+        if isinstance(max_count, int):
+            count = min(max_count, count)
+        self.progress = {"done": 0, "remaining": count}
+        cursor = since
+        try:
+            while self.progress["remaining"] > 0:
+                for address, dataset in self._fetch_batch(self.progress["remaining"]):
+                    date = self._dataset_date(dataset)
+                    if since is not None and date is not None and date <= since["date"]:
+                        # memory was reset and refilled meanwhile
+                        self.progress["remaining"] = 0
+                        break
+                    if self.progress["done"] == 0 and date is not None:
+                        cursor = {"address": address, "date": date}
+                    self.progress["done"] += 1
+                    self.progress["remaining"] -= 1
+                    yield dataset
+        except BaseException:
+            # also reached if the download is not iterated to the end
+            try:
+                self._end_read(False)
+            except ConnectionError:
+                # report the original error
+                self._count = None
+                self._address = None
+            raise
+        self._end_read(True)
+        self.cursor = cursor
+
+    def sync(self, cursor_file, total_timeout=None):
+        """
+        Download the datasets stored since the last sync, newest first
+        (see iter_datasets)
+        The cursor, i.e. the address and date of the newest dataset, is kept
+        in cursor_file. It is only updated once all new datasets were
+        downloaded, an interrupted sync is repeated completely the next time.
+        Unlike reset this leaves the memory intact for other consumers.
+        @param cursor_file: path of the file holding the cursor
+        @param total_timeout: float seconds in which the sync has to finish
+            (see constructor)
+        @throws ConnectionError could not get data from BLNet
+        @return generator of Arrays of frame -> value mappings
+        """
+        since = load_cursor(cursor_file)
+        yield from self.iter_datasets(since=since, total_timeout=total_timeout)
+        if self.cursor is not None and self.cursor != since:
+            save_cursor(cursor_file, self.cursor)
+
+    def _get_data(self, max_count=None, total_timeout=None):
+        return list(self.iter_datasets(max_count, total_timeout=total_timeout))
+
+    def _start_operation(self, total_timeout=None):
+        """
+        Set the deadline for an operation consisting of several commands
+        @param total_timeout: float seconds for the operation, default of the
+            instance if None
+        """
+        if total_timeout is None:
+            total_timeout = self.total_timeout
+        self._deadline = monotonic() + total_timeout if total_timeout else None
+        # a connection left open by a former operation is checked once
+        self._idle = self._socket is not None
+
+    def _command_deadline(self, timeout=None):
+        """
+        Deadline for the next command, bounded by the deadline of the operation
+        @param timeout: float overriding the timeout of the instance
+        @return monotonic time or None for no deadline
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = monotonic() + timeout if timeout else None
+        if self._deadline is not None:
+            deadline = min(deadline or self._deadline, self._deadline)
+        return deadline
 
     def _check_mode(self):
         """
@@ -148,28 +708,59 @@ class BLNETDirect(object):
         @throws ConnectionError Mode not supported
         """
         self._connect()
-        self._mode = self._query(GET_MODE, 1)
-        self._disconnect()
+        self._mode = bytes(self._query(GET_MODE, 1))
+        self._release()
+        self._mode_stale = False
+        return self._supported_mode()
 
-        if self._mode in [CAN_MODE, DL2_MODE, DL_MODE]:
-            return True
-        raise ConnectionError("BL-Net mode is not supported")
+    def _cache_key(self):
+        return "{}:{}".format(self.address, self.port)
+
+    def _cached_layout(self):
+        """
+        Use the mode and memory layout of the layout cache
+        @return whether the layout was known
+        """
+        if self.layout_cache is None:
+            return False
+        layout = self.layout_cache.get(self._cache_key())
+        if layout is None:
+            return False
+        self._apply_layout(layout)
+        return True
+
+    def _invalidate_layout(self):
+        self._mode_stale = True
+        if self.layout_cache is not None:
+            self.layout_cache.invalidate(self._cache_key())
 
     def _connect(self):
         """
         Connect to bootloader via TCP
+        An open connection is reused, if it was kept open between operations
+        it is checked to be still healthy first
         @throws ConnectionError Connection failed
         """
+        if self._idle:
+            self._idle = False
+            if self._socket is not None and not self._healthy():
+                self._disconnect()
         if self._socket is None:
+            self._fresh = True
+            deadline = self._command_deadline()
             available = getaddrinfo(
                 self.address, self.port, 0, SOCK_STREAM, IPPROTO_TCP
             )
             for (family, socktype, proto, _, sockaddr) in available:
                 try:
                     self._socket = socket(family, socktype, proto)
+                    if deadline is not None:
+                        self._socket.settimeout(max(deadline - monotonic(), 0.001))
                     self._socket.connect(sockaddr)
                     break
                 except:
+                    if self._socket is not None:
+                        self._socket.close()
                     self._socket = None
             if self._socket is None:
                 raise ConnectionError("Could not connect to BLNET")
@@ -181,26 +772,123 @@ class BLNETDirect(object):
         self._socket.close()
         self._socket = None
 
-    def _query(self, command, length):
+    def _release(self):
         """
-        Send a command to the bootloader and wait for the response
-        if response is less then 32 bytes long return immediately
+        Operation on the bootloader finished,
+        disconnect unless the connection is persistent
+        """
+        if not self.persistent:
+            self._disconnect()
+        else:
+            self._idle = True
+
+    def _healthy(self):
+        """
+        Check that an open connection was not closed by the bootloader
+        Unread leftovers of aborted responses are discarded.
+        @return boolean
+        """
+        timeout = self._socket.gettimeout()
+        try:
+            self._socket.setblocking(False)
+            while True:
+                if not self._socket.recv(DATASET_SIZE):
+                    return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            self._socket.settimeout(timeout)
+
+    def _query(self, command, length, prefix=None, size=None, timeout=None):
+        """
+        Send a command to the bootloader and receive exactly the expected number
+        of bytes as response into a preallocated buffer
+        The whole response has to arrive within timeout seconds.
         @param commmand: string only ascii (needs byte length == string length)
-        @param length: int length of response
+        @param length: int length of response (maximum length if size is given)
+        @param prefix: int length of the part of the response determining its length
+        @param size: function returning the length of the response given its prefix
+        @param timeout: float overriding the timeout of the connection
         @throws ConnectionError error when querying
-        @return Binary: byte string
+        @return Binary: memoryview on the response
         """
-        if len(command) == self._socket.send(command):
-            data = b""
-            # get response until length or less than 32 bytes
-            while True:
-                data += self._socket.recv(length)
-                if len(data) <= 32 or len(data) >= length:
-                    break
-            return data
+        try:
+            response = self._exchange(command, length, prefix, size, timeout)
+        except ConnectionError:
+            if not self.persistent or self._fresh:
+                raise
+            # the BL-Net dropped the reused connection, try once more
+            self._connect()
+            response = self._exchange(command, length, prefix, size, timeout)
+        self._fresh = False
+        return response
 
-        self._disconnect()
-        raise ConnectionError("Error while querying command {}".format(command))
+    def _exchange(self, command, length, prefix, size, timeout=None):
+        """
+        Send a command and receive its response on the current connection
+        (see _query)
+        """
+        try:
+            sent = self._socket.send(command)
+        except OSError as e:
+            # e.g. the BL-Net reset the connection
+            self._disconnect()
+            raise ConnectionError(
+                "Error while querying command {}: {}".format(command, e)
+            )
+        if len(command) != sent:
+            self._disconnect()
+            raise ConnectionError("Error while querying command {}".format(command))
+
+        deadline = self._command_deadline(timeout)
+        buffer = memoryview(bytearray(length))
+        received = 0
+        if size is not None:
+            self._receive(buffer[:prefix], deadline)
+            received = prefix
+            length = size(buffer[:prefix])
+            if not prefix <= length <= len(buffer):
+                self._invalidate_layout()
+                self._disconnect()
+                raise ConnectionError(
+                    "Unexpected response length {} to command {}".format(
+                        length, command
+                    )
+                )
+        self._receive(buffer[received:length], deadline)
+        return buffer[:length]
+
+    def _receive(self, view, deadline=None):
+        """
+        Fill the given buffer with the response of the bootloader
+        @param view: memoryview to receive into
+        @param deadline: monotonic time until which the buffer has to be filled
+        @throws IncompleteResponse deadline exceeded
+        @throws ConnectionError connection closed
+        """
+        received = 0
+        try:
+            while received < len(view):
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        raise IncompleteResponse("Timeout while receiving response")
+                    self._socket.settimeout(remaining)
+                count = self._socket.recv_into(view[received:])
+                if not count:
+                    raise ConnectionError("Connection closed by BLNET")
+                received += count
+        except ConnectionError:
+            self._disconnect()
+            raise
+        except SocketTimeout:
+            self._disconnect()
+            raise IncompleteResponse("Timeout while receiving response")
+        except OSError as e:
+            self._disconnect()
+            raise ConnectionError("Error while receiving response: {}".format(e))
 
     def _start_read(self):
         """
@@ -209,22 +897,6 @@ class BLNETDirect(object):
         """
         return self.get_count()
 
-    def _checksum(self, data):
-        """
-        Verify the checksum
-        @param byte string $data Binary string to check
-        @return boolean
-        """
-        binary = struct.unpack("<{}B".format(len(data)), data)
-        checksum = binary[-1]
-
-        sum = 0
-        # build sum
-        for byte in binary[:-1]:
-            sum += byte
-        # verify
-        return sum % 256 == checksum
-
     def _fetch_data(self):
         """
         Fetch datasets from bootloader memory
@@ -234,63 +906,94 @@ class BLNETDirect(object):
         if self._count and self._count > 0:
             self._connect()
 
-            # build address for bootloader
-            addresses = [
-                self._address & 0xFF,
-                (self._address & 0x7F00) >> 7,
-                (self._address & 0xFF8000) >> 15,
-            ]
-
-            # build command
-            command = struct.pack(
-                "<6B",
-                READ_DATA,
-                addresses[0],
-                addresses[1],
-                addresses[2],
-                1,
-                (READ_DATA + 1 + sum(addresses)) % 256,
-            )
-
-            data = self._query(command, self._fetch_size)
+            data = self._query(self._read_data_command(), self._fetch_size)
 
             if self._checksum(data):
-                # increment address
-                self._address -= self._address_inc
-                if self._address < 0:
-                    self._address = self._address_end
-                self._count -= 1
+                self._advance()
                 return self._split_datasets(data)
+            self._invalidate_layout()
             raise ConnectionError("Could not retreive data")
 
-    def _split_datasets(self, data):
+    def _count_since(self, since, count):
         """
-        split binary string in datasets and parse dataset values
-        @param data: byte string
-        @return Array of frame -> value mappings
+        Number of datasets to download after the cursor of a previous download
+        The address of the cursor only bounds the download while the dataset
+        stored there is still the one of the cursor. Otherwise (the memory
+        is full, wrapped past the cursor or was reset) the download stops at
+        the first dataset not newer than the cursor.
+        @param since: cursor of the previous download
+        @param count: int number of stored datasets
+        @return int
         """
-        frames = {}
-        if self._mode == CAN_MODE:
-            for frame in range(0, self._can_frames):
-                frames[frame] = BLNETParser(
-                    data[3 + DATASET_SIZE * frame : 3 + DATASET_SIZE * (frame + 1)]
-                )
-        elif self._mode == DL_MODE:
-            frames[0] = BLNETParser(data[:DATASET_SIZE])
-        elif self._mode == DL2_MODE:
-            frames[0] = BLNETParser(data[:DATASET_SIZE])
-            frames[1] = BLNETParser(
-                data[3 + DATASET_SIZE : 3 + DATASET_SIZE + DATASET_SIZE]
-            )
+        if count == (self._address_end + self._address_inc) // self._address_inc:
+            return count
+        since_count = self._datasets_since(since["address"])
+        if since_count >= count:
+            return count
+        address = self._address
+        self._address = since["address"]
+        try:
+            dataset = self._fetch_data()
+        finally:
+            self._address = address
+            self._count = count
+        if self._dataset_date(dataset) != since["date"]:
+            return count
+        return since_count
 
-        start = 0
+    def _fetch_batch(self, limit):
+        """
+        Fetch datasets from bootloader memory, newest first
+        Up to batch_size datasets are requested with one command, as long
+        as they do not wrap around the end of the memory.
+        @param limit: int maximum number of datasets to fetch
+        @throws: ConnectionError Data could not be retreived
+        @return list of (address, Array of frame -> value mappings)
+        """
+        count = min(limit, self.batch_size, self._address // self._address_inc + 1)
+        if count > 1 and self._batches is not False:
+            try:
+                return self._fetch_datasets(count)
+            except IncompleteResponse:
+                if self._batches:
+                    raise
+                # BL-Net only answered one dataset, fall back to single datasets
+                self._batches = False
+        address = self._address
+        return [(address, self._fetch_data())]
 
-        if self._mode == CAN_MODE:
-            start = 3
-        if data[start : start + DATASET_SIZE - 6] == b"0x00" * (DATASET_SIZE - 6):
-            return False
-        else:
-            return {k: v.to_dict() for k, v in frames.items()}
+    def _batch_probe_timeout(self):
+        if self.timeout:
+            return min(self.timeout, BATCH_PROBE_TIMEOUT)
+        return BATCH_PROBE_TIMEOUT
+
+    def _fetch_datasets(self, count):
+        """
+        Fetch count datasets ending at the current address with one command
+        Every dataset in the response carries its own checksum.
+        @throws: ConnectionError Data could not be retreived
+        @return list of (address, Array of frame -> value mappings), newest first
+        """
+        self._connect()
+        first = self._address - (count - 1) * self._address_inc
+        data = self._query(
+            self._read_data_command(first, count),
+            count * self._fetch_size,
+            timeout=None if self._batches else self._batch_probe_timeout(),
+        )
+        records = [
+            data[index * self._fetch_size : (index + 1) * self._fetch_size]
+            for index in range(count)
+        ]
+        if not all(self._checksum(record) for record in records):
+            self._invalidate_layout()
+            raise ConnectionError("Could not retreive data")
+        self._batches = True
+        datasets = []
+        for record in reversed(records):
+            datasets.append((self._address, self._split_datasets(record)))
+            self._advance()
+        return datasets
 
     def _end_read(self, success=True):
         """
@@ -306,67 +1009,62 @@ class BLNETDirect(object):
                 raise ConnectionError("Reset memory failed")
         self._count = None
         self._address = None
-        self._disconnect()
+        self._release()
 
-    def get_latest(self, max_retries=MAX_RETRYS):
+    def get_latest(self, max_retries=MAX_RETRYS, total_timeout=None):
         """
         Fetch latest (current) data from the BLNet
+        If the BLNet asks to wait for a CAN frame, the other frames are fetched
+        meanwhile (see LatestSchedule). Frames without values after max_retries
+        requests are "timeout", info["received"] tells when the values of
+        every other frame arrived.
+        Frames that would only be ready after total_timeout (see constructor)
+        are "timeout" as well.
         @throws checksum error
         @throws ConnectionError could not get data from BLNet
         @return Array of frame -> value mappings
         """
+        self._start_operation(total_timeout)
+        try:
+            return self._get_latest(max_retries)
+        finally:
+            self._deadline = None
+
+    def _get_latest(self, max_retries):
         self._connect()
-        self.get_count()
-        frames = {}
-        info = {"sleep": {}, "got": {}}
+        if not self._cached_layout():
+            self.get_count()
+        schedule = LatestSchedule(self._can_frames, max_retries)
 
-        # for all frames
-        for frame in range(0, self._can_frames):
-            # build command
+        while not schedule.done():
+            frame, delay = schedule.next_frame()
+            if delay > 0:
+                if self._deadline is not None and monotonic() + delay > self._deadline:
+                    # no pending frame will be ready in time
+                    schedule.give_up()
+                    break
+                self._release()
+                # wait until the frame is ready
+                sleep(delay)
+                self._connect()
             command = struct.pack("<2B", GET_LATEST, frame + 1)
-            # try 4 times
-            sleeps = []
-            for n in range(0, max_retries):
-                data = self._query(command, self._actual_size)
-
-                if self._checksum(data):
-                    binary = struct.unpack("<{}".format("B" * len(data)), data)
-
-                    if binary[0] == WAIT_TIME:
-                        sleeps.append(binary[1])
-                        self._disconnect()
-                        # wait some seconds
-                        sleep(binary[1])
-                        self._connect()
-                    else:
-                        info["got"][frame] = n
-                        frames.update(self._split_latest(data, frame))
-                        break
-            # TODO this looks suspicious
-            if n == max_retries - 1:
-                frames[frame] = "timeout"
-            info["sleep"][frame] = sleeps
+            data = self._query(command, self._actual_size, 1, self._latest_size)
+
+            if self._checksum(data):
+                if data[0] == WAIT_TIME:
+                    schedule.wait(frame, data[1])
+                else:
+                    schedule.received(frame, self._split_latest(data, frame))
+            else:
+                self._invalidate_layout()
+                # start over on a new connection in case the response was longer
+                self._disconnect()
+                self._connect()
+            schedule.tried(frame)
+        frames, info = schedule.frames, schedule.info
         self._end_read(True)
         if len(frames) > 0:
             frames["date"] = datetime.now()
             frames["info"] = info
             return frames
         raise ConnectionError("Could not get latest data")
-
-    def _split_latest(self, data, frame):
-        """
-        Split binary string by fetch latest
-        @param data: bytestring
-        @param frame: int
-        @return Array of frame -> value mappings
-        """
-        frames = {}
-        if self._mode == CAN_MODE:
-            frames[frame] = BLNETParser(data[1 : LATEST_SIZE + 1])
-        elif self._mode == DL_MODE:
-            frames[0] = BLNETParser(data[1 : LATEST_SIZE + 1])
-        elif self._mode == DL2_MODE:
-            frames[0] = BLNETParser(data[1 : LATEST_SIZE + 1])
-            frames[1] = BLNETParser(data[LATEST_SIZE + 1 : 2 * LATEST_SIZE + 1])
-
-        return {k: v.to_dict() for k, v in frames.items()}
@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 18.10.2026
+
+The PC-BLNET bootloader protocol (see blnet_conn) on asyncio streams
+
+@author: Nielstron
+"""
+
+import asyncio
+import struct
+from datetime import datetime
+
+from .blnet_conn import (
+    BLNETProtocol,
+    LatestSchedule,
+    GET_MODE,
+    GET_HEADER,
+    GET_LATEST,
+    END_READ,
+    RESET_DATA,
+    WAIT_TIME,
+    MAX_RETRYS,
+    HEADER_PREFIX_SIZE,
+    HEADER_SIZE,
+    MAX_CAN_FRAMES,
+    OUTPUT_DICT,
+    _OUTPUT_PARSERS,
+)
+
+# Errors of failed queries (refused or reset connections, cut off responses
+# and timeouts), cancellation is not included
+QUERY_ERRORS = (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError)
+
+
+class AsyncBLNETDirect(BLNETProtocol):
+    """
+    A class for establishing a direct connection to the BLNET (rather than
+    scraping the web interface) from an asyncio event loop
+    All I/O methods are coroutines that can be cancelled, waits requested by
+    the BLNET do not block the event loop.
+    The bootloader mode is checked on the first operation.
+    An instance must not be used by several tasks at the same time.
+    """
+
+    def __init__(
+        self,
+        address,
+        port: int = 40000,
+        reset: bool = False,
+        timeout: float = 60,
+        persistent: bool = False,
+        output: str = OUTPUT_DICT,
+    ):
+        """
+        Constructor
+        :param address: string, Address of the BL-Net device
+        :param port: integer, Port of the bl-net device for connection
+        :param reset: boolean, delete data on BL-Net after data receive
+        :param timeout: float, timeout in seconds for every query
+        :param persistent: boolean, keep the connection open between operations
+            (see BLNETDirect)
+        :param output: string, type of the returned datasets (see BLNETDirect)
+        """
+        assert isinstance(address, str)
+        assert isinstance(port, int)
+        assert isinstance(reset, bool)
+        assert isinstance(persistent, bool)
+        assert output in _OUTPUT_PARSERS
+        self.address = address
+        self.port = port
+        self.reset = reset
+        self.timeout = timeout
+        self.persistent = persistent
+        self.output = output
+        self._reader = None
+        self._writer = None
+        # connection has not yet been used for a complete query
+        self._fresh = False
+
+    async def __aenter__(self):
+        await self._check_mode()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection to the bootloader (if still open)
+        """
+        if self._writer is not None:
+            self._disconnect()
+
+    async def get_count(self):
+        """
+        Get the number of datasets in the bootloader memory
+        @return number of datasets in bootloader memory
+        """
+        await self._check_mode()
+        if self._count is None:
+            await self._connect()
+            data = await self._query(
+                GET_HEADER,
+                HEADER_SIZE + MAX_CAN_FRAMES,
+                HEADER_PREFIX_SIZE,
+                self._header_size,
+            )
+            self._read_header(data)
+        if self._count is None:
+            raise ConnectionError("Could not retreive count")
+        return self._count
+
+    async def get_latest(self, max_retries=MAX_RETRYS):
+        """
+        Fetch latest (current) data from the BLNet (see BLNETDirect.get_latest)
+        @throws ConnectionError could not get data from BLNet
+        @return Array of frame -> value mappings
+        """
+        await self.get_count()
+        schedule = LatestSchedule(self._can_frames, max_retries)
+
+        while not schedule.done():
+            frame, delay = schedule.next_frame()
+            if delay > 0:
+                self._release()
+                # wait until the frame is ready
+                await asyncio.sleep(delay)
+            await self._connect()
+            command = struct.pack("<2B", GET_LATEST, frame + 1)
+            data = await self._query(command, self._actual_size, 1, self._latest_size)
+
+            if self._checksum(data):
+                if data[0] == WAIT_TIME:
+                    schedule.wait(frame, data[1])
+                else:
+                    schedule.received(frame, self._split_latest(data, frame))
+            else:
+                # start over on a new connection in case the response was longer
+                self._disconnect()
+                await self._connect()
+            schedule.tried(frame)
+        frames, info = schedule.frames, schedule.info
+        await self._end_read(True)
+        if len(frames) > 0:
+            frames["date"] = datetime.now()
+            frames["info"] = info
+            return frames
+        raise ConnectionError("Could not get latest data")
+
+    async def get_data(self, max_count=None):
+        """
+        Download the datasets stored in the bootloader memory, newest first
+        @param max_count: int maximum number of datasets to download
+        @throws ConnectionError could not get data from BLNet
+        @return list of Arrays of frame -> value mappings
+        """
+        data = []
+        count = await self.get_count()
+        if isinstance(max_count, int):
+            count = min(max_count, count)
+        try:
+            for _ in range(0, count):
+                data.append(await self._fetch_data())
+        except BaseException:
+            try:
+                await self._end_read(False)
+            except ConnectionError:
+                # an error while ending a failed download does not hide
+                # the original error
+                self._count = None
+                self._address = None
+            raise
+        await self._end_read(True)
+        return data
+
+    async def _fetch_data(self):
+        """
+        Fetch the dataset at the current address from bootloader memory
+        @throws: ConnectionError Data could not be retreived
+        @return Array of frame -> value mappings
+        """
+        await self._connect()
+        data = await self._query(self._read_data_command(), self._fetch_size)
+        if self._checksum(data):
+            self._advance()
+            return self._split_datasets(data)
+        raise ConnectionError("Could not retreive data")
+
+    async def _end_read(self, success=True):
+        """
+        End read, reset memory on bootloader
+        """
+        await self._connect()
+        # Send end read command
+        if await self._query(END_READ, 1) != END_READ:
+            raise ConnectionError("End read command failed")
+        # reset data if configured
+        if success and self.reset:
+            if await self._query(RESET_DATA, 1) != RESET_DATA:
+                raise ConnectionError("Reset memory failed")
+        self._count = None
+        self._address = None
+        self._release()
+
+    async def _check_mode(self):
+        """
+        Check if Bootloader Mode is supported, only asks the BLNET once
+        @throws ConnectionError Mode not supported
+        """
+        if self._mode is None:
+            await self._connect()
+            self._mode = await self._query(GET_MODE, 1)
+            self._release()
+        return self._supported_mode()
+
+    async def _connect(self):
+        """
+        Connect to bootloader via TCP
+        An open connection is reused if the BLNET did not close it
+        @throws ConnectionError Connection failed
+        """
+        if self._writer is not None and self._reader.at_eof():
+            self._disconnect()
+        if self._writer is None:
+            self._fresh = True
+            try:
+                self._reader, self._writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.address, self.port), self.timeout
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                raise ConnectionError("Could not connect to BLNET: {}".format(e))
+
+    def _disconnect(self):
+        """
+        Disconnect from bootloader via TCP
+        """
+        self._writer.close()
+        self._reader = None
+        self._writer = None
+
+    def _release(self):
+        """
+        Operation on the bootloader finished,
+        disconnect unless the connection is persistent
+        """
+        if not self.persistent:
+            self._disconnect()
+
+    async def _query(self, command, length, prefix=None, size=None):
+        """
+        Send a command to the bootloader and receive exactly the expected number
+        of bytes as response (see BLNETDirect._query)
+        The whole response has to arrive within timeout seconds.
+        @throws ConnectionError error when querying
+        @return Binary: byte string
+        """
+        try:
+            response = await self._exchange(command, length, prefix, size)
+        except ConnectionError:
+            if not self.persistent or self._fresh:
+                raise
+            # the BL-Net dropped the reused connection, try once more
+            await self._connect()
+            response = await self._exchange(command, length, prefix, size)
+        self._fresh = False
+        return response
+
+    async def _exchange(self, command, length, prefix, size):
+        """
+        Send a command and receive its response on the current connection
+        """
+        try:
+            return await asyncio.wait_for(
+                self._transfer(command, length, prefix, size), self.timeout
+            )
+        except QUERY_ERRORS as e:
+            self._disconnect()
+            raise ConnectionError(
+                "Error while querying command {}: {!r}".format(command, e)
+            )
+        except asyncio.CancelledError:
+            # the rest of the response would be mistaken for the next one
+            self._disconnect()
+            raise
+
+    async def _transfer(self, command, length, prefix, size):
+        self._writer.write(command)
+        await self._writer.drain()
+        if size is None:
+            return await self._reader.readexactly(length)
+        data = await self._reader.readexactly(prefix)
+        total = size(data)
+        if not prefix <= total <= length:
+            raise ConnectionError(
+                "Unexpected response length {} to command {}".format(total, command)
+            )
+        return data + await self._reader.readexactly(total - prefix)
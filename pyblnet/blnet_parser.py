@@ -9,7 +9,9 @@ https://github.com/berwinter/uvr1611/blob/master/lib/backend/blnet-connection.in
 author: Niels
 """
 import struct
+from array import array
 from datetime import datetime
+from functools import cached_property
 
 # Parser constant
 # 1 bit
@@ -33,64 +35,68 @@ RAS_POSITIVE_MASK = 0x01FF
 # 32 bit
 INT32_MASK = 0xFFFFFFFF
 INT32_SIGN = 0x80000000
+# Channel numbers
+ANALOG_CHANNELS = range(1, 17)
+DIGITAL_CHANNELS = range(1, 17)
+SPEED_CHANNELS = range(1, 5)
+METER_CHANNELS = range(1, 3)
+# Value groups of a parsed dataset
+FIELDS = ("analog", "digital", "speed", "energy", "power")
 
 
 class BLNETParser:
+    # Conversions of all raw values, built on first use and shared by all instances
+    _analog_table = None
+    _speed_table = None
+    _digital_table = None
+
     def __init__(self, data):
         """
         parse a binary string containing a dataset
         Provides access to the values of a dataset as object properties
         @param data: byte string
         """
+        _check_size(data)
         # check if dataset contains time information
         # (fetched from bootloader storage)
         if len(data) == 61:
-            (_, seconds, minutes, hours, days, months, years) = struct.unpack(
-                "<55sBBBBBB", data
+            self.date = _decode_date(data)
+
+        # Only parse preceding data, read in place without copying slices
+        digital, speed, active, *meters = struct.unpack_from("<H4sBLHHLHH", data, 32)
+        self.analog = _decode_analog(struct.unpack_from("<16H", data))
+        self.digital = _decode_digital(digital)
+        self.speed = _decode_speed(speed)
+        self.energy = _decode_energy(active, meters)
+        self.power = _decode_power(active, meters)
+
+    @staticmethod
+    def _get_tables():
+        """
+        Lookup tables of the rounded analog value of every 16 bit word,
+        the speed of every byte and the digital bits of every byte
+        They are stored on BLNETParser, such that subclasses share them.
+        @return tuple of analog, speed and digital table
+        """
+        if BLNETParser._analog_table is None:
+            converter = BLNETParser.__new__(BLNETParser)
+            BLNETParser._speed_table = tuple(
+                map(converter._convert_speed, range(0x100))
             )
-            self.date = datetime(2000 + years, months, days, hours, minutes, seconds)
-
-        # Only parse preceding data
-        data = data[:55]
-        power = [0, 0]
-        kWh = [0, 0]
-        MWh = [0, 0]
-        (
-            _,
-            digital,
-            speed,
-            active,
-            power[0],
-            kWh[0],
-            MWh[0],
-            power[1],
-            kWh[1],
-            MWh[1],
-        ) = struct.unpack("<32sH4sBLHHLHH", data)
-
-        analog = struct.unpack("<{}{}".format("H" * 16, "x" * (len(data) - 32)), data)
-
-        self.analog = {}
-        for channel in range(0, 16):
-            self.analog[channel + 1] = round(self._convert_analog(analog[channel]), 3)
-
-        self.digital = {}
-        for channel in range(0, 16):
-            self.digital[channel + 1] = self._convert_digital(digital, channel)
-
-        self.speed = {}
-        for idx, value in enumerate(speed):
-            self.speed[idx + 1] = self._convert_speed(value)
-
-        self.energy = {}
-        for channel in range(0, 2):
-            energy = self._convert_energy(MWh[channel], kWh[channel], active, channel)
-            self.energy[channel + 1] = energy
-
-        self.power = {}
-        for idx, value in enumerate(power):
-            power = self._convert_power(value, active, idx)
-            self.power[idx + 1] = power
+            BLNETParser._digital_table = tuple(
+                tuple(converter._convert_digital(value, bit) for bit in range(8))
+                for value in range(0x100)
+            )
+            # set last, the other tables are complete once this one exists
+            BLNETParser._analog_table = tuple(
+                round(converter._convert_analog(value), 3)
+                for value in range(INT16_POSITIVE_MASK + 1)
+            )
+        return (
+            BLNETParser._analog_table,
+            BLNETParser._speed_table,
+            BLNETParser._digital_table,
+        )
 
     def to_dict(self):
         """
@@ -169,3 +175,219 @@ class BLNETParser:
         if value & signbit:
             result = -((result ^ positive_mask) + 1)
         return result * multiplier
+
+
+# Converts the energy and power of the heat meters
+_CONVERTER = BLNETParser.__new__(BLNETParser)
+
+
+# Decoding of the parts of a dataset, shared by all parsers
+
+
+def _check_size(data):
+    """
+    @throws ValueError dataset too short
+    """
+    if len(data) < 55:
+        raise ValueError("Dataset too short: {} bytes".format(len(data)))
+
+
+def _decode_date(data):
+    """
+    @param data: byte string of a dataset of 61 bytes
+    @throws ValueError invalid date
+    @return datetime of the recording
+    """
+    seconds, minutes, hours, days, months, years = struct.unpack_from(
+        "<BBBBBB", data, 55
+    )
+    return datetime(2000 + years, months, days, hours, minutes, seconds)
+
+
+def _decode_analog(analog):
+    """
+    @param analog: sequence of the 16 raw analog values
+    @return dict of channel -> value
+    """
+    analog_table, _, _ = BLNETParser._get_tables()
+    return dict(zip(ANALOG_CHANNELS, map(analog_table.__getitem__, analog)))
+
+
+def _decode_digital(digital):
+    """
+    @param digital: 16 bit int of the digital values
+    @return dict of channel -> DIGITAL_ON/DIGITAL_OFF
+    """
+    _, _, digital_table = BLNETParser._get_tables()
+    bits = digital_table[digital & 0xFF] + digital_table[digital >> 8]
+    return dict(zip(DIGITAL_CHANNELS, bits))
+
+
+def _decode_speed(speed):
+    """
+    @param speed: 4 raw speed bytes
+    @return dict of channel -> speed, None if inactive
+    """
+    _, speed_table, _ = BLNETParser._get_tables()
+    return dict(zip(SPEED_CHANNELS, map(speed_table.__getitem__, speed)))
+
+
+def _decode_energy(active, meters):
+    """
+    @param active: byte of the active heat meters
+    @param meters: power, kWh and MWh of both heat meters
+    @return dict of channel -> energy, None if inactive
+    """
+    return {
+        channel: _CONVERTER._convert_energy(
+            meters[3 * position + 2], meters[3 * position + 1], active, position
+        )
+        for position, channel in enumerate(METER_CHANNELS)
+    }
+
+
+def _decode_power(active, meters):
+    """
+    @param active: byte of the active heat meters
+    @param meters: power, kWh and MWh of both heat meters
+    @return dict of channel -> power, None if inactive
+    """
+    return {
+        channel: _CONVERTER._convert_power(meters[3 * position], active, position)
+        for position, channel in enumerate(METER_CHANNELS)
+    }
+
+
+class _DatasetAccess(object):
+    """
+    Access to the value groups of a parsed dataset like to the dict of
+    BLNETParser.to_dict, the groups are provided as attributes
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if key in FIELDS or (key == "date" and self._dated()):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def to_dict(self):
+        """
+        Convert the dataset into the dict returned by BLNETParser.to_dict
+        @return dict
+        """
+        result = {"date": self.date} if self._dated() else {}
+        for field in FIELDS:
+            result[field] = getattr(self, field)
+        return result
+
+    def _dated(self):
+        """
+        @return whether the dataset contains the time of recording
+        """
+        return getattr(self, "date", None) is not None
+
+
+class BLNETRecord(_DatasetAccess):
+    """
+    Compact alternative to the dict of BLNETParser for holding many datasets
+    The raw values are kept in arrays and only converted when accessed,
+    record["analog"] or record.analog gives the same dict as BLNETParser.
+    """
+
+    __slots__ = ("_analog", "_digital", "_speed", "_active", "_meters", "date")
+
+    def __init__(self, data):
+        """
+        @param data: byte string (see BLNETParser)
+        @throws ValueError dataset too short or invalid date
+        """
+        _check_size(data)
+        self.date = _decode_date(data) if len(data) == 61 else None
+        self._analog = array("H", struct.unpack_from("<16H", data))
+        digital, self._speed, self._active = struct.unpack_from("<H4sB", data, 32)
+        self._digital = digital
+        # power, kWh and MWh of both heat meters
+        self._meters = array("L", struct.unpack_from("<LHHLHH", data, 39))
+
+    @property
+    def analog(self):
+        return _decode_analog(self._analog)
+
+    @property
+    def digital(self):
+        return _decode_digital(self._digital)
+
+    @property
+    def speed(self):
+        return _decode_speed(self._speed)
+
+    @property
+    def energy(self):
+        return _decode_energy(self._active, self._meters)
+
+    @property
+    def power(self):
+        return _decode_power(self._active, self._meters)
+
+
+class LazyBLNETParser(_DatasetAccess, BLNETParser):
+    """
+    Parser that keeps the raw dataset and decodes each value group
+    (see FIELDS and date) when it is first accessed, the result is cached
+    Filtering many datasets by a few values thus skips decoding the rest,
+    an invalid time of recording is only raised when date is accessed.
+    """
+
+    def __init__(self, data):
+        """
+        @param data: byte string (see BLNETParser)
+        @throws ValueError dataset too short
+        """
+        _check_size(data)
+        # copy, the data may be a view on a reused buffer
+        self._data = bytes(data)
+
+    def _dated(self):
+        return len(self._data) == 61
+
+    @cached_property
+    def date(self):
+        if not self._dated():
+            raise AttributeError("Dataset contains no time of recording")
+        return _decode_date(self._data)
+
+    @cached_property
+    def analog(self):
+        return _decode_analog(struct.unpack_from("<16H", self._data))
+
+    @cached_property
+    def digital(self):
+        (digital,) = struct.unpack_from("<H", self._data, 32)
+        return _decode_digital(digital)
+
+    @cached_property
+    def speed(self):
+        return _decode_speed(self._data[34:38])
+
+    @cached_property
+    def energy(self):
+        active, *meters = self._meters()
+        return _decode_energy(active, meters)
+
+    @cached_property
+    def power(self):
+        active, *meters = self._meters()
+        return _decode_power(active, meters)
+
+    def _meters(self):
+        """
+        @return tuple of the active heat meters and power, kWh and MWh of both
+        """
+        return struct.unpack_from("<BLHHLHH", self._data, 38)
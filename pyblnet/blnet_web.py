@@ -10,22 +10,74 @@ via it's HTTP-interface
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
 from htmldom import htmldom
+import codecs
+import hashlib
 import html
 import re
+import sys
+from http.cookiejar import DefaultCookiePolicy
+from time import monotonic
 from builtins import int
 
+# Parser backends for the value pages
+# htmldom builds the whole DOM tree and is the reference implementation
+PARSER_HTMLDOM = "htmldom"
+# fast scans the raw page for the data block
+PARSER_FAST = "fast"
 
-def blnet_test(ip, timeout=5, id=0):
+ANALOG_PATTERN = re.compile(
+    r"(?P<id>\d+):&nbsp;(?P<name>.+)\n(&nbsp;){3,6}(?P<value>(-&nbsp;)?\d+,\d+) (?P<unit_of_measurement>.+?) &nbsp;&nbsp;PAR?"
+)
+DIGITAL_PATTERN = re.compile(
+    r"(?P<id>\d+):&nbsp;(?P<name>.+)\n&nbsp;&nbsp;&nbsp;&nbsp;(?P<mode>(AUTO|HAND))/(?P<value>(AUS|EIN))"
+)
+# Patterns that only extract ids and values, names and units are known
+ANALOG_VALUE_PATTERN = re.compile(
+    r"(?P<id>\d+):&nbsp;.+\n(&nbsp;){3,6}(?P<value>(-&nbsp;)?\d+,\d+) .+? &nbsp;&nbsp;PAR?"
+)
+DIGITAL_VALUE_PATTERN = re.compile(
+    r"(?P<id>\d+):&nbsp;.+\n&nbsp;&nbsp;&nbsp;&nbsp;(?P<mode>(AUTO|HAND))/(?P<value>(AUS|EIN))"
+)
+_DIV_TAG = re.compile(r"<(/?)div\b[^>]*>", re.IGNORECASE)
+_CLASS_ATTRIBUTE = re.compile(
+    r"""\bclass\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE
+)
+_BR_TAG = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+_TITLE = re.compile(r"<title[^>]*>(.*?)</title>", re.IGNORECASE | re.DOTALL)
+
+# Size of the chunks in which value pages are streamed
+STREAM_CHUNK_SIZE = 512
+
+# Seconds after which a TAID that was not confirmed by the BLNET is probed again
+# (the BLNET ends sessions after some time without requests)
+SESSION_TTL = 60
+
+# Seconds after which the names and units of the channels are parsed again
+METADATA_TTL = 3600
+
+# Seconds for which a successful blnet_test of an address is remembered
+PROBE_TTL = 300
+# address -> monotonic time of the last successful blnet_test
+_probe_cache = {}
+
+
+def blnet_test(ip, timeout=5, id=0, session=None):
     """
     Tests whether an BLNET answers under given ip
     Attributes:
         ip      IP of the BLNET
+        session requests.Session to send the request with (optional)
     """
     if not ip.startswith("http://") and not ip.startswith("https://"):
         ip = "http://" + ip
+    if session is None:
+        session = requests
     try:
-        r = requests.get(ip, timeout=timeout)
+        r = session.get(ip, timeout=timeout)
     except requests.exceptions.RequestException:
         return False
     # Parse  DOM object from HTMLCode
@@ -39,6 +91,520 @@ def blnet_test(ip, timeout=5, id=0):
     return False
 
 
+def _data_block_htmldom(text):
+    """
+    Extracts the text of the block containing the values (the second div.c)
+    by parsing the whole page into a DOM
+    @return text with &nbsp; entities and line breaks for <br>
+            or None if the access was denied
+    """
+    # Parse  DOM object from HTMLCode
+    dom = htmldom.HtmlDom().createDom(text)
+    # Check if we didn't fail in access
+    if "BL-Net Zugang verweigert" in dom.find("title").text():
+        return None
+    # get the element containing the interesting information
+    dom = dom.find("div.c")[1]
+    # in case of access denied or other errors, return None
+    if dom is None:
+        return None
+    # filter out the text
+    return dom.text()
+
+
+def _find_data_block(text):
+    """
+    Finds the block containing the values (the second div.c) in the raw page
+    @return tuple of start and end of the content of the block
+            or None if it is not (completely) contained in the text
+    """
+    return _DataBlockScanner().scan(text)
+
+
+class _DataBlockScanner(object):
+    """
+    Finds the block containing the values (the second div.c) in a page
+    that is received in parts, the text of every part is only scanned once
+    """
+
+    def __init__(self):
+        self.found = 0
+        self.depth = 0
+        self.start = None
+        # position up to which the text was scanned
+        self.position = 0
+
+    def scan(self, text):
+        """
+        @param text: the page received so far, continuing the text of
+                former scans
+        @return tuple of start and end of the content of the block
+                or None if it is not (completely) contained in the text
+        """
+        for match in _DIV_TAG.finditer(text, self.position):
+            self.position = match.end()
+            if self.start is not None:
+                # inside the data block, look for the matching closing tag
+                if match.group(1):
+                    if self.depth == 0:
+                        return self.start, match.start()
+                    self.depth -= 1
+                else:
+                    self.depth += 1
+                continue
+            if match.group(1):
+                continue
+            attribute = _CLASS_ATTRIBUTE.search(match.group(0))
+            if attribute is None or "c" not in "".join(attribute.groups("")).split():
+                continue
+            self.found += 1
+            if self.found == 2:
+                self.start = match.end()
+        # a tag that is not complete yet starts after the last ">"
+        self.position = max(self.position, text.rfind(">") + 1)
+        return None
+
+
+def _data_block_fast(text):
+    """
+    Extracts the text of the block containing the values (the second div.c)
+    by scanning the raw page, equivalent to _data_block_htmldom
+    @return text with &nbsp; entities and line breaks for <br>
+            or None if the access was denied
+    """
+    title = _TITLE.search(text)
+    if title is not None and "BL-Net Zugang verweigert" in title.group(1):
+        return None
+    block = _find_data_block(text)
+    if block is None:
+        return None
+    data_raw = text[block[0] : block[1]]
+    return _TAG.sub("", _BR_TAG.sub("\n", data_raw))
+
+
+_DATA_BLOCK = {
+    PARSER_HTMLDOM: _data_block_htmldom,
+    PARSER_FAST: _data_block_fast,
+}
+# Backends that can parse pages that were cut off after the data block
+_PARTIAL_PAGES = (PARSER_FAST,)
+
+
+def _unescape(value):
+    """
+    Converts html entities to unicode characters
+    """
+    # replace &nbsp; by " " since it is not unescaped as expected
+    return html.unescape(value.replace("&nbsp;", " "))
+
+
+def _analog_value(match):
+    """
+    replace decimal "," by "." and remove "&nbsp;" completely
+    """
+    return match.group("value").replace("&nbsp;", "").replace(",", ".")
+
+
+def _known_matches(data_raw, pattern, channels):
+    """
+    Extracts ids and values from the data block if all channels are known
+    @param pattern: regex only matching ids and values (and modes)
+    @param channels: dict of id -> metadata of known channels
+    @return list of matches or None if a channel is not known
+    """
+    if not channels:
+        return None
+    matches = list(pattern.finditer(data_raw))
+    for match in matches:
+        if match.group("id") not in channels:
+            return None
+    return matches
+
+
+def _parse_analog_block(data_raw, channels):
+    """
+    Parses all channels of the data block of the analog values page
+    and fills the channel metadata (see parse_analog_values)
+    """
+    # parse a dict of the match and save them all in a list
+    data = list()
+    for match in ANALOG_PATTERN.finditer(data_raw):
+        data.append(
+            {
+                "id": match.group("id"),
+                "name": _unescape(match.group("name")),
+                "value": _analog_value(match),
+                "unit_of_measurement": _unescape(match.group("unit_of_measurement")),
+            }
+        )
+    if channels is not None:
+        channels.clear()
+        for value in data:
+            channels[sys.intern(value["id"])] = (
+                sys.intern(value["name"]),
+                sys.intern(value["unit_of_measurement"]),
+            )
+    return data
+
+
+def _parse_digital_block(data_raw, channels):
+    """
+    Parses all channels of the data block of the digital values page
+    and fills the channel metadata (see parse_digital_values)
+    """
+    # parse a dict of the match and save them all in a list
+    data = list()
+    for match in DIGITAL_PATTERN.finditer(data_raw):
+        data.append(
+            {
+                "id": match.group("id"),
+                "name": _unescape(match.group("name")),
+                "mode": match.group("mode"),
+                "value": match.group("value"),
+            }
+        )
+    if channels is not None:
+        channels.clear()
+        for value in data:
+            channels[sys.intern(value["id"])] = (sys.intern(value["name"]),)
+    return data
+
+
+def parse_analog_values(text, parser=PARSER_HTMLDOM, channels=None):
+    """
+    Parses the analog values page (580500.htm)
+    @param text: html code of the page
+    @param parser: backend to extract the data block with
+    @param channels: dict of id -> (name, unit of measurement) of known channels
+            If it lists all channels of the page, only ids and values are
+            extracted, otherwise it is filled from the page
+    @return list of quadruples of id, name, value, unit of measurement
+            or None if the access was denied
+    """
+    data_raw = _DATA_BLOCK[parser](text)
+    if data_raw is None:
+        return None
+    matches = _known_matches(data_raw, ANALOG_VALUE_PATTERN, channels)
+    if matches is None:
+        return _parse_analog_block(data_raw, channels)
+    data = list()
+    for match in matches:
+        channel = channels[match.group("id")]
+        data.append(
+            {
+                "id": match.group("id"),
+                "name": channel[0],
+                "value": _analog_value(match),
+                "unit_of_measurement": channel[1],
+            }
+        )
+    return data
+
+
+def parse_analog_states(text, parser=PARSER_HTMLDOM, channels=None):
+    """
+    Parses only the values of the analog values page (580500.htm),
+    names and units are left to the channel metadata
+    @param text: html code of the page
+    @param parser: backend to extract the data block with
+    @param channels: dict of id -> (name, unit of measurement) of known channels
+            (see parse_analog_values)
+    @return dict of id -> value or None if the access was denied
+    """
+    data_raw = _DATA_BLOCK[parser](text)
+    if data_raw is None:
+        return None
+    matches = _known_matches(data_raw, ANALOG_VALUE_PATTERN, channels)
+    if matches is None:
+        data = _parse_analog_block(data_raw, channels)
+        return {value["id"]: value["value"] for value in data}
+    return {match.group("id"): _analog_value(match) for match in matches}
+
+
+def parse_digital_values(text, parser=PARSER_HTMLDOM, channels=None):
+    """
+    Parses the digital values page (580600.htm)
+    @param text: html code of the page
+    @param parser: backend to extract the data block with
+    @param channels: dict of id -> (name,) of known channels
+            If it lists all channels of the page, only ids, modes and values
+            are extracted, otherwise it is filled from the page
+    @return list of quadruples of id, name, mode (AUTO/HAND), value (EIN/AUS)
+            or None if the access was denied
+    """
+    data_raw = _DATA_BLOCK[parser](text)
+    if data_raw is None:
+        return None
+    matches = _known_matches(data_raw, DIGITAL_VALUE_PATTERN, channels)
+    if matches is None:
+        return _parse_digital_block(data_raw, channels)
+    data = list()
+    for match in matches:
+        data.append(
+            {
+                "id": match.group("id"),
+                "name": channels[match.group("id")][0],
+                "mode": match.group("mode"),
+                "value": match.group("value"),
+            }
+        )
+    return data
+
+
+def parse_digital_states(text, parser=PARSER_HTMLDOM, channels=None):
+    """
+    Parses only the modes and values of the digital values page (580600.htm),
+    names are left to the channel metadata
+    @param text: html code of the page
+    @param parser: backend to extract the data block with
+    @param channels: dict of id -> (name,) of known channels
+            (see parse_digital_values)
+    @return dict of id -> tuple of mode (AUTO/HAND) and value (EIN/AUS)
+            or None if the access was denied
+    """
+    data_raw = _DATA_BLOCK[parser](text)
+    if data_raw is None:
+        return None
+    matches = _known_matches(data_raw, DIGITAL_VALUE_PATTERN, channels)
+    if matches is None:
+        data = _parse_digital_block(data_raw, channels)
+        return {value["id"]: (value["mode"], value["value"]) for value in data}
+    return {
+        match.group("id"): (match.group("mode"), match.group("value"))
+        for match in matches
+    }
+
+
+def _update_analog_sensor(sensor, channel, value):
+    """
+    Updates the dict of an analog channel (see parse_analog_values)
+    @param channel: tuple of name and unit of measurement
+    @param value: value as returned by parse_analog_states
+    """
+    sensor["name"] = channel[0]
+    sensor["value"] = value
+    sensor["unit_of_measurement"] = channel[1]
+
+
+def _update_digital_sensor(sensor, channel, state):
+    """
+    Updates the dict of a digital channel (see parse_digital_values)
+    @param channel: tuple of the name
+    @param state: tuple of mode and value as returned by parse_digital_states
+    """
+    sensor["name"] = channel[0]
+    sensor["mode"], sensor["value"] = state
+
+
+def _update_sensors(sensors, states, channels, update):
+    """
+    Updates the dicts of the channels of a page in place from their states,
+    only channels that appeared on the page are added
+    @param sensors: dict of int id -> dict per channel as in the lists of
+            parse_analog_values and parse_digital_values
+    @param states: dict as returned by parse_analog_states or
+            parse_digital_states
+    @param channels: the channel metadata the states were parsed with
+    @param update: _update_analog_sensor or _update_digital_sensor
+    @return sensors
+    """
+    for id, state in states.items():
+        sensor = sensors.get(int(id))
+        if sensor is None:
+            sensor = sensors[int(id)] = {"id": id}
+        update(sensor, channels[id], state)
+    if len(sensors) != len(states):
+        # channels that are not on the page anymore
+        for id in [id for id in sensors if str(id) not in states]:
+            del sensors[id]
+    return sensors
+
+
+def digital_value_command(value):
+    """
+    Converts a value for a digital switch into the command understood by the BLNET
+    Accepts 'EIN' and everything evaluating to True
+    as well as 'AUS' and everything evaluating to False
+    and 'AUTO' as values
+    @throws ValueError illegal value
+    @return "1" (off), "2" (on) or "3" (auto)
+    """
+    # transform input value to 'EIN' or 'AUS'
+    if isinstance(value, str):
+        if value.lower() == "AUTO".lower() or value == "3":
+            value = "3"  # 3 means auto
+        elif (
+            value.lower() == "EIN".lower()
+            or value == "2"
+            or value.lower() == "on".lower()
+        ):
+            value = "2"  # 2 means turn on
+        elif (
+            value.lower() == "AUS".lower()
+            or value == "1"
+            or value.lower() == "off".lower()
+        ):
+            value = "1"  # 1 means turn off
+        else:
+            raise ValueError("Illegal input string {}".format(value))
+    elif isinstance(value, int) and not isinstance(value, bool):
+        if value in (1, 2, 3):
+            value = str(value)
+        elif value == 0:
+            value = "1"
+        else:
+            raise ValueError("Illegal input integer {}".format(value))
+    else:
+        # value can be interpreted as a true value
+        if value:
+            value = "2"  # 2 means turn on
+        else:
+            value = "1"  # 1 means turn off
+    assert value in ["1", "2", "3"]
+    return value
+
+
+def digital_value_path(digital_id, value):
+    """
+    Builds the path of the request that sets a digital value with given id
+    to given value, accepts the same values as BLNETWeb.set_digital_value
+    @throws ValueError illegal id or value
+    @return path relative to the address of the BLNET
+    """
+    digital_id = int(digital_id)
+    # throw error for wrong id's
+    if digital_id < 1:
+        raise ValueError("Device id can't be smaller than 1, was {}".format(digital_id))
+    if digital_id > 15:
+        raise ValueError("Device id can't be larger than 15, was {}".format(digital_id))
+    value = digital_value_command(value)
+
+    # convert id to hexvalue so that 10 etc become A...
+    hex_repr = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, "A", "B", "C", "D", "E", "F"]
+    if digital_id > 9:
+        digital_id = hex_repr[digital_id]
+    return "/580600.htm?blw91A1200{}={}".format(digital_id, value)
+
+
+def digital_value_matches(state, command):
+    """
+    Checks whether a state read from the digital values page
+    reflects a command sent to the switch
+    @param state: dict with mode (AUTO/HAND) and value (EIN/AUS)
+    @param command: "1" (off), "2" (on) or "3" (auto)
+    """
+    if command == "3":
+        return state["mode"] == "AUTO"
+    return state["mode"] == "HAND" and state["value"] == (
+        "EIN" if command == "2" else "AUS"
+    )
+
+
+class WebValues(list):
+    """
+    List of values read from a page of the web interface
+    Attributes:
+        changed    the page differs from the one of the previous read
+    """
+
+    def __init__(self, values=(), changed=True):
+        super().__init__(values)
+        self.changed = changed
+
+
+class ChannelMetadata(object):
+    """
+    Cache of the names and units of the channels of a BLNET per node and
+    value page. These only change when the UVR is reconfigured, so they are
+    kept for ttl seconds or until invalidated.
+    Attributes:
+        ttl        seconds after which the channels of a page are parsed again
+    """
+
+    def __init__(self, ttl=METADATA_TTL):
+        self.ttl = ttl
+        # node and path -> monotonic time of creation and channels
+        self._channels = {}
+
+    def channels(self, node, path):
+        """
+        Return: dict of id -> channel metadata of the page, as used by
+                parse_analog_values and parse_digital_values
+                (empty if not known or expired)
+        """
+        entry = self._channels.get((node, path))
+        if entry is None or monotonic() - entry[0] >= self.ttl:
+            entry = (monotonic(), {})
+            self._channels[(node, path)] = entry
+        return entry[1]
+
+    def invalidate(self, node=None, path=None):
+        """
+        Forget the channels of given node and page (None for all)
+        """
+        for key in list(self._channels):
+            if (node is None or key[0] == node) and (path is None or key[1] == path):
+                del self._channels[key]
+
+
+class SessionState(object):
+    """
+    Tracks the TAID of a web session and when the BLNET last confirmed it.
+    Every response to a request that carried the TAID confirms it by
+    sending a Set-Cookie header, a response without it marks the session
+    as logged out.
+    Attributes:
+        taid       TAID cookie in the form 'TAID="EEEE"'
+        issued     monotonic time at which the TAID was issued
+        confirmed  monotonic time at which the TAID was last confirmed
+        ttl        seconds after which a confirmation expires
+    """
+
+    def __init__(self, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self.clear()
+
+    def issue(self, taid):
+        """
+        Remember a newly issued TAID
+        """
+        self.taid = taid
+        self.issued = monotonic()
+        self.confirmed = self.issued if taid else None
+
+    def clear(self):
+        """
+        Forget the TAID (after logging out)
+        """
+        self.taid = ""
+        self.issued = None
+        self.confirmed = None
+
+    def invalidate(self):
+        """
+        Mark the TAID as no longer confirmed
+        """
+        self.confirmed = None
+
+    def valid(self):
+        """
+        Return: the TAID was confirmed within the last ttl seconds
+        """
+        return self.confirmed is not None and monotonic() - self.confirmed < self.ttl
+
+    def observe(self, response):
+        """
+        Update the state from a response to a request that carried the TAID
+
+        Return: the response confirmed the TAID
+        """
+        if response.headers.get("Set-Cookie") is not None:
+            self.confirmed = monotonic()
+            return True
+        self.invalidate()
+        return False
+
+
 class BLNETWeb(object):
     """
     Interface for connecting with, collecting data from and controlling the BLNet
@@ -47,56 +613,286 @@ class BLNETWeb(object):
         ip         the ip/domain of the BL-Net to connect to
         password   the password to log into the web interface provided
         timeout    timeout for http requests
+        pool_size  number of keep-alive connections kept open to the BL-Net
+        reconnect_retries  number of times a reading request is resent on a
+                   fresh connection if the previous one was dropped
+        session_ttl  seconds after which the login is verified again by probing
+        parser     backend for parsing the value pages,
+                   PARSER_HTMLDOM (reference) or PARSER_FAST
+        read_to_end  read value pages completely instead of closing the
+                   connection once the data block was received
+                   (keeps the connection open for reuse), pages are only
+                   read partially with PARSER_FAST, PARSER_HTMLDOM (the
+                   default) always reads them completely
+        lazy_probe  test whether a BLNET answers under ip on the first request
+                   instead of in the constructor
+        probe_ttl  seconds for which a successful test of ip is remembered
+                   for all BLNETWeb objects
+        metadata_ttl  seconds for which the names and units of the channels
+                   are reused instead of being parsed on every read
     """
 
     ip = ""
     _def_password = "0128"  # default password is 0128
     password = ""
-    current_taid = ""  # TAID cookie in the form 'TAID="EEEE"'
 
-    def __init__(self, ip, password=_def_password, timeout=5):
+    def __init__(
+        self,
+        ip,
+        password=_def_password,
+        timeout=5,
+        pool_size=1,
+        reconnect_retries=1,
+        session_ttl=SESSION_TTL,
+        parser=PARSER_HTMLDOM,
+        read_to_end=False,
+        lazy_probe=False,
+        probe_ttl=PROBE_TTL,
+        metadata_ttl=METADATA_TTL,
+    ):
         """
         Constructor
+        @throws ValueError no BLNET found under ip (unless lazy_probe is set)
         """
         assert isinstance(ip, str)
         assert password is None or isinstance(password, str)
         assert timeout is None or isinstance(timeout, int)
+        assert isinstance(pool_size, int) and pool_size > 0
+        assert isinstance(reconnect_retries, int) and reconnect_retries >= 0
+        assert parser in _DATA_BLOCK
         if not ip.startswith("http://") and not ip.startswith("https://"):
             ip = "http://" + ip
-        if not blnet_test(ip):
-            raise ValueError("No BLNET found under given address: {}".format(ip))
+        self._session = requests.Session()
+        # the TAID is sent explicitly, the session must not add stale cookies
+        self._session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", self._adapter)
+        self._session.mount("https://", self._adapter)
+        self._reconnect_retries = reconnect_retries
+        self._requests = 0
+        self.session_state = SessionState(session_ttl)
+        self.parser = parser
+        self.read_to_end = read_to_end
+        self._bytes_read = 0
+        self._bytes_saved = 0
+        # bytes of the last value page that were not downloaded
+        self.last_bytes_saved = 0
+        # node and path -> fingerprint and parsed values of the last read
+        # of a value page
+        self._page_cache = {}
+        # node selected in the current session (None if unknown)
+        self.current_node = None
+        # node and path -> dicts per channel updated by read_*_sensors
+        self._sensors = {}
+        self.metadata = ChannelMetadata(metadata_ttl)
         self.ip = ip
         self.password = password
         self._timeout = timeout
+        self._probe_ttl = probe_ttl
+        self._probed = False
+        if not lazy_probe:
+            try:
+                self._probe()
+            except ValueError:
+                self._session.close()
+                raise
+
+    def _probe(self):
+        """
+        Tests whether a BLNET answers under the address of this object,
+        unless that was confirmed within the last probe_ttl seconds
+        @throws ValueError No BLNET found
+        """
+        probed = _probe_cache.get(self.ip)
+        if probed is None or monotonic() - probed >= self._probe_ttl:
+            self._requests += 1
+            if not blnet_test(self.ip, timeout=self._timeout, session=self._session):
+                raise ValueError(
+                    "No BLNET found under given address: {}".format(self.ip)
+                )
+            _probe_cache[self.ip] = monotonic()
+        self._probed = True
 
     def __enter__(self):
+        self._forget_unsafe_node()
         self.log_in()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.log_out()
 
+    @property
+    def current_taid(self):
+        """
+        TAID cookie in the form 'TAID="EEEE"'
+        """
+        return self.session_state.taid
+
+    @current_taid.setter
+    def current_taid(self, taid):
+        self.session_state.issue(taid)
+
+    def close(self):
+        """
+        Closes all pooled connections to the BLNET
+        """
+        self._session.close()
+
+    def connection_stats(self):
+        """
+        Counters about the use of the pooled connections
+
+        Return: dict with the number of sent requests, the number of opened
+        connections, the number of requests that reused an open connection,
+        the number of bytes read from value pages and the number of bytes
+        of value pages that were not downloaded
+        """
+        connections = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+        return {
+            "requests": self._requests,
+            "connections": connections,
+            "reused": max(self._requests - connections, 0),
+            "bytes_read": self._bytes_read,
+            "bytes_saved": self._bytes_saved,
+        }
+
+    def _request(self, method, path, resend=None, **kwargs):
+        """
+        Sends a request to the BLNET over the pooled session
+        Requests whose connection was dropped are resent on a fresh connection,
+        unless they may change the state of the BLNET
+        @param resend: whether the request may be sent again,
+                by default only GET requests are
+        @throws ValueError No BLNET found (when probing lazily)
+        @throws requests.exceptions.RequestException
+        """
+        if not self._probed:
+            self._probe()
+        if resend is None:
+            resend = method == "GET"
+        kwargs.setdefault("timeout", self._timeout)
+        attempt = 0
+        while True:
+            self._requests += 1
+            try:
+                return self._session.request(method, self.ip + path, **kwargs)
+            except requests.exceptions.Timeout:
+                raise
+            except requests.exceptions.ConnectionError as e:
+                # refused connections and unknown hosts are no dropped connections
+                dropped = bool(e.args) and isinstance(e.args[0], ProtocolError)
+                if not (resend and dropped) or attempt >= self._reconnect_retries:
+                    # the BLNET has to be found again before trusting the address
+                    _probe_cache.pop(self.ip, None)
+                    raise
+                attempt += 1
+
+    def _confirmed(self, response):
+        """
+        Tracks the session state from a response to a request carrying the TAID
+
+        Return: Still logged in
+        """
+        return self.password is None or self.session_state.observe(response)
+
+    def _read_page(self, path):
+        """
+        Streams a value page until the block containing the values was received
+        The rest of the page is not downloaded, unless read_to_end is set
+        or the parser backend needs the complete page (htmldom does)
+        @throws requests.exceptions.RequestException
+        @return tuple of the text of the page up to (at least) the end of the
+                data block and a fingerprint of the read bytes
+        """
+        r = self._request(
+            "GET",
+            path,
+            headers=self.cookie_header(),
+            timeout=self._timeout,
+            stream=True,
+        )
+        try:
+            self._confirmed(r)
+            decoder = codecs.getincrementaldecoder(r.encoding or "ISO-8859-1")(
+                errors="replace"
+            )
+            read_to_end = self.read_to_end or self.parser not in _PARTIAL_PAGES
+            fingerprint = hashlib.blake2b(digest_size=16)
+            scanner = _DataBlockScanner()
+            text = ""
+            read = 0
+            for chunk in r.iter_content(STREAM_CHUNK_SIZE):
+                read += len(chunk)
+                fingerprint.update(chunk)
+                text += decoder.decode(chunk)
+                if not read_to_end and scanner.scan(text) is not None:
+                    break
+            text += decoder.decode(b"", True)
+        finally:
+            # closes the connection if the page was not read completely
+            r.close()
+        length = r.headers.get("Content-Length")
+        saved = max(int(length) - read, 0) if length and length.isdigit() else 0
+        self._bytes_read += read
+        self._bytes_saved += saved
+        self.last_bytes_saved = saved
+        return text, fingerprint.digest()
+
+    def _read_values(self, path, parse):
+        """
+        Reads and parses a value page
+        If the page did not change since the last read,
+        the values parsed back then are returned without parsing again
+        @throws requests.exceptions.RequestException
+        @return WebValues or None if the access was denied
+        """
+        text, fingerprint = self._read_page(path)
+        key = (self.current_node, path)
+        cached = self._page_cache.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            # copies, such that callers may modify the values
+            return WebValues((dict(value) for value in cached[1]), changed=False)
+        values = parse(
+            text, self.parser, self.metadata.channels(self.current_node, path)
+        )
+        if values is None:
+            self._page_cache.pop(key, None)
+            return None
+        self._page_cache[key] = (fingerprint, [dict(value) for value in values])
+        return WebValues(values, changed=True)
+
     def logged_in(self):
         """
         Determines whether the object is still connected to the BLNET
         / Logged into the web interface
+        The BLNET is only asked if the session was not confirmed recently
         """
         if self.password is None:
             return True
+        if self.session_state.valid():
+            return True
+        if not self.current_taid:
+            return False
         # check if a request to a restricted page returns a cookie if
         # we have sent one (if our cookie is the current one this
         # would be the case)
         try:
-            r = requests.get(
+            r = self._request(
+                "GET",
                 # restricted page is chosen to be small in data
                 # so that it can be quickly loaded
-                self.ip + "/par.htm?blp=A1200101&1238653",
+                "/par.htm?blp=A1200101&1238653",
                 headers=self.cookie_header(),
                 timeout=self._timeout,
             )
         except requests.exceptions.RequestException:
             return False
-        return r.headers.get("Set-Cookie") is not None
+        return self._confirmed(r)
 
     def cookie_header(self):
         """
@@ -116,22 +912,19 @@ class BLNETWeb(object):
         payload = {"blu": 1, "blp": self.password, "bll": "Login"}  # log in as experte
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         try:
-            r = requests.post(
-                self.ip + "/main.html",
+            r = self._request(
+                "POST",
+                "/main.html",
                 data=payload,
                 headers=headers,
                 timeout=self._timeout,
             )
         except requests.exceptions.RequestException:
             return False
+        # the response to the login already carries the new TAID
         self.current_taid = r.headers.get("Set-Cookie")
-        # try two times to log in
-        i = 0
-        while i < 2:
-            i += 1
-            if self.logged_in():
-                return True
-        return False
+        self.current_node = None
+        return self.session_state.valid()
 
     def log_out(self):
         """
@@ -142,14 +935,19 @@ class BLNETWeb(object):
         if self.password is None:
             return True
         try:
-            requests.get(
-                self.ip + "/main.html?blL=1",
+            r = self._request(
+                "GET",
+                "/main.html?blL=1",
                 headers=self.cookie_header(),
                 timeout=self._timeout,
             )
         except requests.exceptions.RequestException:
+            self.session_state.invalidate()
             return False
-        return not self.logged_in()
+        self.session_state.clear()
+        self.current_node = None
+        # the TAID is not confirmed anymore after logging out
+        return r.headers.get("Set-Cookie") is None
 
     def set_node(self, node):
         """
@@ -158,113 +956,211 @@ class BLNETWeb(object):
 
         Return: Still logged in (indicating successful node change)
         """
+        # the node is already selected in this session
+        if node == self.current_node and self.logged_in():
+            return True
         # send the request to change the node
         try:
-            r = requests.get(
-                self.ip + "/can.htm?blaB=" + str(node),
+            r = self._request(
+                "GET",
+                "/can.htm?blaB=" + str(node),
                 headers=self.cookie_header(),
                 timeout=self._timeout,
             )
         except requests.exceptions.RequestException:
+            self.current_node = None
             return False
         # return whether we we're still logged in => setting went well
-        return self.password is None or r.headers.get("Set-Cookie") is not None
+        if self._confirmed(r):
+            self.current_node = node
+            return True
+        self.current_node = None
+        return False
+
+    def _forget_unsafe_node(self):
+        """
+        Without a password there is no session, other clients may have
+        selected another node since, it is selected again before reading
+        """
+        if self.password is None:
+            self.current_node = None
+
+    def fetch_nodes(self, nodes, sensors=False):
+        """
+        Reads the analog and digital values of several nodes in one session
+        Logs in before and out afterwards, unless already logged in
+        @param nodes: nodes to read, None reads the currently selected node
+        @param sensors: read the values with read_analog_sensors and
+                read_digital_sensors instead of read_analog_values and
+                read_digital_values
+        @throws ConnectionError a node could not be selected
+        @return dict node -> dict of "analog" and "digital" values
+        """
+        self._forget_unsafe_node()
+        opened = not self.logged_in()
+        if opened:
+            self.log_in()
+        try:
+            data = {}
+            for node in nodes:
+                if node is not None and not self.set_node(node):
+                    raise ConnectionError("Could not set can node to {}".format(node))
+                if sensors:
+                    data[node] = {
+                        "analog": self.read_analog_sensors(),
+                        "digital": self.read_digital_sensors(),
+                    }
+                else:
+                    data[node] = {
+                        "analog": self.read_analog_values(),
+                        "digital": self.read_digital_values(),
+                    }
+            return data
+        finally:
+            if opened:
+                self.log_out()
+
+    def set_digital_values(self, values):
+        """
+        Sets several digital values and verifies them with a single read
+        of the digital values page afterwards
+        @param values: dict of id -> value (see set_digital_value)
+        @throws ValueError illegal id or value (before anything is sent)
+        @return dict of id -> whether the value was set and,
+                if the switch is listed on the page, shows the set state
+        """
+        paths = {
+            digital_id: digital_value_path(digital_id, value)
+            for digital_id, value in values.items()
+        }
+        success = {}
+        for digital_id, path in paths.items():
+            try:
+                r = self._request(
+                    "GET",
+                    path,
+                    resend=False,
+                    headers=self.cookie_header(),
+                    timeout=self._timeout,
+                )
+            except requests.exceptions.RequestException:
+                success[digital_id] = False
+                continue
+            success[digital_id] = self._confirmed(r)
+
+        states = self.read_digital_values()
+        if states is None:
+            return {digital_id: False for digital_id in values}
+        states = {int(state["id"]): state for state in states}
+        for digital_id, value in values.items():
+            state = states.get(int(digital_id))
+            if success[digital_id] and state is not None:
+                success[digital_id] = digital_value_matches(
+                    state, digital_value_command(value)
+                )
+        return success
 
     def read_analog_values(self):
         """
         Reads all analog values (temperatures, speeds) from the web interface
         and returns list of quadruples of id, name, value, unit of measurement
+        The returned WebValues tell whether the page changed since the last read
         """
         try:
-            r = requests.get(
-                self.ip + "/580500.htm",
-                headers=self.cookie_header(),
-                timeout=self._timeout,
-            )
+            return self._read_values("/580500.htm", parse_analog_values)
         except requests.exceptions.RequestException:
             return None
-        # Parse  DOM object from HTMLCode
-        dom = htmldom.HtmlDom().createDom(r.text)
-        # Check if we didn't fail in access
-        # if 'BL-Net Zugang verweigert' in dom.find('title').text():
-        #    return None
-        # get the element containing the interesting information
-        dom = dom.find("div.c")[1]
-        # in case of access denied or other errors, return None
-        if dom is None:
-            return dom
-        # filter out the text
-        data_raw = dom.text()
-
-        # collect data in an array
-        data = list()
-
-        # search for data by regular expression
-        match_iter = re.finditer(
-            r"(?P<id>\d+):&nbsp;(?P<name>.+)\n(&nbsp;){3,6}(?P<value>(-&nbsp;)?\d+,\d+) (?P<unit_of_measurement>.+?) &nbsp;&nbsp;PAR?",
-            data_raw,
-        )
-        # parse a dict of the match and save them all in a list
-        for match in match_iter:
-            match_dict = match.groupdict()
-            # convert html entities to unicode characters
-            for key, value in match_dict.items():
-                # replace &nbsp; by " " since it is not unescaped as expected
-                value = value.replace("&nbsp;", " ")
-                if key == "value":
-                    # for values
-                    # also replace decimal "," by "." and remove "&nbsp;" completely
-                    value = value.replace(",", ".").replace(" ", "")
-                match_dict[key] = html.unescape(value)
-            # and append formatted dict
-            data.append(match_dict)
-        return data
 
     def read_digital_values(self):
         """
         Reads all digital values (switches) from the web interface
         and returns list of quadruples of id, name, mode (AUTO/HAND), value
         (EIN/AUS)
+        The returned WebValues tell whether the page changed since the last read
         """
         try:
-            r = requests.get(
-                self.ip + "/580600.htm",
-                headers=self.cookie_header(),
-                timeout=self._timeout,
-            )
+            return self._read_values("/580600.htm", parse_digital_values)
         except requests.exceptions.RequestException:
             return None
-        # Parse  DOM object from HTMLCode
-        dom = htmldom.HtmlDom().createDom(r.text)
-        # Check if we didn't fail in access
-        if "BL-Net Zugang verweigert" in dom.find("title").text():
+
+    def read_analog_states(self):
+        """
+        Reads only the analog values from the web interface, the names and
+        units of the channels are kept in the metadata cache
+        Return: dict of id -> value or None if the access was denied
+        """
+        try:
+            return self._read_states("/580500.htm", parse_analog_states)
+        except requests.exceptions.RequestException:
+            return None
+
+    def read_digital_states(self):
+        """
+        Reads only the modes and values of the digital values from the
+        web interface, the names of the channels are kept in the metadata cache
+        Return: dict of id -> tuple of mode (AUTO/HAND) and value (EIN/AUS)
+                or None if the access was denied
+        """
+        try:
+            return self._read_states("/580600.htm", parse_digital_states)
+        except requests.exceptions.RequestException:
             return None
-        # get the element containing the interesting information
-        dom = dom.find("div.c")[1]
-        if dom is None:
+
+    def read_analog_sensors(self):
+        """
+        Reads the analog values from the web interface into a dict per
+        channel as in the list of read_analog_values
+        Only the values are parsed, names and units are taken from the
+        metadata cache. The dicts of a node are kept and updated in place
+        by the next read, copy them to keep the values.
+        Return: dict of int id -> dict of id, name, value, unit of measurement
+                or None if the access was denied
+        """
+        try:
+            return self._read_sensors(
+                "/580500.htm", parse_analog_states, _update_analog_sensor
+            )
+        except requests.exceptions.RequestException:
             return None
 
-        # filter out the text
-        data_raw = dom.text()
+    def read_digital_sensors(self):
+        """
+        Reads the digital values from the web interface into a dict per
+        channel as in the list of read_digital_values
+        The dicts of a node are kept and updated in place (see
+        read_analog_sensors).
+        Return: dict of int id -> dict of id, name, mode (AUTO/HAND) and
+                value (EIN/AUS) or None if the access was denied
+        """
+        try:
+            return self._read_sensors(
+                "/580600.htm", parse_digital_states, _update_digital_sensor
+            )
+        except requests.exceptions.RequestException:
+            return None
 
-        # collect data in an array
-        data = list()
+    def _read_sensors(self, path, parse, update):
+        """
+        Reads a value page and updates the kept dicts of its channels
+        @throws requests.exceptions.RequestException
+        @return dict of int id -> dict per channel or None if access denied
+        """
+        states = self._read_states(path, parse)
+        if states is None:
+            return None
+        key = (self.current_node, path)
+        sensors = self._sensors.setdefault(key, {})
+        channels = self.metadata.channels(self.current_node, path)
+        # a new dict, such that callers may remove channels
+        return dict(_update_sensors(sensors, states, channels, update))
 
-        # search for data by regular expression
-        match_iter = re.finditer(
-            r"(?P<id>\d+):&nbsp;(?P<name>.+)\n&nbsp;&nbsp;&nbsp;&nbsp;(?P<mode>(AUTO|HAND))/(?P<value>(AUS|EIN))",
-            data_raw,
-        )
-        # parse a dict of the match and save them all in a list
-        for match in match_iter:
-            match_dict = match.groupdict()
-            # convert html entities to unicode characters
-            for key, value in match_dict.items():
-                value = value.replace("&nbsp;", " ")
-                match_dict[key] = html.unescape(value)
-            # and append formatted dict
-            data.append(match_dict)
-        return data
+    def _read_states(self, path, parse):
+        """
+        Reads a value page and parses only the values of its channels
+        @throws requests.exceptions.RequestException
+        """
+        text, _ = self._read_page(path)
+        return parse(text, self.parser, self.metadata.channels(self.current_node, path))
 
     def set_digital_value(self, digital_id, value):
         """
@@ -278,58 +1174,14 @@ class BLNETWeb(object):
         Return: still logged in (indicating successful set)
         """
 
-        digital_id = int(digital_id)
-        # throw error for wrong id's
-        if digital_id < 1:
-            raise ValueError(
-                "Device id can't be smaller than 1, was {}".format(digital_id)
-            )
-        if digital_id > 15:
-            raise ValueError(
-                "Device id can't be larger than 15, was {}".format(digital_id)
-            )
-        # transform input value to 'EIN' or 'AUS'
-        if isinstance(value, str):
-            if value.lower() == "AUTO".lower() or value == "3":
-                value = "3"  # 3 means auto
-            elif (
-                value.lower() == "EIN".lower()
-                or value == "2"
-                or value.lower() == "on".lower()
-            ):
-                value = "2"  # 2 means turn on
-            elif (
-                value.lower() == "AUS".lower()
-                or value == "1"
-                or value.lower() == "off".lower()
-            ):
-                value = "1"  # 1 means turn off
-            else:
-                raise ValueError("Illegal input string {}".format(value))
-        elif isinstance(value, int) and not isinstance(value, bool):
-            if value in (1, 2, 3):
-                value = str(value)
-            elif value == 0:
-                value = "1"
-            else:
-                raise ValueError("Illegal input integer {}".format(value))
-        else:
-            # value can be interpreted as a true value
-            if value:
-                value = "2"  # 2 means turn on
-            else:
-                value = "1"  # 1 means turn off
-        assert value in ["1", "2", "3"]
-
-        # convert id to hexvalue so that 10 etc become A...
-        hex_repr = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, "A", "B", "C", "D", "E", "F"]
-        if digital_id > 9:
-            digital_id = hex_repr[digital_id]
+        path = digital_value_path(digital_id, value)
 
         # submit data to website
         try:
-            r = requests.get(
-                "{}/580600.htm?blw91A1200{}={}".format(self.ip, digital_id, value),
+            r = self._request(
+                "GET",
+                path,
+                resend=False,
                 headers=self.cookie_header(),
                 timeout=self._timeout,
             )
@@ -337,4 +1189,4 @@ class BLNETWeb(object):
             return False
 
         # return whether we we're still logged in => setting went well
-        return self.password is None or r.headers.get("Set-Cookie") is not None
+        return self._confirmed(r)
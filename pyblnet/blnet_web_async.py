@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Created on 18.10.2026
+
+A module for connecting with, collecting data from and controlling the BLNet
+via it's HTTP-interface from an asyncio event loop
+
+@author: Nielstron
+"""
+
+import asyncio
+import http.client
+import io
+from collections import namedtuple
+from urllib.parse import urlencode, urlsplit
+
+from .blnet_web import (
+    PARSER_HTMLDOM,
+    SESSION_TTL,
+    SessionState,
+    digital_value_path,
+    parse_analog_values,
+    parse_digital_values,
+)
+
+# Minimal view of a HTTP response, headers is a http.client.HTTPMessage
+Response = namedtuple("Response", ["status", "headers", "text"])
+# Errors of failed requests (refused or reset connections, cut off responses
+# and timeouts), cancellation is not included
+REQUEST_ERRORS = (OSError, EOFError, asyncio.TimeoutError)
+
+
+class AsyncBLNETWeb(object):
+    """
+    Interface for connecting with, collecting data from and controlling the BLNet
+    via it's HTTP-interface, usable from an asyncio event loop
+    All methods are coroutines that accept a timeout overriding the default
+    one and that can be cancelled.
+    Attributes:
+        ip         the ip/domain of the BL-Net to connect to
+        password   the password to log into the web interface provided
+        timeout    default timeout for http requests
+        session_ttl  seconds after which the login is verified again by probing
+        parser     backend for parsing the value pages (see BLNETWeb)
+    """
+
+    ip = ""
+    _def_password = "0128"  # default password is 0128
+    password = ""
+
+    def __init__(
+        self,
+        ip,
+        password=_def_password,
+        timeout=5,
+        session_ttl=SESSION_TTL,
+        parser=PARSER_HTMLDOM,
+    ):
+        """
+        Constructor
+        """
+        assert isinstance(ip, str)
+        assert password is None or isinstance(password, str)
+        assert timeout is None or isinstance(timeout, (int, float))
+        if not ip.startswith("http://") and not ip.startswith("https://"):
+            ip = "http://" + ip
+        url = urlsplit(ip)
+        self.ip = ip
+        self.password = password
+        self._timeout = timeout
+        self._host = url.hostname
+        self._ssl = url.scheme == "https"
+        self._port = url.port or (443 if self._ssl else 80)
+        self._netloc = url.netloc
+        self.session_state = SessionState(session_ttl)
+        self.parser = parser
+
+    async def __aenter__(self):
+        await self.log_in()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.log_out()
+
+    @property
+    def current_taid(self):
+        """
+        TAID cookie in the form 'TAID="EEEE"'
+        """
+        return self.session_state.taid
+
+    @current_taid.setter
+    def current_taid(self, taid):
+        self.session_state.issue(taid)
+
+    def cookie_header(self):
+        """
+        Creates the header to pass the session TAID as cookie
+        """
+        headers = {"Cookie": self.current_taid}
+        return headers
+
+    async def _request(self, method, path, headers=None, data=None, timeout=None):
+        """
+        Sends a request to the BLNET on a new connection
+        @throws REQUEST_ERRORS
+        @return Response
+        """
+        if timeout is None:
+            timeout = self._timeout
+        return await asyncio.wait_for(self._send(method, path, headers, data), timeout)
+
+    async def _send(self, method, path, headers, data):
+        reader, writer = await asyncio.open_connection(
+            self._host, self._port, ssl=self._ssl or None
+        )
+        try:
+            body = b"" if data is None else urlencode(data).encode("ascii")
+            lines = [
+                "{} {} HTTP/1.1".format(method, path),
+                "Host: {}".format(self._netloc),
+                "Connection: close",
+            ]
+            for key, value in (headers or {}).items():
+                if value:
+                    lines.append("{}: {}".format(key, value))
+            if data is not None:
+                lines.append("Content-Length: {}".format(len(body)))
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+            await writer.drain()
+
+            status_line = await reader.readline()
+            try:
+                status = int(status_line.split()[1])
+            except (IndexError, ValueError):
+                raise ConnectionError("Malformed response: {}".format(status_line))
+            header_lines = []
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                header_lines.append(line)
+            response_headers = http.client.parse_headers(
+                io.BytesIO(b"".join(header_lines) + b"\r\n")
+            )
+            length = response_headers.get("Content-Length")
+            encoding = response_headers.get("Transfer-Encoding", "")
+            if "chunked" in encoding.lower():
+                content = await _read_chunked(reader)
+            elif length is not None and length.isdigit():
+                content = await reader.readexactly(int(length))
+            else:
+                content = await reader.read()
+            charset = response_headers.get_content_charset() or "ISO-8859-1"
+            return Response(
+                status, response_headers, content.decode(charset, errors="replace")
+            )
+        finally:
+            writer.close()
+
+    def _confirmed(self, response):
+        """
+        Tracks the session state from a response to a request carrying the TAID
+
+        Return: Still logged in
+        """
+        return self.password is None or self.session_state.observe(response)
+
+    async def logged_in(self, timeout=None):
+        """
+        Determines whether the object is still connected to the BLNET
+        / Logged into the web interface
+        The BLNET is only asked if the session was not confirmed recently
+        """
+        if self.password is None:
+            return True
+        if self.session_state.valid():
+            return True
+        if not self.current_taid:
+            return False
+        try:
+            r = await self._request(
+                "GET",
+                "/par.htm?blp=A1200101&1238653",
+                headers=self.cookie_header(),
+                timeout=timeout,
+            )
+        except REQUEST_ERRORS:
+            return False
+        return self._confirmed(r)
+
+    async def log_in(self, timeout=None):
+        """
+        Logs into the BLNET interface, renews the TAID
+
+        Return: Login successful
+        """
+        if await self.logged_in(timeout):
+            return True
+        payload = {"blu": 1, "blp": self.password, "bll": "Login"}  # log in as experte
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        try:
+            r = await self._request(
+                "POST", "/main.html", headers=headers, data=payload, timeout=timeout
+            )
+        except REQUEST_ERRORS:
+            return False
+        self.current_taid = r.headers.get("Set-Cookie")
+        return self.session_state.valid()
+
+    async def log_out(self, timeout=None):
+        """
+        Logs out of the BLNET interface
+
+        Return: successful log out
+        """
+        if self.password is None:
+            return True
+        try:
+            r = await self._request(
+                "GET", "/main.html?blL=1", headers=self.cookie_header(), timeout=timeout
+            )
+        except REQUEST_ERRORS:
+            self.session_state.invalidate()
+            return False
+        self.session_state.clear()
+        return r.headers.get("Set-Cookie") is None
+
+    async def set_node(self, node, timeout=None):
+        """
+        Selects the node at which the UVR of interest lies
+        future requests will be sent at this particular UVR
+
+        Return: Still logged in (indicating successful node change)
+        """
+        try:
+            r = await self._request(
+                "GET",
+                "/can.htm?blaB=" + str(node),
+                headers=self.cookie_header(),
+                timeout=timeout,
+            )
+        except REQUEST_ERRORS:
+            return False
+        return self._confirmed(r)
+
+    async def read_analog_values(self, timeout=None):
+        """
+        Reads all analog values (temperatures, speeds) from the web interface
+        and returns list of quadruples of id, name, value, unit of measurement
+        """
+        try:
+            r = await self._request(
+                "GET", "/580500.htm", headers=self.cookie_header(), timeout=timeout
+            )
+        except REQUEST_ERRORS:
+            return None
+        self._confirmed(r)
+        return parse_analog_values(r.text, self.parser)
+
+    async def read_digital_values(self, timeout=None):
+        """
+        Reads all digital values (switches) from the web interface
+        and returns list of quadruples of id, name, mode (AUTO/HAND), value
+        (EIN/AUS)
+        """
+        try:
+            r = await self._request(
+                "GET", "/580600.htm", headers=self.cookie_header(), timeout=timeout
+            )
+        except REQUEST_ERRORS:
+            return None
+        self._confirmed(r)
+        return parse_digital_values(r.text, self.parser)
+
+    async def set_digital_value(self, digital_id, value, timeout=None):
+        """
+        Sets a digital value with given id to given value
+        (see BLNETWeb.set_digital_value)
+        Return: still logged in (indicating successful set)
+        """
+        path = digital_value_path(digital_id, value)
+        try:
+            r = await self._request(
+                "GET", path, headers=self.cookie_header(), timeout=timeout
+            )
+        except REQUEST_ERRORS:
+            return False
+        return self._confirmed(r)
+
+
+async def _read_chunked(reader):
+    """
+    Reads a body sent with chunked transfer encoding
+
+    Return: The body, without chunk sizes and trailers
+    """
+    chunks = []
+    while True:
+        line = await reader.readline()
+        try:
+            size = int(line.split(b";")[0], 16)
+        except ValueError:
+            raise ConnectionError("Malformed chunk size: {}".format(line))
+        if size == 0:
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readline()
+    # skip the trailer
+    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+        pass
+    return b"".join(chunks)
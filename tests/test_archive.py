@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# general requirements
+import unittest
+from tests.test_structure.server_control import Server
+from tests.test_structure.blnet_direct_mock_server import (
+    BLNETDirectServer,
+    BLNETDirectRequestHandler,
+    dataset,
+)
+
+# For the server in this case
+import tempfile
+from pathlib import Path
+from datetime import datetime
+
+# For the tests
+from pyblnet import BLNETDirect
+from pyblnet.blnet_archive import BLNETArchive, ARCHIVE_HEADER
+from pyblnet.blnet_conn import (
+    CAN_MODE,
+    DL_MODE,
+    DL2_MODE,
+    DATASET_SIZE,
+    OUTPUT_RAW,
+    OUTPUT_LAZY,
+)
+from pyblnet.blnet_parser import BLNETParser, LazyBLNETParser
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ADDRESS = "localhost"
+
+
+class BLNETArchiveTest(unittest.TestCase):
+
+    mode = CAN_MODE
+    frames = 2
+
+    def setUp(self):
+        self.server = BLNETDirectServer(
+            (ADDRESS, 0), BLNETDirectRequestHandler, self.mode, self.frames
+        )
+        for minute in range(3):
+            self.server.add_record(
+                *[dataset(minutes=minute, hours=frame) for frame in range(2)]
+            )
+        self.server_control = Server(self.server)
+        self.server_control.start_server()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name, "blnet.archive")
+
+    def tearDown(self):
+        self.server_control.stop_server()
+        self.directory.cleanup()
+
+    def blnet(self, **kwargs):
+        return BLNETDirect(
+            ADDRESS, self.server_control.get_port(), timeout=10, **kwargs
+        )
+
+    def archive(self):
+        blnet = self.blnet(output=OUTPUT_RAW)
+        datasets = list(blnet.iter_datasets())
+        archive = BLNETArchive.for_blnet(self.path, blnet)
+        archive.extend(datasets)
+        return archive
+
+    def test_archive(self):
+        """Test archiving downloaded datasets and decoding them on access"""
+        # oldest first
+        expected = self.blnet()._get_data()[::-1]
+        with self.archive() as archive:
+            self.assertEqual(len(archive), 3)
+            self.assertEqual(list(archive), expected)
+        with BLNETArchive(self.path, output=OUTPUT_LAZY) as archive:
+            self.assertEqual(archive.mode, self.mode)
+            self.assertEqual(len(archive[0]), len(expected[0]))
+            self.assertIsInstance(archive[-1][0], LazyBLNETParser)
+            self.assertEqual(archive[-1][0].to_dict(), expected[-1][0])
+            with self.assertRaises(IndexError):
+                archive[3]
+
+    def test_archive_append(self):
+        """Test appending to an open archive"""
+        with self.archive() as archive:
+            self.assertEqual(archive[-1][0]["date"], datetime(2019, 1, 1, 0, 2))
+            archive.append({frame: dataset(minutes=3) for frame in archive[0]})
+            self.assertEqual(len(archive), 4)
+            self.assertEqual(archive[3][0]["date"], datetime(2019, 1, 1, 12, 3))
+            self.assertEqual(archive.raw(3)[: len(dataset())], dataset(minutes=3))
+
+    def test_archive_sync(self):
+        """Test archiving the datasets stored since the last sync"""
+        cursor_file = Path(self.directory.name, "cursor.json")
+        blnet = self.blnet(output=OUTPUT_RAW)
+        datasets = list(blnet.sync(cursor_file))
+        with BLNETArchive.for_blnet(self.path, blnet) as archive:
+            archive.extend(datasets)
+            archive.extend(blnet.sync(cursor_file))
+            self.assertEqual(len(archive), 3)
+            for minute in (3, 4):
+                self.server.add_record(
+                    *[dataset(minutes=minute, hours=frame) for frame in range(2)]
+                )
+            archive.extend(blnet.sync(cursor_file))
+            self.assertEqual(
+                [record[0]["date"] for record in archive],
+                [datetime(2019, 1, 1, 0, minute) for minute in range(5)],
+            )
+
+    def test_archive_partial(self):
+        """Test that a partially written dataset is overwritten"""
+        self.archive().close()
+        size = self.path.stat().st_size
+        with open(self.path, "ab") as file:
+            file.write(dataset()[:20])
+        with BLNETArchive(self.path) as archive:
+            self.assertEqual(len(archive), 3)
+            archive.append({frame: dataset() for frame in archive[0]})
+            self.assertEqual(len(archive), 4)
+            self.assertEqual(self.path.stat().st_size, size + archive.record_size)
+
+    def test_archive_layout(self):
+        """Test that archives only hold datasets of one layout"""
+        self.archive().close()
+        with self.assertRaises(ValueError):
+            BLNETArchive(self.path, DL_MODE)
+        with BLNETArchive(self.path) as archive:
+            with self.assertRaises(ValueError):
+                archive.append({0: dataset()})
+        broken = Path(self.directory.name, "broken")
+        broken.write_bytes(b"\x00" * ARCHIVE_HEADER.size)
+        with self.assertRaises(ValueError):
+            BLNETArchive(broken)
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_archive_decode(self):
+        """Test decoding all datasets of a frame at once"""
+        with self.archive() as archive:
+            for frame in archive[0]:
+                start = frame * DATASET_SIZE
+                expected = [
+                    BLNETParser(archive.raw(index)[start : start + DATASET_SIZE])
+                    for index in range(len(archive))
+                ]
+                decoded = archive.decode(frame)
+                self.assertTrue(all(decoded["date"][:-1] < decoded["date"][1:]))
+                self.assertEqual(
+                    [date.item() for date in decoded["date"]],
+                    [parser.date for parser in expected],
+                )
+                self.assertEqual(
+                    decoded["analog"][:, 1].tolist(),
+                    [parser.analog[2] for parser in expected],
+                )
+
+
+class BLNETArchiveDL2Test(BLNETArchiveTest):
+
+    mode = DL2_MODE
+    frames = 1
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# general requirements
+import math
+import random
+import unittest
+from tests.test_structure.blnet_direct_mock_server import (
+    VALUES,
+    dataset,
+    random_dataset,
+)
+
+# For the tests
+from pyblnet.blnet_parser import BLNETParser
+
+try:
+    from pyblnet.blnet_batch import decode_datasets
+except ImportError:
+    decode_datasets = None
+
+FIELDS = ("analog", "digital", "speed", "energy", "power")
+RECORDS = 5000
+
+
+def expected(value):
+    return math.nan if value is None else float(value)
+
+
+@unittest.skipIf(decode_datasets is None, "numpy is not installed")
+class BatchDecoderTest(unittest.TestCase):
+    def assertMatchesParser(self, decoded, records):
+        self.assertEqual(len(decoded), len(records))
+        for row, record in zip(decoded, records):
+            parser = BLNETParser(record)
+            for field in FIELDS:
+                values = getattr(parser, field)
+                self.assertEqual(
+                    [repr(expected(values[channel])) for channel in sorted(values)],
+                    [repr(float(value)) for value in row[field].tolist()],
+                    field,
+                )
+            if len(record) == len(dataset()):
+                self.assertEqual(row["date"].item(), parser.date)
+
+    def test_batch_random(self):
+        """Test that random datasets are decoded exactly like BLNETParser does"""
+        rnd = random.Random(1611)
+        records = [random_dataset(rnd) for _ in range(RECORDS)]
+        self.assertMatchesParser(decode_datasets(b"".join(records)), records)
+
+    def test_batch_heat_meters(self):
+        """Test the energy and power of active heat meters"""
+        rnd = random.Random(2560)
+        records = []
+        for _ in range(RECORDS):
+            record = bytearray(random_dataset(rnd))
+            record[38] |= 0x03
+            records.append(bytes(record))
+        self.assertMatchesParser(decode_datasets(b"".join(records)), records)
+
+    def test_batch_values(self):
+        """Test decoding datasets without time of recording"""
+        decoded = decode_datasets(VALUES * 3, len(VALUES))
+        self.assertMatchesParser(decoded, [VALUES] * 3)
+        self.assertEqual(decoded["date"].tolist(), [None] * 3)
+
+    def test_batch_invalid_date(self):
+        """Test that invalid times of recording are decoded as NaT"""
+        decoded = decode_datasets(dataset(days=31, months=2) + dataset())
+        self.assertIsNone(decoded["date"][0].item())
+        self.assertEqual(decoded["date"][1].item(), BLNETParser(dataset()).date)
+
+    def test_batch_size(self):
+        """Test that buffers of partial datasets are rejected"""
+        with self.assertRaises(ValueError):
+            decode_datasets(dataset()[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,501 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# general requirements
+import unittest
+from unittest import mock
+from tests.test_structure.server_control import Server
+from tests.test_structure.blnet_direct_mock_server import (
+    BLNETDirectServer,
+    BLNETDirectRequestHandler,
+    VALUES,
+    dataset,
+)
+
+# For the server in this case
+import socket
+import tempfile
+import time
+from pathlib import Path
+from datetime import datetime
+
+# For the tests
+from pyblnet import BLNETDirect
+from pyblnet.blnet_conn import (
+    CAN_MODE,
+    DL2_MODE,
+    GET_LATEST,
+    GET_MODE,
+    GET_HEADER,
+    READ_DATA,
+    END_READ,
+    MAX_BATCH_SIZE,
+    OUTPUT_RECORD,
+    OUTPUT_LAZY,
+    LayoutCache,
+    load_cursor,
+)
+from pyblnet.blnet_parser import BLNETParser, BLNETRecord, LazyBLNETParser
+
+ADDRESS = "localhost"
+# Wait time requested by the BLNET in seconds
+WAIT = 1
+LATEST = BLNETParser(VALUES).to_dict()
+
+
+class BLNETDirectTest(unittest.TestCase):
+
+    mode = CAN_MODE
+    frames = 2
+
+    def setUp(self):
+        # start server
+        self.server = BLNETDirectServer(
+            (ADDRESS, 0), BLNETDirectRequestHandler, self.mode, self.frames
+        )
+        self.add_records(range(3))
+        self.server_control = Server(self.server)
+        self.server_control.start_server()
+        self.port = self.server_control.get_port()
+
+    def tearDown(self):
+        self.server_control.stop_server()
+
+    def add_records(self, minutes):
+        for minute in minutes:
+            self.server.add_record(
+                *[dataset(minutes=minute, hours=frame) for frame in range(2)]
+            )
+
+    def read_data_commands(self):
+        return len(
+            [command for command in self.server.commands if command[0] == READ_DATA]
+        )
+
+    def blnet(self, **kwargs):
+        kwargs.setdefault("timeout", 10)
+        return BLNETDirect(ADDRESS, self.port, **kwargs)
+
+    def test_mode(self):
+        """Test reading the bootloader mode"""
+        blnet = self.blnet()
+        self.assertEqual(blnet._mode, self.mode)
+
+    def test_count(self):
+        """Test reading the number of stored datasets"""
+        blnet = self.blnet()
+        self.assertEqual(blnet.get_count(), 3)
+
+    def test_latest(self):
+        """Test reading the latest values of all frames"""
+        blnet = self.blnet()
+        latest = blnet.get_latest()
+        self.assertEqual(latest[0], LATEST)
+        self.assertEqual(latest[1], LATEST)
+        self.assertEqual(set(latest["info"]["got"].values()), {0})
+
+    def test_chunked_responses(self):
+        """Test responses arriving in many small chunks"""
+        self.server.chunk_size = 5
+        blnet = self.blnet()
+        latest = blnet.get_latest()
+        self.assertEqual(latest[0], LATEST)
+        self.assertEqual(len(blnet._get_data()), 3)
+        # every value was received completely on the first try
+        self.assertEqual(
+            self.server.commands.count(bytes([GET_LATEST])), len(latest["info"]["got"])
+        )
+
+    def test_wait_time(self):
+        """Test waiting for the bootloader to provide the latest values"""
+        self.server.wait_times = {0: [0]}
+        blnet = self.blnet()
+        latest = blnet.get_latest()
+        self.assertEqual(latest[0], LATEST)
+        self.assertEqual(latest["info"]["sleep"][0], [0])
+        self.assertEqual(latest["info"]["got"][0], 1)
+
+    def test_wait_time_interleaved(self):
+        """Test that other frames are fetched while waiting for one frame"""
+        if self.server.frames < 2:
+            self.skipTest("Only one frame")
+        self.server.wait_times = {0: [WAIT], 1: [WAIT]}
+        blnet = self.blnet()
+        start = time.monotonic()
+        latest = blnet.get_latest()
+        self.assertLess(time.monotonic() - start, 2 * WAIT)
+        self.assertEqual(latest[0], LATEST)
+        self.assertEqual(latest[1], LATEST)
+        self.assertEqual(latest["info"]["sleep"], {0: [WAIT], 1: [WAIT]})
+        self.assertEqual(set(latest["info"]["received"]), {0, 1})
+
+    def test_latest_partial(self):
+        """Test that frames that are never ready are marked as timeout"""
+        if self.server.frames < 2:
+            self.skipTest("Only one frame")
+        self.server.wait_times = {1: [0] * 3}
+        latest = self.blnet().get_latest(max_retries=3)
+        self.assertEqual(latest[0], LATEST)
+        self.assertEqual(latest[1], "timeout")
+        self.assertEqual(set(latest["info"]["received"]), {0})
+
+    def test_get_data(self):
+        """Test reading the stored datasets, newest first"""
+        blnet = self.blnet()
+        data = blnet._get_data()
+        self.assertEqual(
+            [record[1]["date"] for record in data],
+            [datetime(2019, 1, 1, 1, minute) for minute in (2, 1, 0)],
+        )
+        self.assertEqual(data[0][0]["analog"], LATEST["analog"])
+
+    def test_output_record(self):
+        """Test returning the datasets as BLNETRecords"""
+        blnet = self.blnet(output=OUTPUT_RECORD)
+        latest = blnet.get_latest()
+        self.assertIsInstance(latest[0], BLNETRecord)
+        self.assertEqual(latest[0].to_dict(), LATEST)
+        data = blnet._get_data()
+        self.assertEqual(
+            [record[1]["date"] for record in data],
+            [datetime(2019, 1, 1, 1, minute) for minute in (2, 1, 0)],
+        )
+        self.assertEqual(data[0][0].analog, LATEST["analog"])
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_file = Path(directory, "cursor.json")
+            self.assertEqual(len(list(blnet.sync(cursor_file))), 3)
+            self.assertEqual(list(blnet.sync(cursor_file)), [])
+
+    def test_output_lazy(self):
+        """Test returning the datasets as LazyBLNETParsers"""
+        blnet = self.blnet(output=OUTPUT_LAZY, batch_size=8)
+        latest = blnet.get_latest()
+        self.assertIsInstance(latest[0], LazyBLNETParser)
+        self.assertEqual(latest[0].to_dict(), LATEST)
+        data = blnet._get_data()
+        # the datasets do not refer to the reused receive buffer
+        self.assertEqual(
+            [record[1]["date"] for record in data],
+            [datetime(2019, 1, 1, 1, minute) for minute in (2, 1, 0)],
+        )
+        self.assertEqual(data[2][0].to_dict(), BLNETParser(dataset(hours=0)).to_dict())
+
+    def test_iter_datasets(self):
+        """Test downloading the stored datasets one by one"""
+        blnet = self.blnet()
+        datasets = blnet.iter_datasets()
+        self.assertEqual(next(datasets)[0]["date"], datetime(2019, 1, 1, 0, 2))
+        self.assertEqual(blnet.progress, {"done": 1, "remaining": 2})
+        self.assertEqual(len(list(datasets)), 2)
+        self.assertEqual(blnet.progress, {"done": 3, "remaining": 0})
+        self.assertEqual(self.server.commands[-1], END_READ)
+
+    def test_iter_datasets_error(self):
+        """Test that a failed download raises the error"""
+        self.server.broken_records = {1}
+        blnet = self.blnet()
+        datasets = blnet.iter_datasets()
+        with self.assertRaises(ConnectionError):
+            for _ in datasets:
+                pass
+        self.assertEqual(blnet.progress, {"done": 1, "remaining": 2})
+        self.assertEqual(self.server.commands[-1], END_READ)
+        # the download can be repeated
+        self.server.broken_records = set()
+        self.assertEqual(len(blnet._get_data()), 3)
+
+    def test_iter_datasets_abort(self):
+        """Test that an aborted download ends reading on the bootloader"""
+        blnet = self.blnet()
+        datasets = blnet.iter_datasets()
+        next(datasets)
+        datasets.close()
+        self.assertEqual(self.server.commands[-1], END_READ)
+        self.assertEqual(blnet.progress, {"done": 1, "remaining": 2})
+
+    def test_empty_memory(self):
+        """Test that an empty memory yields no datasets"""
+        self.server.records = []
+        blnet = self.blnet()
+        self.assertEqual(blnet.get_count(), 0)
+        self.assertEqual(blnet._get_data(), [])
+        self.assertEqual(blnet.progress, {"done": 0, "remaining": 0})
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_file = Path(directory, "cursor.json")
+            self.assertEqual(list(blnet.sync(cursor_file)), [])
+            self.assertFalse(cursor_file.exists())
+            self.add_records([0])
+            self.assertEqual(len(list(blnet.sync(cursor_file))), 1)
+            self.server.records = []
+            self.assertEqual(list(blnet.sync(cursor_file)), [])
+        self.assertEqual(blnet.get_latest()[0], LATEST)
+
+    def test_sync(self):
+        """Test downloading only the datasets stored since the last sync"""
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_file = Path(directory, "cursor.json")
+            blnet = self.blnet()
+            self.assertEqual(len(list(blnet.sync(cursor_file))), 3)
+            self.assertEqual(
+                load_cursor(cursor_file)["date"], datetime(2019, 1, 1, 0, 2)
+            )
+            commands = self.read_data_commands()
+            # only the dataset at the cursor is read to check it is still stored
+            self.assertEqual(list(blnet.sync(cursor_file)), [])
+            self.assertEqual(self.read_data_commands(), commands + 1)
+            self.add_records([3, 4])
+            self.assertEqual(
+                [dataset[0]["date"] for dataset in blnet.sync(cursor_file)],
+                [datetime(2019, 1, 1, 0, 4), datetime(2019, 1, 1, 0, 3)],
+            )
+            self.assertEqual(self.read_data_commands(), commands + 4)
+
+    def test_sync_wrap_around(self):
+        """Test syncing while the memory wraps around"""
+        self.server.start_slot = self.server.slots - 2
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_file = Path(directory, "cursor.json")
+            blnet = self.blnet()
+            self.assertEqual(blnet.get_count(), 3)
+            self.assertEqual(len(list(blnet.sync(cursor_file))), 3)
+            self.add_records([3, 4])
+            self.assertEqual(
+                [dataset[0]["date"] for dataset in blnet.sync(cursor_file)],
+                [datetime(2019, 1, 1, 0, 4), datetime(2019, 1, 1, 0, 3)],
+            )
+
+    def test_sync_overflow(self):
+        """Test syncing after the memory wrapped past the cursor"""
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_file = Path(directory, "cursor.json")
+            blnet = self.blnet(batch_size=MAX_BATCH_SIZE)
+            self.assertEqual(len(list(blnet.sync(cursor_file))), 3)
+            # exactly one memory full of records since the last sync
+            slots = self.server.slots
+            for index in range(3, 3 + slots):
+                self.server.add_record(
+                    *[
+                        dataset(
+                            minutes=index % 60,
+                            hours=index // 60 % 24,
+                            days=1 + index // 1440,
+                        )
+                        for _ in range(2)
+                    ]
+                )
+            dates = [dataset[0]["date"] for dataset in blnet.sync(cursor_file)]
+            self.assertEqual(len(dates), slots)
+            self.assertEqual(dates[-1], datetime(2019, 1, 1, 0, 3))
+            self.assertEqual(load_cursor(cursor_file)["date"], dates[0])
+
+    def test_sync_reset(self):
+        """Test syncing after the memory was reset and refilled"""
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_file = Path(directory, "cursor.json")
+            blnet = self.blnet()
+            self.assertEqual(len(list(blnet.sync(cursor_file))), 3)
+            self.server.records = []
+            self.add_records(range(3, 8))
+            self.assertEqual(
+                [dataset[0]["date"] for dataset in blnet.sync(cursor_file)],
+                [datetime(2019, 1, 1, 0, minute) for minute in range(7, 2, -1)],
+            )
+
+    def test_sync_interrupted(self):
+        """Test that an interrupted sync is repeated"""
+        with tempfile.TemporaryDirectory() as directory:
+            cursor_file = Path(directory, "cursor.json")
+            blnet = self.blnet()
+            for _ in blnet.sync(cursor_file):
+                break
+            self.assertIsNone(load_cursor(cursor_file))
+            self.assertEqual(len(list(blnet.sync(cursor_file))), 3)
+
+    def test_batches(self):
+        """Test downloading several datasets per command"""
+        self.add_records(range(3, 10))
+        expected = self.blnet()._get_data()
+        commands = self.read_data_commands()
+        blnet = self.blnet(batch_size=4)
+        self.assertEqual(blnet._get_data(), expected)
+        self.assertEqual(self.read_data_commands() - commands, 3)
+
+    def test_batches_wrap_around(self):
+        """Test that batches do not cross the end of the memory"""
+        self.server.start_slot = self.server.slots - 2
+        self.add_records(range(3, 10))
+        expected = self.blnet()._get_data()
+        self.assertEqual(self.blnet(batch_size=4)._get_data(), expected)
+
+    def test_batches_unsupported(self):
+        """Test falling back to single datasets if batches are not answered"""
+        self.server.batches = False
+        blnet = self.blnet(batch_size=4, timeout=0.5)
+        self.assertEqual(len(blnet._get_data()), 3)
+        self.assertFalse(blnet._batches)
+        # the first batch was requested once
+        self.assertEqual(self.read_data_commands(), 4)
+
+    def test_batches_checksum_error(self):
+        """Test that a broken first batch is raised instead of falling back"""
+        self.server.broken_records = {1}
+        blnet = self.blnet(batch_size=4)
+        with self.assertRaises(ConnectionError):
+            blnet._get_data()
+        self.assertIsNone(blnet._batches)
+        # like a broken single dataset, the layout is checked again
+        self.assertTrue(blnet._mode_stale)
+        self.server.broken_records = set()
+        self.assertEqual(len(blnet._get_data()), 3)
+        self.assertTrue(blnet._batches)
+
+    def test_layout_cache(self):
+        """Test sharing the mode and memory layout between instances"""
+        cache = LayoutCache()
+        self.assertEqual(self.blnet(layout_cache=cache).get_latest()[0], LATEST)
+        connections = self.server.connections
+        self.server.commands.clear()
+        blnet = self.blnet(layout_cache=cache)
+        self.assertEqual(self.server.connections, connections)
+        self.assertEqual(blnet.get_latest()[0], LATEST)
+        self.assertNotIn(GET_MODE, self.server.commands)
+        self.assertNotIn(GET_HEADER, self.server.commands)
+        # downloads still read the addresses from the header
+        self.assertEqual(len(blnet._get_data()), 3)
+
+    def test_layout_cache_file(self):
+        """Test keeping the layout cache in a file"""
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory, "layouts.json")
+            blnet = self.blnet(layout_cache=LayoutCache(path))
+            blnet.get_count()
+            self.assertEqual(
+                LayoutCache(path).get("{}:{}".format(ADDRESS, self.port)),
+                blnet._layout(),
+            )
+            self.server.commands.clear()
+            blnet = self.blnet(layout_cache=LayoutCache(path))
+            self.assertEqual(blnet.get_latest()[1], LATEST)
+            self.assertEqual(self.server.commands[0][0], GET_LATEST)
+
+    def test_layout_cache_invalidation(self):
+        """Test that a reconfigured BLNET invalidates the cached layout"""
+        if self.mode != CAN_MODE:
+            self.skipTest("Reconfigured from CAN mode")
+        cache = LayoutCache()
+        blnet = self.blnet(layout_cache=cache)
+        blnet.get_latest()
+        self.server.mode = DL2_MODE
+        self.server.latest = [VALUES] * 2
+        latest = blnet.get_latest(max_retries=2)
+        self.assertEqual(latest[0], "timeout")
+        self.assertIsNone(cache.get("{}:{}".format(ADDRESS, self.port)))
+        latest = blnet.get_latest()
+        self.assertEqual(blnet._mode, DL2_MODE)
+        self.assertEqual(latest[1], LATEST)
+
+    def test_layout_cache_timeout(self):
+        """Test that a timeout keeps the cached layout"""
+        cache = LayoutCache()
+        blnet = self.blnet(layout_cache=cache)
+        blnet.get_count()
+        layout = cache.get("{}:{}".format(ADDRESS, self.port))
+        self.server.response_delay = 1
+        blnet.timeout = 0.5
+        with self.assertRaises(ConnectionError):
+            blnet.get_latest()
+        self.assertEqual(cache.get("{}:{}".format(ADDRESS, self.port)), layout)
+
+    def test_persistent(self):
+        """Test reusing one connection for all operations"""
+        with self.blnet(persistent=True) as blnet:
+            self.assertEqual(blnet.get_latest()[0], LATEST)
+            self.assertEqual(len(blnet._get_data()), 3)
+            self.assertEqual(blnet.get_latest()[0], LATEST)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_persistent_reconnect(self):
+        """Test that a dropped persistent connection is reestablished"""
+        with self.blnet(persistent=True) as blnet:
+            self.assertEqual(blnet.get_latest()[0], LATEST)
+            self.server.drop_connections()
+            self.assertEqual(blnet.get_latest()[0], LATEST)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_persistent_reset(self):
+        """Test that a reset persistent connection is reestablished"""
+        with self.blnet(persistent=True) as blnet:
+            self.assertEqual(blnet.get_latest()[0], LATEST)
+            self.server.reset_connections()
+            while self.server.open_connections:
+                time.sleep(0.01)
+            # the reset is only noticed when sending the next command
+            with mock.patch.object(blnet, "_healthy", return_value=True):
+                self.assertEqual(blnet.get_latest()[0], LATEST)
+        self.assertEqual(self.server.connections, 2)
+
+    def test_health_check(self):
+        """Test that only connections kept between operations are checked"""
+        with self.blnet(persistent=True) as blnet:
+            with mock.patch.object(blnet, "_healthy", wraps=blnet._healthy) as healthy:
+                blnet.get_latest()
+                self.assertEqual(len(blnet._get_data()), 3)
+                blnet.get_latest()
+                self.assertEqual(healthy.call_count, 3)
+        blnet = self.blnet()
+        with mock.patch.object(blnet, "_healthy") as healthy:
+            blnet.get_latest()
+            self.assertEqual(len(blnet._get_data()), 3)
+            healthy.assert_not_called()
+
+    def test_not_persistent(self):
+        """Test that connections are closed after every operation"""
+        blnet = self.blnet()
+        blnet.get_latest()
+        blnet.get_latest()
+        self.assertEqual(self.server.connections, 3)
+
+    def test_no_global_timeout(self):
+        """Test that the timeout only applies to the sockets of the instance"""
+        self.blnet(timeout=3).get_latest()
+        self.assertIsNone(socket.getdefaulttimeout())
+
+    def test_total_timeout_latest(self):
+        """Test that get_latest does not wait for frames beyond its deadline"""
+        self.server.wait_times = {0: [5]}
+        blnet = self.blnet(total_timeout=1)
+        start = time.monotonic()
+        latest = blnet.get_latest()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(latest[0], "timeout")
+
+    def test_total_timeout_download(self):
+        """Test that a slow download is aborted at its deadline"""
+        self.server.response_delay = 0.3
+        blnet = self.blnet()
+        start = time.monotonic()
+        with self.assertRaises(ConnectionError):
+            blnet._get_data(total_timeout=0.5)
+        self.assertLess(time.monotonic() - start, 2)
+        # the deadline only applies to the download
+        self.server.response_delay = 0
+        self.assertEqual(len(blnet._get_data()), 3)
+
+    def test_deadline(self):
+        """Test that a bootloader that does not answer runs into the deadline"""
+        blnet = self.blnet(timeout=0.5)
+        self.server.silent = True
+        start = time.monotonic()
+        with self.assertRaises(ConnectionError):
+            blnet.get_count()
+        self.assertLess(time.monotonic() - start, 5)
+
+
+class BLNETDirectDL2Test(BLNETDirectTest):
+
+    mode = DL2_MODE
+    frames = 1
+
+
+if __name__ == "__main__":
+    unittest.main()
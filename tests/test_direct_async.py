@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# general requirements
+import unittest
+from unittest import mock
+from tests.test_structure.server_control import Server
+from tests.test_structure.blnet_direct_mock_server import (
+    BLNETDirectServer,
+    BLNETDirectRequestHandler,
+    VALUES,
+    dataset,
+)
+
+# For the server in this case
+import asyncio
+import time
+from datetime import datetime
+
+# For the tests
+from pyblnet import AsyncBLNETDirect
+from pyblnet.blnet_conn import CAN_MODE
+from pyblnet.blnet_parser import BLNETParser
+
+ADDRESS = "localhost"
+LATEST = BLNETParser(VALUES).to_dict()
+DEVICES = 8
+# Wait time requested by the BLNETs in seconds
+WAIT = 1
+
+
+class AsyncBLNETDirectTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.servers = []
+        self.server, self.port = self.start_server()
+
+    def start_server(self):
+        server = BLNETDirectServer(
+            (ADDRESS, 0), BLNETDirectRequestHandler, CAN_MODE, frames=2
+        )
+        for minute in range(3):
+            server.add_record(dataset(minutes=minute), dataset(minutes=minute))
+        control = Server(server)
+        control.start_server()
+        self.servers.append(control)
+        return server, control.get_port()
+
+    def tearDown(self):
+        for control in self.servers:
+            control.stop_server()
+
+    async def test_async_count(self):
+        """Test reading the mode and the number of stored datasets"""
+        async with AsyncBLNETDirect(ADDRESS, self.port, timeout=10) as blnet:
+            self.assertEqual(blnet._mode, CAN_MODE)
+            self.assertEqual(await blnet.get_count(), 3)
+
+    async def test_async_latest(self):
+        """Test reading the latest values of all frames"""
+        async with AsyncBLNETDirect(ADDRESS, self.port, timeout=10) as blnet:
+            latest = await blnet.get_latest()
+        self.assertEqual(latest[0], LATEST)
+        self.assertEqual(latest[1], LATEST)
+
+    async def test_async_get_data(self):
+        """Test downloading the stored datasets, newest first"""
+        self.server.chunk_size = 5
+        async with AsyncBLNETDirect(ADDRESS, self.port, timeout=10) as blnet:
+            data = await blnet.get_data()
+            self.assertEqual(
+                [record[0]["date"] for record in data],
+                [datetime(2019, 1, 1, 12, minute) for minute in (2, 1, 0)],
+            )
+            self.assertEqual(len(await blnet.get_data(max_count=2)), 2)
+
+    async def test_async_get_data_error(self):
+        """Test that a failing end of a failed download keeps the error"""
+        self.server.broken_records = {1}
+        async with AsyncBLNETDirect(ADDRESS, self.port, timeout=10) as blnet:
+            with mock.patch.object(
+                blnet,
+                "_end_read",
+                side_effect=ConnectionError("End read command failed"),
+            ):
+                with self.assertRaisesRegex(ConnectionError, "retreive data"):
+                    await blnet.get_data()
+            self.assertIsNone(blnet._count)
+            self.server.broken_records = set()
+            self.assertEqual(len(await blnet.get_data()), 3)
+
+    async def test_async_empty_memory(self):
+        """Test that an empty memory yields no datasets"""
+        self.server.records = []
+        async with AsyncBLNETDirect(ADDRESS, self.port, timeout=10) as blnet:
+            self.assertEqual(await blnet.get_count(), 0)
+            self.assertEqual(await blnet.get_data(), [])
+
+    async def test_async_persistent(self):
+        """Test reusing one connection for all operations"""
+        async with AsyncBLNETDirect(
+            ADDRESS, self.port, timeout=10, persistent=True
+        ) as blnet:
+            await blnet.get_latest()
+            await blnet.get_data()
+        self.assertEqual(self.server.connections, 1)
+
+    async def test_async_latest_checksum_error(self):
+        """Test that a broken latest response is retried on a new connection"""
+        self.server.broken_latest = 1
+        async with AsyncBLNETDirect(
+            ADDRESS, self.port, timeout=10, persistent=True
+        ) as blnet:
+            latest = await blnet.get_latest()
+        self.assertEqual(latest[0], LATEST)
+        self.assertEqual(latest[1], LATEST)
+        self.assertEqual(self.server.connections, 2)
+
+    async def test_async_wait_time(self):
+        """Test that waits requested by many BLNETs do not block each other"""
+
+        async def poll(port):
+            async with AsyncBLNETDirect(ADDRESS, port, timeout=10) as blnet:
+                return await blnet.get_latest()
+
+        ports = []
+        for _ in range(DEVICES):
+            server, port = self.start_server()
+            server.wait_times = {0: [WAIT], 1: [WAIT]}
+            ports.append(port)
+        start = time.monotonic()
+        results = await asyncio.gather(*(poll(port) for port in ports))
+        elapsed = time.monotonic() - start
+        for result in results:
+            self.assertEqual(result[0], LATEST)
+            self.assertEqual(result["info"]["sleep"], {0: [WAIT], 1: [WAIT]})
+        self.assertLess(elapsed, WAIT * DEVICES / 2)
+
+    async def test_async_timeout(self):
+        """Test that a bootloader that does not answer runs into the timeout"""
+        self.server.silent = True
+        blnet = AsyncBLNETDirect(ADDRESS, self.port, timeout=0.2)
+        with self.assertRaises(ConnectionError):
+            await blnet.get_count()
+
+    async def test_async_cancel(self):
+        """Test cancelling a pending query"""
+        self.server.silent = True
+        blnet = AsyncBLNETDirect(ADDRESS, self.port, timeout=10)
+        task = asyncio.ensure_future(blnet.get_count())
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        self.assertIsNone(blnet._writer)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,10 @@
-from pyblnet.blnet_parser import BLNETParser
+from pyblnet.blnet_parser import BLNETParser, BLNETRecord, LazyBLNETParser
+from datetime import datetime
 import unittest
 
 
 class TestParser(unittest.TestCase):
+    DATA = b'} \xb5"f"\x03"~!\x8e"\x16!\xe0 \xff \xf3 \xf8 \x00\x00=!\x01\x00\x00`\xe2!\x00\x00\x80\x00\x00\x00\x00,\x00\xa4(\x06\x00DhI\x82\x1d\x04Ce\xc0\x00'
 
     def test_parser_ok(self):
         data = b'} \xb5"f"\x03"~!\x8e"\x16!\xe0 \xff \xf3 \xf8 \x00\x00=!\x01\x00\x00`\xe2!\x00\x00\x80\x00\x00\x00\x00,\x00\xa4(\x06\x00DhI\x82\x1d\x04Ce\xc0\x00'
@@ -26,3 +28,69 @@ class TestParser(unittest.TestCase):
         data = b'broken} \xb5"f"\x03"~!\x8e"\x16!\xe0 \xff \xf3 \xf8 \x00\x00=!\x01\x00\x00`\xe2!\x00\x00\x80\x00\x00\x00\x00,\x00\xa4(\x06\x00DhI\x82\x1d\x04Ce\xc0\x00'
         with self.assertRaises(ValueError):
             parser = BLNETParser(data)
+
+    def test_parser_tables(self):
+        """Test every entry of the lookup tables against the conversion functions"""
+        analog_table, speed_table, digital_table = BLNETParser._get_tables()
+        converter = BLNETParser.__new__(BLNETParser)
+        self.assertEqual(len(analog_table), 0x10000)
+        for value, converted in enumerate(analog_table):
+            expected = round(converter._convert_analog(value), 3)
+            self.assertEqual(repr(converted), repr(expected), value)
+        self.assertEqual(len(speed_table), 0x100)
+        for value, converted in enumerate(speed_table):
+            self.assertEqual(converted, converter._convert_speed(value), value)
+        for value in range(0x10000):
+            bits = digital_table[value & 0xFF] + digital_table[value >> 8]
+            expected = tuple(converter._convert_digital(value, bit) for bit in range(16))
+            self.assertEqual(bits, expected, value)
+
+    def test_parser_tables_shared(self):
+        """Test that the lookup tables are only built once, also for subclasses"""
+        BLNETParser._analog_table = None
+        self.assertEqual(LazyBLNETParser(self.DATA).analog[2], 69.3)
+        tables = LazyBLNETParser._get_tables()
+        parser = BLNETParser(self.DATA)
+        self.assertTrue(all(a is b for a, b in zip(BLNETParser._get_tables(), tables)))
+        self.assertNotIn('_analog_table', vars(LazyBLNETParser))
+        self.assertEqual(parser.analog[2], 69.3)
+
+    def test_record(self):
+        """Test that records give the same values as the parser"""
+        dated = self.DATA + bytes([5, 4, 3, 2, 1, 19])
+        meters = bytearray(dated)
+        meters[38] = 0x03
+        for data in (self.DATA, dated, bytes(meters)):
+            record = BLNETRecord(data)
+            expected = BLNETParser(data).to_dict()
+            self.assertEqual(record.to_dict(), expected)
+            for field in expected:
+                self.assertEqual(record[field], expected[field])
+            self.assertFalse(hasattr(record, '__dict__'))
+        self.assertIsNone(BLNETRecord(self.DATA).get('date'))
+        self.assertEqual(BLNETRecord(dated)['date'], datetime(2019, 1, 2, 3, 4, 5))
+        with self.assertRaises(KeyError):
+            BLNETRecord(self.DATA)['date']
+
+    def test_lazy_parser(self):
+        """Test that the lazy parser decodes the same values on access"""
+        dated = self.DATA + bytes([5, 4, 3, 2, 1, 19])
+        meters = bytearray(dated)
+        meters[38] = 0x03
+        for data in (self.DATA, dated, bytes(meters)):
+            parser = LazyBLNETParser(memoryview(bytearray(data)))
+            self.assertEqual(parser.to_dict(), BLNETParser(data).to_dict())
+        self.assertFalse(hasattr(LazyBLNETParser(self.DATA), 'date'))
+
+    def test_lazy_parser_on_access(self):
+        """Test that only accessed value groups are decoded, once"""
+        invalid_date = self.DATA + bytes([0, 0, 0, 31, 2, 19])
+        parser = LazyBLNETParser(invalid_date)
+        analog = parser['analog']
+        self.assertEqual(analog[2], 69.3)
+        self.assertIs(parser.analog, analog)
+        self.assertNotIn('digital', vars(parser))
+        with self.assertRaises(ValueError):
+            parser.date
+        with self.assertRaises(ValueError):
+            LazyBLNETParser(self.DATA[:-1])
@@ -0,0 +1,252 @@
+"""
+Simulation of the PC interface of the BL-Net bootloader
+(see BLNETDirect for the protocol)
+"""
+
+import math
+import socket
+import struct
+import time
+from socketserver import StreamRequestHandler, TCPServer, ThreadingMixIn
+
+from pyblnet.blnet_conn import (
+    CAN_MODE,
+    DL_MODE,
+    DL2_MODE,
+    GET_MODE,
+    GET_HEADER,
+    GET_LATEST,
+    READ_DATA,
+    END_READ,
+    RESET_DATA,
+    WAIT_TIME,
+)
+
+# Values of a dataset as sent by a UVR1611 (see test_parser)
+VALUES = (
+    b'} \xb5"f"\x03"~!\x8e"\x16!\xe0 \xff \xf3 \xf8 \x00\x00=!\x01\x00\x00`\xe2!'
+    b"\x00\x00\x80\x00\x00\x00\x00,\x00\xa4(\x06\x00DhI\x82\x1d\x04Ce\xc0\x00"
+)
+NO_ADDRESS = b"\xff\xff\xff"
+
+
+def dataset(values=VALUES, seconds=0, minutes=0, hours=12, days=1, months=1, years=19):
+    """
+    Dataset as stored in the bootloader memory (values followed by the date)
+    """
+    return values + struct.pack("<6B", seconds, minutes, hours, days, months, years)
+
+
+def random_dataset(rnd):
+    """
+    Dataset with random values recorded at a random time
+    @param rnd: random.Random
+    """
+    return dataset(
+        bytes(rnd.getrandbits(8) for _ in range(len(VALUES))),
+        rnd.randrange(60),
+        rnd.randrange(60),
+        rnd.randrange(24),
+        rnd.randrange(1, 29),
+        rnd.randrange(1, 13),
+        rnd.randrange(100),
+    )
+
+
+def checksum(data):
+    return bytes([sum(data) % 256])
+
+
+class BLNETDirectServer(ThreadingMixIn, TCPServer):
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    # bootloader mode and number of CAN frames (data loggers)
+    mode = CAN_MODE
+    frames = 1
+    # stored records, oldest first, every record is a list of one dataset per frame
+    records = []
+    # slot of the memory (used as ring buffer) holding the oldest record
+    start_slot = 0
+    # latest values per frame
+    latest = []
+    # frame -> wait times answered to GET_LATEST before the values are sent
+    wait_times = {}
+    # send responses in chunks of this size
+    chunk_size = None
+    chunk_delay = 0.001
+    # never answer any command
+    silent = False
+    # indices of records that are sent with a wrong checksum
+    broken_records = set()
+    # number of following GET_LATEST responses sent with a wrong checksum
+    broken_latest = 0
+    # delay before a new connection is served
+    connect_delay = 0
+    # delay before every response
+    response_delay = 0
+    # answer READ_DATA with several datasets, otherwise only one is sent
+    batches = True
+
+    def __init__(self, server_address, handler_class, mode=CAN_MODE, frames=1):
+        super().__init__(server_address, handler_class)
+        self.mode = mode
+        self.frames = frames if mode == CAN_MODE else 1
+        self.records = []
+        self.latest = [VALUES] * (2 if mode == DL2_MODE else self.frames)
+        self.wait_times = {}
+        # frame -> time before which only WAIT_TIME is answered
+        self.ready = {}
+        self.commands = []
+        self.broken_records = set()
+        # number of accepted and currently open connections
+        self.connections = 0
+        self.open_connections = set()
+
+    @property
+    def address_inc(self):
+        if self.mode == CAN_MODE:
+            return 64 * self.frames
+        elif self.mode == DL2_MODE:
+            return 128
+        return 64
+
+    @property
+    def slots(self):
+        return 0x07FFFF // self.address_inc + 1
+
+    def address(self, index):
+        return ((self.start_slot + index) % self.slots) * self.address_inc
+
+    def drop_connections(self):
+        """
+        Close all open connections (as the BL-Net does after a while)
+        """
+        for connection in list(self.open_connections):
+            connection.shutdown(socket.SHUT_RDWR)
+
+    def reset_connections(self):
+        """
+        Reset all open connections (as on a network failure)
+        """
+        for connection in list(self.open_connections):
+            # close without lingering, i.e. with a reset
+            connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)
+            )
+            # only wake the handler, which then closes the connection
+            connection.shutdown(socket.SHUT_RD)
+
+    def add_record(self, *datasets):
+        if len(self.records) == self.slots:
+            # the memory is full, the oldest record is overwritten
+            self.records.pop(0)
+            self.start_slot = (self.start_slot + 1) % self.slots
+        self.records.append(list(datasets))
+
+    def header(self):
+        if self.records:
+            start_address = self.address(0).to_bytes(3, "little")
+            end_address = self.address(len(self.records) - 1).to_bytes(3, "little")
+        else:
+            start_address = end_address = NO_ADDRESS
+        if self.mode == CAN_MODE:
+            header = (
+                b"\x80\x01\x00\x00\x00"
+                + bytes([self.frames])
+                + bytes(range(1, self.frames + 1))
+            )
+        elif self.mode == DL_MODE:
+            header = b"\x80\x01\x00\x00\x00\x01"
+        else:
+            header = b"\x80\x01\x00\x00\x00\x01\x01"
+        header += start_address + end_address
+        return header + checksum(header)
+
+    def read_data(self, address, count=1):
+        if not self.batches:
+            count = 1
+        return b"".join(
+            self.read_record(address + i * self.address_inc) for i in range(count)
+        )
+
+    def read_record(self, address):
+        index = (address // self.address_inc - self.start_slot) % self.slots
+        datasets = self.records[index]
+        if self.mode == CAN_MODE:
+            data = b"\x00" * 3 + b"".join(datasets)
+        elif self.mode == DL_MODE:
+            data = datasets[0] + b"\x00" * 3
+        else:
+            data = datasets[0] + b"\x00" * 3 + datasets[1]
+        if index in self.broken_records:
+            return data + checksum(data + b"\x01")
+        return data + checksum(data)
+
+    def get_latest(self, frame):
+        remaining = self.ready.get(frame, 0) - time.monotonic()
+        if remaining > 0:
+            data = bytes([WAIT_TIME, math.ceil(remaining)])
+        elif self.wait_times.get(frame):
+            wait = self.wait_times[frame].pop(0)
+            self.ready[frame] = time.monotonic() + wait
+            data = bytes([WAIT_TIME, wait])
+        elif self.mode == DL2_MODE:
+            data = b"\x80" + self.latest[0] + b"\x00" + self.latest[1]
+        else:
+            data = b"\x80" + self.latest[frame]
+        if self.broken_latest:
+            self.broken_latest -= 1
+            return data + checksum(data + b"\x01")
+        return data + checksum(data)
+
+
+class BLNETDirectRequestHandler(StreamRequestHandler):
+
+    # uncomment on higher python versions for better debugging
+    # server: BLNETDirectServer
+
+    def setup(self):
+        super().setup()
+        time.sleep(self.server.connect_delay)
+        self.server.connections += 1
+        self.server.open_connections.add(self.request)
+
+    def finish(self):
+        self.server.open_connections.discard(self.request)
+        super().finish()
+
+    def handle(self):
+        while True:
+            command = self.rfile.read(1)
+            if not command:
+                return
+            self.server.commands.append(command)
+            if self.server.silent:
+                continue
+            if command == GET_MODE:
+                self.respond(self.server.mode)
+            elif command == GET_HEADER:
+                self.respond(self.server.header())
+            elif command[0] == GET_LATEST:
+                frame = self.rfile.read(1)[0] - 1
+                self.respond(self.server.get_latest(frame))
+            elif command[0] == READ_DATA:
+                low, middle, high, count, _ = self.rfile.read(5)
+                self.respond(
+                    self.server.read_data(low | middle << 7 | high << 15, count)
+                )
+            elif command == END_READ:
+                self.respond(END_READ)
+            elif command == RESET_DATA:
+                self.server.records = []
+                self.respond(RESET_DATA)
+
+    def respond(self, data):
+        time.sleep(self.server.response_delay)
+        chunk_size = self.server.chunk_size or len(data)
+        for start in range(0, len(data), chunk_size):
+            self.wfile.write(data[start : start + chunk_size])
+            if self.server.chunk_size:
+                time.sleep(self.server.chunk_delay)
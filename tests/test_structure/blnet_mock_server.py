@@ -1,6 +1,7 @@
 import os
 import urllib.parse
 from http.server import SimpleHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
 
 try:
     from http import HTTPStatus
@@ -33,6 +34,16 @@ class BLNETServer(HTTPServer):
     # Enable option to block server
     # (sends access denied all the time, for whatever reason)
     blocked = False
+    # Serve all pages without login (as a BLNET without password)
+    open_access = False
+    # Number of following requests whose connection is closed without answer
+    drop_requests = 0
+    # Currently selected can node and number of node selections
+    can_node = None
+    can_node_selections = 0
+    # Serve the alternative version of pages where available
+    # (e.g. 580500.alternative.htm instead of 580500.htm)
+    alternative = False
 
     def set_password(self, password):
         self.password = password
@@ -64,12 +75,38 @@ class BLNETServer(HTTPServer):
     def unset_blocked(self):
         self.blocked = False
 
+    def select_can_node(self, node):
+        self.can_node = node
+        self.can_node_selections += 1
+
+    def set_alternative(self, alternative=True):
+        self.alternative = alternative
+
+
+class ThreadingBLNETServer(ThreadingMixIn, BLNETServer):
+    """
+    BLNET server that serves every connection in its own thread
+    such that idle keep-alive connections do not block the server
+    """
+
+    daemon_threads = True
+
 
 class BLNETRequestHandler(SimpleHTTPRequestHandler):
 
     # uncomment on higher python versions for better debugging
     # server: BLNETServer
 
+    def parse_request(self):
+        if not super().parse_request():
+            return False
+        if self.server.drop_requests:
+            # close the connection without answering
+            self.server.drop_requests -= 1
+            self.close_connection = True
+            return False
+        return True
+
     def do_GET(self):
         """
         Handle get request, but check for errors in protocol
@@ -90,7 +127,9 @@ class BLNETRequestHandler(SimpleHTTPRequestHandler):
             and not Path(path) == SERVER_DIR.joinpath("main.htm")
             and not Path(path) == SERVER_DIR.joinpath("main.html")
         ):
-            if not self.server.is_logged_in(self.headers.get("cookie")):
+            if not self.server.open_access and not self.server.is_logged_in(
+                self.headers.get("cookie")
+            ):
                 self.send_error(403, "Not logged in, access denied")
                 return
             # Parse node sets
@@ -99,6 +138,10 @@ class BLNETRequestHandler(SimpleHTTPRequestHandler):
             )
             for match in node_reg.finditer(self.path):
                 self.server.set_node(match.group("node"), match.group("value"))
+            # Parse can node selections
+            can_node_reg = re.compile(r"[?&]blaB=(?P<node>\d+)")
+            for match in can_node_reg.finditer(self.path):
+                self.server.select_can_node(match.group("node"))
 
         # print(path)
         super().do_GET()
@@ -110,7 +153,10 @@ class BLNETRequestHandler(SimpleHTTPRequestHandler):
         # Result of self.rfile.read() if correct POST request:
         # b'blu=1&blp=0123&bll=Login'
         perfect = b"blu=1&blp=0123&bll=Login"
-        request_raw = self.rfile.read(len(perfect))
+        # read exactly the sent body so that keep-alive connections stay usable
+        request_raw = self.rfile.read(
+            int(self.headers.get("Content-Length", len(perfect)))
+        )
         request_string = request_raw.decode(encoding="utf-8")
         request_data = request_string.split("&")
 
@@ -190,6 +236,10 @@ class BLNETRequestHandler(SimpleHTTPRequestHandler):
             path = os.path.join(path, word)
         if trailing_slash:
             path += "/"
+        if self.server.alternative:
+            alternative = Path(path).with_suffix(".alternative" + Path(path).suffix)
+            if alternative.exists():
+                path = str(alternative)
         return path
 
     def send_head(self):
@@ -277,3 +327,11 @@ class BLNETRequestHandler(SimpleHTTPRequestHandler):
 
         if self.command != "HEAD" and body:
             self.wfile.write(body)
+
+
+class BLNETKeepAliveRequestHandler(BLNETRequestHandler):
+    """
+    Request handler that keeps connections open between requests
+    """
+
+    protocol_version = "HTTP/1.1"
@@ -4,16 +4,41 @@
 # general requirements
 import unittest
 from tests.test_structure.server_control import Server
-from tests.test_structure.blnet_mock_server import BLNETServer, BLNETRequestHandler, PASSWORD
+from tests.test_structure.blnet_direct_mock_server import (
+    BLNETDirectServer,
+    BLNETDirectRequestHandler,
+    VALUES,
+    dataset,
+)
+from tests.test_structure.blnet_mock_server import (
+    BLNETServer,
+    BLNETRequestHandler,
+    BLNETKeepAliveRequestHandler,
+    ThreadingBLNETServer,
+    PASSWORD,
+)
 
 # For the server in this case
 import time
+import pickle
+from pathlib import Path
 
 # For the tests
 from pyblnet import BLNET, blnet_test, BLNETWeb
+from pyblnet.blnet_web import (
+    PARSER_FAST,
+    PARSER_HTMLDOM,
+    _DataBlockScanner,
+    _find_data_block,
+    parse_analog_states,
+    parse_analog_values,
+    parse_digital_states,
+    parse_digital_values,
+)
 from tests.web_raw.web_state import STATE, STATE_ANALOG, STATE_DIGITAL
 
 ADDRESS = "localhost"
+WEB_RAW_DIR = Path(__file__).parent.joinpath("web_raw")
 
 
 class OfflineTest(unittest.TestCase):
@@ -31,6 +56,98 @@ class OfflineTest(unittest.TestCase):
         except ValueError:
             pass
 
+    def test_blnet_web_lazy_probe(self):
+        """Test that a lazy blnetweb only fails once it is used"""
+        blnet = BLNETWeb(self.url, timeout=1, lazy_probe=True)
+        with self.assertRaises(ValueError):
+            blnet.read_analog_values()
+
+
+class ParserBackendTest(unittest.TestCase):
+    def test_backends_identical(self):
+        """Test that the fast parser backend matches the htmldom reference"""
+        for raw in ("analog_values", "digital_values", "logged_in", "main_alt_one"):
+            with WEB_RAW_DIR.joinpath(raw).open("rb") as file:
+                text = pickle.load(file).text
+            for parse in (parse_analog_values, parse_digital_values):
+                self.assertEqual(
+                    parse(text, PARSER_FAST), parse(text, PARSER_HTMLDOM), raw
+                )
+
+    def test_fast_backend(self):
+        """Test values extracted by the fast parser backend"""
+        with WEB_RAW_DIR.joinpath("digital_values").open("rb") as file:
+            text = pickle.load(file).text
+        self.assertEqual(parse_digital_values(text, PARSER_FAST), STATE_DIGITAL)
+
+    def test_data_block_scanner(self):
+        """Test finding the data block in a page received in parts"""
+        for raw in ("analog_values", "digital_values"):
+            with WEB_RAW_DIR.joinpath(raw).open("rb") as file:
+                text = pickle.load(file).text
+            expected = _find_data_block(text)
+            self.assertIsNotNone(expected)
+            for size in (1, 7, 512):
+                scanner = _DataBlockScanner()
+                for end in range(size, len(text) + size, size):
+                    block = scanner.scan(text[:end])
+                    if block is not None:
+                        break
+                    # the block is only found once it was received completely
+                    self.assertIsNone(_find_data_block(text[:end]))
+                self.assertEqual(block, expected)
+
+    def test_channel_metadata(self):
+        """Test parsing with cached names and units of the channels"""
+        for raw, parse in (
+            ("analog_values", parse_analog_values),
+            ("digital_values", parse_digital_values),
+        ):
+            with WEB_RAW_DIR.joinpath(raw).open("rb") as file:
+                text = pickle.load(file).text
+            for parser in (PARSER_FAST, PARSER_HTMLDOM):
+                expected = parse(text, parser)
+                channels = {}
+                self.assertEqual(parse(text, parser, channels), expected)
+                self.assertEqual(len(channels), len(expected))
+                self.assertEqual(parse(text, parser, channels), expected)
+                # known channels are not parsed again
+                first = expected[0]["id"]
+                channels[first] = ("renamed",) + channels[first][1:]
+                values = parse(text, parser, channels)
+                self.assertEqual(values[0]["name"], "renamed")
+                self.assertEqual(values[1:], expected[1:])
+                # unknown channels cause a complete parse
+                del channels[first]
+                self.assertEqual(parse(text, parser, channels), expected)
+                self.assertEqual(len(channels), len(expected))
+
+    def test_channel_states(self):
+        """Test parsing only the values of the channels"""
+        for raw, parse, parse_states, state in (
+            (
+                "analog_values",
+                parse_analog_values,
+                parse_analog_states,
+                lambda value: value["value"],
+            ),
+            (
+                "digital_values",
+                parse_digital_values,
+                parse_digital_states,
+                lambda value: (value["mode"], value["value"]),
+            ),
+        ):
+            with WEB_RAW_DIR.joinpath(raw).open("rb") as file:
+                text = pickle.load(file).text
+            for parser in (PARSER_FAST, PARSER_HTMLDOM):
+                expected = {value["id"]: state(value) for value in parse(text, parser)}
+                channels = {}
+                self.assertEqual(parse_states(text, parser, channels), expected)
+                self.assertEqual(len(channels), len(expected))
+                self.assertEqual(parse_states(text, parser, channels), expected)
+                self.assertEqual(parse_states(text, parser), expected)
+
 
 class BLNETWebTest(unittest.TestCase):
 
@@ -38,18 +155,20 @@ class BLNETWebTest(unittest.TestCase):
     server_control = None
     port = 0
     url = "http://localhost:80"
+    server_class = BLNETServer
+    handler_class = BLNETRequestHandler
 
     def setUp(self):
         # Create an arbitrary subclass of TCP Server as the server to be started
         # Here, it is an Simple HTTP file serving server
-        handler = BLNETRequestHandler
+        handler = self.handler_class
 
         max_retries = 10
         r = 0
         while not self.server:
             try:
                 # Connect to any open port
-                self.server = BLNETServer((ADDRESS, 0), handler)
+                self.server = self.server_class((ADDRESS, 0), handler)
             except OSError:
                 if r < max_retries:
                     r += 1
@@ -84,6 +203,19 @@ class BLNETWebTest(unittest.TestCase):
         with blnet as blnet:
             self.assertTrue(blnet.logged_in())
 
+    def test_blnet_web_probe_cache(self):
+        """Test that a BLNET is only probed once for all objects"""
+        blnet = BLNETWeb(self.url, password=PASSWORD, timeout=10, probe_ttl=0)
+        self.assertEqual(blnet.connection_stats()["requests"], 1)
+        blnet = BLNETWeb(self.url, password=PASSWORD, timeout=10)
+        self.assertEqual(blnet.connection_stats()["requests"], 0)
+        blnet = BLNETWeb(
+            "{}:{}".format(ADDRESS, self.port), password=PASSWORD, lazy_probe=True
+        )
+        self.assertEqual(blnet.connection_stats()["requests"], 0)
+        with blnet as blnet:
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+
     def test_blnet_fetch(self):
         """Test fetching data in higher level class"""
         self.assertEqual(
@@ -93,6 +225,112 @@ class BLNETWebTest(unittest.TestCase):
             STATE,
         )
 
+    def test_blnet_fetch_requests(self):
+        """Test that fetching does not probe the login state"""
+        blnet = BLNET(
+            ADDRESS, password=PASSWORD, timeout=10, use_ta=False, web_port=self.port
+        )
+        before = blnet.blnet_web.connection_stats()["requests"]
+        self.assertEqual(blnet.fetch(), STATE)
+        after = blnet.blnet_web.connection_stats()["requests"]
+        # log in, analog values, digital values, log out
+        self.assertEqual(after - before, 4)
+
+    def test_blnet_web_session_state(self):
+        """Test that a lost session is detected from data requests"""
+        with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            self.assertTrue(blnet.session_state.valid())
+            self.server.log_out()
+            self.assertIsNone(blnet.read_analog_values())
+            self.assertFalse(blnet.session_state.valid())
+            self.assertFalse(blnet.logged_in())
+            self.assertTrue(blnet.log_in())
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+
+    def test_blnet_fetch_nodes(self):
+        """Test fetching several nodes in one session"""
+        blnet = BLNET(
+            ADDRESS, password=PASSWORD, timeout=10, use_ta=False, web_port=self.port
+        )
+        before = blnet.blnet_web.connection_stats()["requests"]
+        self.assertEqual(blnet.fetch_nodes([1, 2, 2]), {1: STATE, 2: STATE})
+        after = blnet.blnet_web.connection_stats()["requests"]
+        self.assertEqual(self.server.can_node, "2")
+        self.assertEqual(self.server.can_node_selections, 2)
+        # log in, select 2 nodes, read values of 3 nodes, log out
+        self.assertEqual(after - before, 1 + 2 + 3 * 2 + 1)
+        self.assertEqual(blnet.fetch(1), STATE)
+        self.assertEqual(self.server.can_node_selections, 3)
+        # the dicts of the sensors are updated in place
+        sensor = blnet.fetch(1)["analog"][1]
+        self.assertIs(blnet.fetch(1)["analog"][1], sensor)
+
+    def test_blnet_fetch_without_password(self):
+        """Test that the node is selected again without a session"""
+        self.server.open_access = True
+        blnet = BLNET(
+            ADDRESS, password=None, timeout=10, use_ta=False, web_port=self.port
+        )
+        self.assertEqual(blnet.fetch(1), STATE)
+        self.assertEqual(self.server.can_node_selections, 1)
+        # another client selects a different node
+        self.server.select_can_node("2")
+        self.assertEqual(blnet.fetch(1), STATE)
+        self.assertEqual(self.server.can_node, "1")
+        with blnet.blnet_web as web:
+            self.assertTrue(web.set_node(1))
+            self.assertTrue(web.set_node(1))
+        self.assertEqual(self.server.can_node_selections, 4)
+
+    def test_blnet_fetch_nodes_direct(self):
+        """Test merging the PC-BLNET frames only into the data of their nodes"""
+        direct_server = BLNETDirectServer(
+            (ADDRESS, 0), BLNETDirectRequestHandler, frames=2
+        )
+        # second frame with 0.1 °C in the first analog channel
+        direct_server.latest = [VALUES, b"\x01\x20" + VALUES[2:]]
+        direct_server.add_record(dataset(), dataset())
+        direct_control = Server(direct_server)
+        direct_control.start_server()
+        self.addCleanup(direct_control.stop_server)
+
+        def blnet(ta_frames=None):
+            return BLNET(
+                ADDRESS,
+                password=PASSWORD,
+                timeout=10,
+                use_ta=True,
+                ta_port=direct_control.get_port(),
+                web_port=self.port,
+                ta_frames=ta_frames,
+            )
+
+        data = blnet({1: 0, 2: 1}).fetch_nodes([1, 2, 3])
+        self.assertEqual(data[1]["analog"][1]["value"], 12.5)
+        self.assertEqual(data[2]["analog"][1]["value"], 0.1)
+        self.assertEqual(
+            data[2]["speed"], {2: {"value": 0}, 3: {"value": 0}, 4: {"value": 0}}
+        )
+        self.assertEqual(data[3], STATE)
+        # without known frames, only a single node gets the first frame
+        self.assertEqual(blnet().fetch_nodes([1, 2]), {1: STATE, 2: STATE})
+        self.assertEqual(blnet().fetch(1)["analog"][1]["value"], 12.5)
+
+    def test_blnet_web_fetch_nodes(self):
+        """Test that an open session is kept when fetching nodes"""
+        with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            data = blnet.fetch_nodes([None, 3])
+            self.assertEqual(
+                data,
+                {
+                    None: {"analog": STATE_ANALOG, "digital": STATE_DIGITAL},
+                    3: {"analog": STATE_ANALOG, "digital": STATE_DIGITAL},
+                },
+            )
+            self.assertTrue(blnet.logged_in())
+            self.assertTrue(blnet.set_node(3))
+        self.assertEqual(self.server.can_node_selections, 1)
+
     def test_blnet_fetch_fine_grained(self):
         """Test fetching data in higher level class"""
         fetched = STATE
@@ -138,6 +376,28 @@ class BLNETWebTest(unittest.TestCase):
         blnet.turn_off(1)
         self.assertEqual(self.server.get_node("1"), "1")
 
+    def test_blnet_set_digital_values(self):
+        """Test setting several switches at once"""
+        blnet = BLNET(
+            ADDRESS, password=PASSWORD, timeout=10, use_ta=False, web_port=self.port
+        )
+        before = blnet.blnet_web.connection_stats()["requests"]
+        # the mock BLNET always shows 1 as AUTO/AUS, 10 as HAND/AUS
+        # and does not list 3
+        self.assertEqual(
+            blnet.set_digital_values({10: "AUS", 1: "EIN", 3: "AUTO", "5": 0}),
+            {10: True, 1: False, 3: True, "5": False},
+        )
+        after = blnet.blnet_web.connection_stats()["requests"]
+        # log in, 4 writes, one verification read, log out
+        self.assertEqual(after - before, 1 + 4 + 1 + 1)
+        self.assertEqual(self.server.get_node("A"), "1")
+        self.assertEqual(self.server.get_node("1"), "2")
+        self.assertEqual(self.server.get_node("3"), "3")
+        self.assertEqual(self.server.get_node("5"), "1")
+        with self.assertRaises(ValueError):
+            blnet.set_digital_values({1: "EIN", 16: "EIN"})
+
     def test_blnet_fetch_error(self):
         """Test fetching data in higher level class with missing password (or otherwise denied access to the data)"""
         self.assertEqual(
@@ -152,6 +412,112 @@ class BLNETWebTest(unittest.TestCase):
         with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
             self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
 
+    def test_blnet_web_fast_parser(self):
+        """Test reading values with the fast parser backend"""
+        with BLNETWeb(
+            self.url, password=PASSWORD, timeout=10, parser=PARSER_FAST
+        ) as blnet:
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+            self.assertEqual(blnet.read_digital_values(), STATE_DIGITAL)
+
+    def test_blnet_web_stream(self):
+        """Test that value pages are only read up to the data block"""
+        blnet = BLNETWeb(self.url, password=PASSWORD, timeout=10, parser=PARSER_FAST)
+        with blnet as blnet:
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+            saved = blnet.last_bytes_saved
+            self.assertGreater(saved, 0)
+            self.assertEqual(blnet.read_digital_values(), STATE_DIGITAL)
+            saved += blnet.last_bytes_saved
+        self.assertEqual(blnet.connection_stats()["bytes_saved"], saved)
+        blnet.read_to_end = True
+        with blnet as blnet:
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+            self.assertEqual(blnet.last_bytes_saved, 0)
+
+    def test_blnet_web_unchanged(self):
+        """Test that unchanged pages are detected"""
+        with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            values = blnet.read_analog_values()
+            self.assertTrue(values.changed)
+            values[0]["value"] = "0.0"
+            values = blnet.read_analog_values()
+            self.assertFalse(values.changed)
+            self.assertEqual(values, STATE_ANALOG)
+            self.server.set_alternative()
+            values = blnet.read_analog_values()
+            self.assertTrue(values.changed)
+            self.assertNotEqual(values, STATE_ANALOG)
+            self.assertFalse(blnet.read_analog_values().changed)
+            self.assertTrue(blnet.read_digital_values().changed)
+
+    def test_blnet_web_metadata(self):
+        """Test that names and units are cached until invalidated"""
+        with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+            channels = blnet.metadata.channels(None, "/580500.htm")
+            self.assertEqual(len(channels), len(STATE_ANALOG))
+            channels["1"] = ("TKollektor.renamed", "°C")
+            self.server.set_alternative()
+            values = blnet.read_analog_values()
+            self.assertTrue(values.changed)
+            self.assertEqual(values[0]["name"], "TKollektor.renamed")
+            self.assertEqual(values[0]["value"], "-0.1")
+            blnet.metadata.invalidate()
+            self.server.set_alternative(False)
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+
+    def test_blnet_web_states(self):
+        """Test reading only the values of the channels"""
+        with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            analog = blnet.read_analog_states()
+            self.assertEqual(
+                analog, {value["id"]: value["value"] for value in STATE_ANALOG}
+            )
+            self.assertEqual(
+                len(blnet.metadata.channels(None, "/580500.htm")), len(analog)
+            )
+            self.assertEqual(blnet.read_analog_states(), analog)
+            self.assertEqual(
+                blnet.read_digital_states(),
+                {
+                    value["id"]: (value["mode"], value["value"])
+                    for value in STATE_DIGITAL
+                },
+            )
+
+    def test_blnet_web_sensors(self):
+        """Test updating the dicts of the channels in place"""
+        with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            analog = blnet.read_analog_sensors()
+            self.assertEqual(
+                analog, {int(value["id"]): value for value in STATE_ANALOG}
+            )
+            self.assertEqual(
+                blnet.read_digital_sensors(),
+                {int(value["id"]): value for value in STATE_DIGITAL},
+            )
+            self.server.set_alternative()
+            channels = blnet.metadata.channels(None, "/580500.htm")
+            channels["1"] = ("TKollektor.renamed", "°C")
+            sensors = blnet.read_analog_sensors()
+            self.assertIs(sensors[1], analog[1])
+            self.assertEqual(
+                analog[1],
+                {
+                    "id": "1",
+                    "name": "TKollektor.renamed",
+                    "value": "-0.1",
+                    "unit_of_measurement": "°C",
+                },
+            )
+            del channels["1"]
+            self.server.set_alternative(False)
+            self.assertEqual(
+                blnet.read_analog_sensors(),
+                {int(value["id"]): value for value in STATE_ANALOG},
+            )
+
     def test_blnet_web_digital(self):
         """Test reading digital values"""
         with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
@@ -200,5 +566,51 @@ class BLNETWebTest(unittest.TestCase):
         pass
 
 
+class BLNETWebKeepAliveTest(BLNETWebTest):
+    """
+    Run all web tests against a BLNET that keeps connections alive
+    """
+
+    server_class = ThreadingBLNETServer
+    handler_class = BLNETKeepAliveRequestHandler
+
+    def test_blnet_web_connection_reuse(self):
+        """Test that requests of one session share a pooled connection"""
+        blnet = BLNETWeb(
+            self.url,
+            password=PASSWORD,
+            timeout=10,
+            parser=PARSER_FAST,
+            read_to_end=True,
+        )
+        with blnet as blnet:
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+            self.assertEqual(blnet.read_digital_values(), STATE_DIGITAL)
+        stats = blnet.connection_stats()
+        blnet.close()
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["reused"], stats["requests"] - 1)
+
+    def test_blnet_web_reconnect(self):
+        """Test resending reading requests whose connection was dropped"""
+        with BLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            self.server.drop_requests = 1
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+            self.assertEqual(blnet.connection_stats()["connections"], 2)
+            # requests changing values are not sent twice
+            self.assertTrue(blnet.set_digital_value(5, "AUS"))
+            self.server.drop_requests = 1
+            self.assertFalse(blnet.set_digital_value(5, "EIN"))
+            self.assertEqual(self.server.get_node("5"), "1")
+            self.assertTrue(blnet.set_digital_value(5, "EIN"))
+            self.assertEqual(self.server.get_node("5"), "2")
+        with BLNETWeb(
+            self.url, password=PASSWORD, timeout=10, reconnect_retries=0
+        ) as blnet:
+            self.server.drop_requests = 1
+            self.assertIsNone(blnet.read_analog_values())
+            self.assertEqual(blnet.read_analog_values(), STATE_ANALOG)
+
+
 if __name__ == "__main__":
     unittest.main()
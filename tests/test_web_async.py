@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# general requirements
+import unittest
+from tests.test_structure.server_control import Server
+from tests.test_structure.blnet_mock_server import (
+    BLNETRequestHandler,
+    ThreadingBLNETServer,
+    PASSWORD,
+)
+
+# For the server in this case
+import asyncio
+import socket
+import time
+
+# For the tests
+from pyblnet import AsyncBLNETWeb
+from pyblnet.blnet_web import PARSER_FAST
+from tests.web_raw.web_state import STATE_ANALOG, STATE_DIGITAL
+
+ADDRESS = "localhost"
+DEVICES = 8
+# Delay of every response of the slow BLNETs
+DELAY = 0.2
+
+
+class SlowBLNETRequestHandler(BLNETRequestHandler):
+    """
+    Request handler that answers every request after a delay
+    """
+
+    def handle_one_request(self):
+        time.sleep(DELAY)
+        super().handle_one_request()
+
+
+class ChunkedBLNETRequestHandler(BLNETRequestHandler):
+    """
+    Request handler that sends the pages with chunked transfer encoding
+    """
+
+    protocol_version = "HTTP/1.1"
+    chunk_size = 100
+
+    def send_response(self, code, message=None):
+        self.status = code
+        super().send_response(code, message)
+
+    def send_header(self, keyword, value):
+        if keyword == "Content-Length" and self.status == 200:
+            keyword, value = "Transfer-Encoding", "chunked"
+        super().send_header(keyword, value)
+
+    def copyfile(self, source, outputfile):
+        while True:
+            chunk = source.read(self.chunk_size)
+            outputfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+            if not chunk:
+                break
+
+
+class AsyncBLNETWebTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.servers = []
+        self.url = self.start_server(BLNETRequestHandler)
+
+    def start_server(self, handler):
+        server = ThreadingBLNETServer((ADDRESS, 0), handler)
+        server.set_password(PASSWORD)
+        control = Server(server)
+        control.start_server()
+        self.servers.append(control)
+        return "http://{}:{}".format(ADDRESS, control.get_port())
+
+    def tearDown(self):
+        for control in self.servers:
+            control.stop_server()
+
+    async def test_async_log_in(self):
+        """Test logging in and out"""
+        blnet = AsyncBLNETWeb(self.url, password=PASSWORD, timeout=10)
+        self.assertFalse(await blnet.logged_in())
+        async with blnet as blnet:
+            self.assertTrue(await blnet.logged_in())
+        self.assertFalse(await blnet.logged_in())
+
+    async def test_async_read_values(self):
+        """Test reading analog and digital values"""
+        async with AsyncBLNETWeb(
+            self.url, password=PASSWORD, timeout=10, parser=PARSER_FAST
+        ) as blnet:
+            self.assertEqual(await blnet.read_analog_values(), STATE_ANALOG)
+            self.assertEqual(await blnet.read_digital_values(), STATE_DIGITAL)
+
+    async def test_async_chunked(self):
+        """Test reading pages sent with chunked transfer encoding"""
+        url = self.start_server(ChunkedBLNETRequestHandler)
+        async with AsyncBLNETWeb(url, password=PASSWORD, timeout=10) as blnet:
+            self.assertEqual(await blnet.read_analog_values(), STATE_ANALOG)
+            self.assertEqual(await blnet.read_digital_values(), STATE_DIGITAL)
+
+    async def test_async_set_digital(self):
+        """Test setting digital values"""
+        async with AsyncBLNETWeb(self.url, password=PASSWORD, timeout=10) as blnet:
+            self.assertTrue(await blnet.set_digital_value(10, "EIN"))
+            self.assertTrue(await blnet.set_digital_value(8, "auto"))
+            with self.assertRaises(ValueError):
+                await blnet.set_digital_value(16, "EIN")
+        self.assertEqual(self.servers[0]._server.get_node("A"), "2")
+        self.assertEqual(self.servers[0]._server.get_node("8"), "3")
+
+    async def test_async_concurrent_devices(self):
+        """Test polling many BLNETs concurrently on one event loop"""
+
+        async def poll(url):
+            async with AsyncBLNETWeb(url, password=PASSWORD, timeout=10) as blnet:
+                return (
+                    await blnet.read_analog_values(),
+                    await blnet.read_digital_values(),
+                )
+
+        urls = [self.start_server(SlowBLNETRequestHandler) for _ in range(DEVICES)]
+        start = time.monotonic()
+        results = await asyncio.gather(*(poll(url) for url in urls))
+        elapsed = time.monotonic() - start
+        for result in results:
+            self.assertEqual(result, (STATE_ANALOG, STATE_DIGITAL))
+        # log in, two reads and log out per device, polled one after another
+        # this would take at least 4 * DELAY * DEVICES
+        self.assertLess(elapsed, 4 * DELAY * DEVICES / 2)
+
+    async def test_async_timeout(self):
+        """Test that a BLNET that does not answer runs into the per call timeout"""
+        with socket.socket() as silent:
+            silent.bind((ADDRESS, 0))
+            silent.listen()
+            blnet = AsyncBLNETWeb(
+                "{}:{}".format(ADDRESS, silent.getsockname()[1]),
+                password=PASSWORD,
+                timeout=10,
+            )
+            start = time.monotonic()
+            self.assertIsNone(await blnet.read_analog_values(timeout=0.2))
+            self.assertLess(time.monotonic() - start, 5)
+
+    async def test_async_cancel(self):
+        """Test cancelling a pending request"""
+        url = self.start_server(SlowBLNETRequestHandler)
+        blnet = AsyncBLNETWeb(url, password=PASSWORD, timeout=10)
+        task = asyncio.ensure_future(blnet.log_in())
+        await asyncio.sleep(DELAY / 4)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+
+
+if __name__ == "__main__":
+    unittest.main()